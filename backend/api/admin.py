@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import ContractTemplate, Contract, CropListingTemplate, Dispute, Notifications, EsignResponse, TenderApplication, TransportationTender
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from .models import ContractTemplate, Contract, CropListingTemplate, Dispute, Notifications, EsignResponse, TenderApplication, TransportationTender, EmailOutbox, RequestProfile
 
 @admin.register(ContractTemplate)
 class ContractTemplateAdmin(admin.ModelAdmin):
@@ -44,3 +50,52 @@ class TenderApplicationAdmin(admin.ModelAdmin):
 class TransportationTenderAdmin(admin.ModelAdmin):
     list_display = ('tender_name', 'created_at')
     search_fields = ('tender_name',)
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    search_fields = ('subject',)
+    list_filter = ('status',)
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        queryset.update(status="pending", attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, "Selected emails queued for delivery.")
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'query_ms', 'samples', 'user')
+    search_fields = ('path', 'view_name')
+    list_filter = ('method', 'status_code')
+    ordering = ('-created_at',)
+    fields = ('created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'samples', 'stacks_link', 'query_count', 'query_ms', 'slowest_queries')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/stacks/', self.admin_site.admin_view(self.download_stacks), name='api_requestprofile_stacks'),
+        ]
+        return urls + super().get_urls()
+
+    def download_stacks(self, request, pk):
+        # The stacks live in private storage, so they are served from here.
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        return FileResponse(profile.stacks.open('rb'), as_attachment=True, filename=f'profile-{pk}.collapsed')
+
+    @admin.display(description='Collapsed stacks')
+    def stacks_link(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:api_requestprofile_stacks', args=[obj.pk]), f'profile-{obj.pk}.collapsed')
+
+    @admin.display(description='Slowest queries')
+    def slowest_queries(self, obj):
+        queries = sorted(obj.queries, key=lambda query: query['ms'], reverse=True)[:20]
+        rows = format_html_join('', '<tr><td>{}</td><td><code>{}</code></td></tr>', ((query['ms'], query['sql']) for query in queries))
+        return format_html('<table><tr><th>ms</th><th>SQL</th></tr>{}</table>', rows)
@@ -0,0 +1,252 @@
+"""
+Near-duplicate answer cache in front of the chatbot.
+
+Farmers ask the same handful of questions in many spellings. A query is
+first looked up by its normalised form (case, punctuation, filler words and
+common transliteration variants folded away), then by cosine similarity of
+its TF-IDF vector against the cached queries. Question words and negations
+are never folded away, and a near match must use the same ones, so "when do
+I get paid" does not get the answer to "how do I get paid". Entries are
+evicted LRU and expire after ``ttl`` seconds, and the whole cache is dropped
+whenever the retrieval index is rebuilt from a different ``ml_data/data.txt``.
+
+``cached_answer`` is the lookup-or-answer entry point; it runs on the
+inference pool, since vectorising a query is CPU work. With a process pool
+each worker process keeps its own cache.
+
+Configured through ``settings.CHAT_ANSWER_CACHE``::
+
+    CHAT_ANSWER_CACHE = {"MAX_ENTRIES": 1024, "TTL": 3600, "SIMILARITY": 0.9}
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from django.conf import settings
+from scipy import sparse
+
+from .retrieval import FALLBACK_ANSWER, get_index
+
+DEFAULTS = {
+    "MAX_ENTRIES": 1024,
+    "TTL": 3600,
+    "SIMILARITY": 0.9,
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Filler that does not change what is being asked.
+STOP_WORDS = frozenset("""
+    a an the is are am was were be been do does did i me my we our us you your
+    to of for in on at by with it its this that these those there please
+    kindly sir madam hi hello ji
+""".split())
+
+# Words that do change the question; kept in the key, and required to match
+# for a near-duplicate hit.
+GUARD_WORDS = frozenset("""
+    what when where which who whom whose why how
+    not no never cannot cant nor without don doesn didn isn aren wasn won
+""".split())
+
+# Matrix rows of replaced or evicted entries tolerated before a rebuild,
+# and new rows kept aside before they are folded into the matrix.
+MAX_STALE_ROWS = 256
+MAX_PENDING_ROWS = 64
+
+# Spelling variants that come from writing Hindi words in Latin script,
+# e.g. "aadhaar" / "aadhar" / "adhar" or "kisaan" / "kisan".
+TRANSLITERATION_RULES = (
+    ("ee", "i"),
+    ("oo", "u"),
+    ("ph", "f"),
+    ("ck", "k"),
+    ("q", "k"),
+    ("w", "v"),
+    ("z", "j"),
+)
+REPEATED_RE = re.compile(r"(.)\1+")
+
+
+def fold_token(token):
+    for source, target in TRANSLITERATION_RULES:
+        token = token.replace(source, target)
+    return REPEATED_RE.sub(r"\1", token)
+
+
+def normalize(text):
+    """Return the order-insensitive cache key for ``text``."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    tokens = {
+        token if token in GUARD_WORDS else fold_token(token)
+        for token in TOKEN_RE.findall(text) if token not in STOP_WORDS
+    }
+    return " ".join(sorted(tokens))
+
+
+def guard_words(key):
+    return frozenset(token for token in key.split() if token in GUARD_WORDS)
+
+
+class _Entry:
+    __slots__ = ("answer", "vector", "expires", "guard")
+
+    def __init__(self, answer, vector, expires, guard):
+        self.answer = answer
+        self.vector = vector
+        self.expires = expires
+        self.guard = guard
+
+
+class AnswerCache:
+
+    def __init__(self, max_entries=1024, ttl=3600, similarity=0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.version = None
+        self._entries = OrderedDict()
+        # Rows of cached query vectors, for near-duplicate lookups. New
+        # entries wait in _pending and are folded in MAX_PENDING_ROWS at a
+        # time; rows of replaced or evicted entries are dropped on rebuild.
+        self._matrix = None
+        self._matrix_keys = []
+        self._pending = []
+        self._stale = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {**self.counters, "size": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+        self._pending = []
+        self._stale = 0
+        self.counters["invalidations"] += 1
+
+    def _check_version(self, index):
+        if self.version != index.version:
+            if self._entries:
+                self._clear()
+            self.version = index.version
+
+    def _rebuild(self, now):
+        live = [(key, entry) for key, entry in self._entries.items() if entry.expires > now and entry.vector.nnz]
+        self._matrix_keys = [key for key, _ in live]
+        self._matrix = sparse.vstack([entry.vector for _, entry in live]).tocsr() if live else None
+        self._pending = []
+        self._stale = 0
+
+    def _add_row(self, key, vector, now):
+        if not vector.nnz:
+            return
+        self._pending.append((key, vector))
+        if self._stale > MAX_STALE_ROWS:
+            self._rebuild(now)
+        elif len(self._pending) >= MAX_PENDING_ROWS:
+            rows = ([self._matrix] if self._matrix is not None else []) + [v for _, v in self._pending]
+            self._matrix = sparse.vstack(rows).tocsr()
+            self._matrix_keys += [k for k, _ in self._pending]
+            self._pending = []
+
+    def _similar(self, vector, guard, now):
+        keys, scores = [], []
+        if self._matrix is not None:
+            keys += self._matrix_keys
+            scores.append((self._matrix @ vector.T).toarray().ravel())
+        if self._pending:
+            keys += [key for key, _ in self._pending]
+            scores.append((sparse.vstack([v for _, v in self._pending]) @ vector.T).toarray().ravel())
+        if not keys:
+            return None
+        scores = np.concatenate(scores)
+        for i in np.argsort(-scores):
+            if scores[i] < self.similarity:
+                return None
+            entry = self._entries.get(keys[i])
+            if entry is not None and entry.expires > now and entry.guard == guard:
+                return entry
+        return None
+
+    def get(self, query, index):
+        """Return the cached answer for ``query`` or ``None`` on a miss."""
+        key = normalize(query)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(index)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry.answer
+            if self._entries:
+                entry = self._similar(index.vectorize(query), guard_words(key), now)
+                if entry is not None:
+                    self.counters["near_hits"] += 1
+                    return entry.answer
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, query, index, answer):
+        key = normalize(query)
+        vector = index.vectorize(query)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(index)
+            if key in self._entries:
+                self._stale += 1
+            self._entries[key] = _Entry(answer, vector, now + self.ttl, guard_words(key))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stale += 1
+                self.counters["evictions"] += 1
+            self._add_row(key, vector, now)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, built from settings on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = {**DEFAULTS, **getattr(settings, "CHAT_ANSWER_CACHE", {})}
+                _cache = AnswerCache(
+                    max_entries=config["MAX_ENTRIES"],
+                    ttl=config["TTL"],
+                    similarity=config["SIMILARITY"],
+                )
+    return _cache
+
+
+def cached_answer(message):
+    """Answer ``message`` from the cache, or from the index and remember it."""
+    index = get_index()
+    cache = get_answer_cache()
+    answer = cache.get(message, index)
+    if answer is None:
+        answer = index.answer(message)
+        # The fallback is not an answer; caching it would repeat it for the
+        # whole TTL, and for near-duplicate questions too.
+        if answer != FALLBACK_ANSWER:
+            cache.set(message, index, answer)
+    return answer
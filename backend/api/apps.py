@@ -7,3 +7,6 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+        from api.schema import preload_schema
+
+        preload_schema()
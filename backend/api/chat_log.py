@@ -0,0 +1,154 @@
+"""
+Write-behind buffer for chat ``Message`` rows.
+
+Saving every chat turn on its own costs one database round trip per message.
+``MessageBuffer`` collects the user and AI messages of every socket in the
+process and writes them with a single ``bulk_create`` once ``max_size`` rows
+are waiting or ``flush_interval`` seconds have passed. Sockets drain it on
+disconnect and the process drains it at exit, so a closed socket never loses
+its history.
+
+A failed write keeps the rows and retries them on a timer, backing off from
+``flush_interval`` up to ``max_retry_interval`` seconds while the database
+stays down. At most ``max_pending`` rows are held; past that the oldest are
+dropped (and counted) so an outage cannot grow the buffer without bound.
+
+Configured through ``settings.CHAT_MESSAGE_BUFFER``::
+
+    CHAT_MESSAGE_BUFFER = {"MAX_SIZE": 50, "FLUSH_INTERVAL": 2.0, "MAX_PENDING": 5000, "MAX_RETRY_INTERVAL": 60.0}
+"""
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_SIZE": 50,
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_PENDING": 5000,
+    "MAX_RETRY_INTERVAL": 60.0,
+}
+
+
+class MessageBuffer:
+
+    def __init__(self, max_size=50, flush_interval=2.0, max_pending=5000, max_retry_interval=60.0):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retry_interval = max_retry_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = None
+        self._timer = None
+        self._failures = 0
+        self.counters = {"buffered": 0, "flushed": 0, "batches": 0, "errors": 0, "dropped": 0}
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, user, sent_by, message):
+        with self._lock:
+            self._pending.append(Message(user_id=user.pk, sent_by=sent_by, message=message))
+            self.counters["buffered"] += 1
+            self._trim()
+            size = len(self._pending)
+        # While writes are failing, leave the next attempt to the retry timer.
+        if size >= self.max_size and not self._failures:
+            await self.flush()
+        else:
+            self._schedule(self.flush_interval)
+
+    def _schedule(self, delay):
+        timer = self._timer
+        if timer is None or timer.done() or timer is asyncio.current_task():
+            self._timer = asyncio.ensure_future(self._flush_later(delay))
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _restore(self, batch):
+        # Failed rows go back in front of anything buffered since, keeping order.
+        with self._lock:
+            self._pending = batch + self._pending
+            self._trim()
+
+    def _trim(self):
+        # Called with the lock held.
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.counters["dropped"] += overflow
+            logger.warning("Chat message buffer is full; dropped the %d oldest messages", overflow)
+
+    def _write(self, batch):
+        try:
+            Message.objects.bulk_create(batch, batch_size=self.max_size)
+        except Exception:
+            self.counters["errors"] += 1
+            self._restore(batch)
+            raise
+        self.counters["flushed"] += len(batch)
+        self.counters["batches"] += 1
+
+    async def flush(self):
+        """Write every buffered message. Safe to call from any socket at any time."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            try:
+                await database_sync_to_async(self._write)(batch)
+            except Exception:
+                self._failures += 1
+                delay = min(self.flush_interval * 2 ** (self._failures - 1), self.max_retry_interval)
+                logger.exception("Failed to flush %d chat messages; retrying in %.1fs", len(batch), delay)
+                self._schedule(delay)
+                return 0
+            self._failures = 0
+            return len(batch)
+
+    def flush_sync(self):
+        """Blocking flush for process shutdown, when no event loop is running."""
+        batch = self._take()
+        if batch:
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Dropping %d chat messages at shutdown", len(batch))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_message_buffer():
+    """Return the process-wide message buffer, built from settings on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = {**DEFAULTS, **getattr(settings, "CHAT_MESSAGE_BUFFER", {})}
+                _buffer = MessageBuffer(
+                    max_size=config["MAX_SIZE"],
+                    flush_interval=config["FLUSH_INTERVAL"],
+                    max_pending=config["MAX_PENDING"],
+                    max_retry_interval=config["MAX_RETRY_INTERVAL"],
+                )
+                atexit.register(_buffer.flush_sync)
+    return _buffer
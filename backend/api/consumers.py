@@ -1,8 +1,44 @@
+import asyncio
 import json
+import logging
+from contextlib import aclosing
+from functools import partial
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 import aiohttp
-# from .rag_model import rag_model
+from .answer_cache import cached_answer
+from .chat_log import get_message_buffer
+from .inference import PoolBusy, get_pool
+from .metrics import current_stats, track
+from .notifications import notification_group, notifications_since
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "We are answering a lot of questions right now. Please try again in a few seconds."
+STREAM_ERROR_MESSAGE = "Something went wrong while answering. Please try again."
+
+# Streaming replies are sent as {"delta": ..., "seq": n, "stream": id} frames
+# and closed with {"done": true, "seq": n, "stream": id}. The client
+# acknowledges frames with {"ack": n, "stream": id}; once WINDOW frames are
+# unacknowledged the server stops sending, and gives the reply up if no ack
+# arrives within ACK_TIMEOUT seconds. Acks that are not numbers, that are for
+# frames not sent yet, or whose stream id is not the current one are ignored.
+# A reply that fails is logged and ends with {"error": ..., "stream": id}.
+#
+# The retrieval index produces the whole answer at once, so this is chunked
+# delivery with flow control for slow links, not earlier first bytes; the
+# first delta goes out once the full answer is ready.
+STREAM_DEFAULTS = {
+    "CHUNK_WORDS": 3,
+    "WINDOW": 8,
+    "ACK_TIMEOUT": 15,
+}
+
+
+def stream_setting(name):
+    return getattr(settings, "CHAT_STREAM", {}).get(name, STREAM_DEFAULTS[name])
 
 class ChatConsumer(AsyncWebsocketConsumer):
 
@@ -11,6 +47,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         # Check if the user is authenticated
         if user.is_authenticated:
+            self.stream_task = None
+            self.stream_id = 0
+            self.acked = 0
+            self.sent_seq = 0
+            self.ack_event = asyncio.Event()
             await self.accept()
             await self.send(text_data=json.dumps({
                 'message': f'Welcome {user.first_name} {user.last_name}!'
@@ -19,21 +60,188 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
 
     async def disconnect(self, close_code):
-        # Perform cleanup if needed
-        pass
+        await self.cancel_stream()
+        # Make sure this socket's conversation is written before it goes away.
+        await get_message_buffer().flush()
 
     async def get_response(self, message):
-        return "Welcome"
+        # Cache lookup, vectorising and answering all run off the event loop.
+        try:
+            return await get_pool().run(cached_answer, message)
+        except (PoolBusy, asyncio.TimeoutError):
+            return BUSY_MESSAGE
+
+    async def stream_response(self, message):
+        """Yield the complete reply to ``message`` a few words at a time."""
+        response = await self.get_response(message)
+        words = response.split(" ")
+        size = stream_setting("CHUNK_WORDS")
+        for start in range(0, len(words), size):
+            chunk = " ".join(words[start:start + size])
+            yield chunk if start + size >= len(words) else chunk + " "
+
+    async def stream(self, user, message, stream_id):
+        window = stream_setting("WINDOW")
+        timeout = stream_setting("ACK_TIMEOUT")
+        self.acked = self.sent_seq = 0
+        seq = 0
+        sent = []
+        with track("ws", "chat", "stream_reply"):
+            try:
+                async with aclosing(self.stream_response(message)) as deltas:
+                    async for delta in deltas:
+                        while seq - self.acked >= window:
+                            self.ack_event.clear()
+                            await asyncio.wait_for(self.ack_event.wait(), timeout)
+                        seq += 1
+                        self.sent_seq = seq
+                        sent.append(delta)
+                        await self.send(text_data=json.dumps({'delta': delta, 'seq': seq, 'stream': stream_id}))
+                await self.send(text_data=json.dumps({'done': True, 'seq': seq, 'stream': stream_id}))
+            except asyncio.TimeoutError:
+                # The client stopped reading; drop the rest of the reply.
+                pass
+            finally:
+                if sent:
+                    await get_message_buffer().add(user, "ai", "".join(sent))
+
+    def stream_done(self, stream_id, task):
+        # Reads the task's exception, so a failed reply is never silent.
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("Chat stream %d failed", stream_id, exc_info=task.exception())
+        asyncio.ensure_future(self.send_stream_error(stream_id))
+
+    async def send_stream_error(self, stream_id):
+        try:
+            await self.send(text_data=json.dumps({'error': STREAM_ERROR_MESSAGE, 'stream': stream_id}))
+        except Exception:
+            logger.debug("Could not report chat stream %d failure; the socket is gone", stream_id, exc_info=True)
+
+    async def cancel_stream(self):
+        task = getattr(self, "stream_task", None)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.stream_task = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        stats = current_stats()
+        if stats is not None:
+            stats.size += len(text_data or bytes_data or "")
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
 
     async def receive(self, text_data):
-        user = self.scope["user"]
         text_data_json = json.loads(text_data)
+        if 'ack' in text_data_json:
+            event = "ack"
+        elif text_data_json.get('cancel'):
+            event = "cancel"
+        else:
+            event = "stream" if text_data_json.get('stream') else "message"
+        with track("ws", "chat", event):
+            await self.handle(text_data_json)
+
+    def receive_ack(self, text_data_json):
+        ack, stream_id = text_data_json['ack'], text_data_json.get('stream', self.stream_id)
+        if isinstance(ack, bool) or not isinstance(ack, (int, str)) or stream_id != self.stream_id:
+            return
+        try:
+            ack = int(ack)
+        except ValueError:
+            return
+        if 0 < ack <= self.sent_seq:
+            self.acked = max(self.acked, ack)
+            self.ack_event.set()
+
+    async def handle(self, text_data_json):
+        user = self.scope["user"]
+
+        if 'ack' in text_data_json:
+            self.receive_ack(text_data_json)
+            return
+        if text_data_json.get('cancel'):
+            await self.cancel_stream()
+            return
+
         message = text_data_json.get('message', '')
 
         print(f"Received message from {user.email}: {message} length: {len(message)}")
 
+        buffer = get_message_buffer()
+        await buffer.add(user, "user", message)
+
+        if text_data_json.get('stream'):
+            # A new question abandons whatever is still being streamed. The
+            # stream runs as a task so that acks can be received meanwhile.
+            await self.cancel_stream()
+            self.stream_id += 1
+            self.stream_task = asyncio.ensure_future(self.stream(user, message, self.stream_id))
+            self.stream_task.add_done_callback(partial(self.stream_done, self.stream_id))
+            return
+
         response = await self.get_response(message)
+        await buffer.add(user, "ai", response)
 
         await self.send(text_data=json.dumps({
             'message': response
         }))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes a user's new notifications as {"notifications": [...]} frames.
+
+    Notifications arriving within NOTIFICATIONS_COALESCE_WINDOW seconds of
+    each other go out in one frame. A client that reconnects with
+    ``?since=<last id>`` (or sends {"since": <last id>}) first receives
+    everything it missed.
+    """
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = notification_group(user.pk)
+        self.pending = []
+        self.flush_task = None
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        since = query.get("since", [None])[0]
+        if since is not None and since.isdigit():
+            await self.catch_up(int(since))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        since = json.loads(text_data).get("since")
+        if isinstance(since, int):
+            await self.catch_up(since)
+
+    async def catch_up(self, since):
+        missed = await database_sync_to_async(notifications_since)(self.scope["user"].pk, since)
+        if missed:
+            await self.send(text_data=json.dumps({"notifications": missed}))
+
+    async def notification_created(self, event):
+        self.pending.append(event["notification"])
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(getattr(settings, "NOTIFICATIONS_COALESCE_WINDOW", 0.25))
+        pending, self.pending = self.pending, []
+        self.flush_task = None
+        if pending:
+            await self.send(text_data=json.dumps({"notifications": pending}))
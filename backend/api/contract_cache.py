@@ -0,0 +1,111 @@
+"""
+Serialized-response cache for contract detail pages.
+
+Every cached contract is stored together with the version tokens of the
+contract and of its buyer and seller. Saving or deleting the contract, its
+e-sign responses, order or payments replaces the contract's token; saving a
+user or one of their profiles replaces the user's token. A cached response is
+only served while all three tokens still match, so a hit needs one
+``get_many`` on the cache and no ORM queries at all.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from .optimization import EXPAND_PARAM, FIELDS_PARAM
+
+KEY_PREFIX = "contract-detail"
+
+
+def _contract_version_key(contract_id):
+    return f"{KEY_PREFIX}:contract-v:{contract_id}"
+
+
+def _user_version_key(user_id):
+    return f"{KEY_PREFIX}:user-v:{user_id}"
+
+
+def _entry_key(contract_id, host, params):
+    # Sparse fieldsets render different bodies for the same contract.
+    variant = "|".join(params.get(name, "") for name in (FIELDS_PARAM, EXPAND_PARAM))
+    digest = hashlib.md5(variant.encode()).hexdigest()
+    return f"{KEY_PREFIX}:{host}:{contract_id}:{digest}"
+
+
+def _bump(key):
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def bump_contract(contract_id):
+    """Invalidate the cached detail of one contract once the transaction commits."""
+    if contract_id is not None:
+        transaction.on_commit(lambda: _bump(_contract_version_key(contract_id)))
+
+
+def bump_user(user_id):
+    """Invalidate every cached contract the user is a party to once the transaction commits."""
+    if user_id is not None:
+        transaction.on_commit(lambda: _bump(_user_version_key(user_id)))
+
+
+def current_versions(contract_id, buyer_id, seller_id):
+    keys = [_contract_version_key(contract_id), _user_version_key(buyer_id), _user_version_key(seller_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed missing tokens; add() keeps a concurrent writer's value.
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+class CachedContractDetailMixin:
+    """
+    Retrieve-view mixin serving contract details from the version-checked
+    cache, with an ``ETag`` and ``304 Not Modified`` support.
+
+    Cache hits skip ``get_object()``, so ``has_cached_access`` must grant the
+    same access the view's queryset and permissions would.
+    """
+
+    cache_timeout = getattr(settings, "CONTRACT_DETAIL_CACHE_TIMEOUT", 300)
+
+    def has_cached_access(self, request, entry):
+        user = request.user
+        return user.is_staff or user.pk in (entry["buyer_id"], entry["seller_id"])
+
+    def cached_response(self, request, entry):
+        etag = f'"{entry["etag"]}"'
+        # Parses the If-None-Match list (and "*") and compares tags exactly.
+        conditional = get_conditional_response(request, etag=etag)
+        if conditional is not None:
+            return Response(status=conditional.status_code, headers={"ETag": etag})
+        return Response(entry["data"], headers={"ETag": etag})
+
+    def retrieve(self, request, *args, **kwargs):
+        contract_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        key = _entry_key(contract_id, request.get_host(), request.query_params)
+
+        entry = cache.get(key)
+        if entry is not None and self.has_cached_access(request, entry):
+            if entry["versions"] == current_versions(contract_id, entry["buyer_id"], entry["seller_id"]):
+                return self.cached_response(request, entry)
+
+        instance = self.get_object()
+        # Versions are read before serializing, so a write racing with this
+        # request leaves the entry stale-versioned rather than stale-valued.
+        versions = current_versions(instance.pk, instance.buyer_id, instance.seller_id)
+        entry = {
+            "buyer_id": instance.buyer_id,
+            "seller_id": instance.seller_id,
+            "versions": versions,
+            "etag": "-".join(versions),
+            "data": self.get_serializer(instance).data,
+        }
+        cache.set(key, entry, self.cache_timeout)
+        return self.cached_response(request, entry)
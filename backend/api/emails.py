@@ -1,11 +1,50 @@
-from django.core.mail import send_mail
+import logging
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Emails are written to the EmailOutbox table in the caller's transaction and
+# delivered by `python manage.py send_outbox_emails`, so no request or signal
+# ever waits on SMTP. Tuned through settings.EMAIL_OUTBOX.
+OUTBOX_DEFAULTS = {
+    "BATCH_SIZE": 100,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF": 60,
+    "MAX_BACKOFF": 6 * 60 * 60,
+    # How long a claimed batch is reserved before another worker may take
+    # it over (the claiming worker is assumed dead).
+    "LEASE": 5 * 60,
+}
+
+
+def outbox_setting(name):
+    return getattr(settings, "EMAIL_OUTBOX", {}).get(name, OUTBOX_DEFAULTS[name])
+
+
+def queue_email(subject, message, from_email, recipient_list, html_message=None):
+    """Drop-in replacement for ``send_mail`` that only writes an outbox row."""
+    return EmailOutbox.objects.create(
+        subject=subject,
+        from_email=from_email,
+        to=list(recipient_list),
+        body=message,
+        html_body=html_message,
+    )
+
 
 def send_notification_email(user, notification):
     subject = f"{notification['title']} - Fasal Mitra"
     from_email = settings.DEFAULT_FROM_EMAIL
-    
+
     # Handle both user objects and email strings
     to_email = [user.email if hasattr(user, 'email') else user]
 
@@ -15,7 +54,7 @@ def send_notification_email(user, notification):
     }
 
     message = render_to_string('notification_email.html', context)
-    send_mail(subject, message, from_email, to_email, html_message=message)
+    queue_email(subject, message, from_email, to_email, html_message=message)
 
 def send_welcome_email(user):
     subject = "Welcome to Fasal Mitra"
@@ -27,5 +66,93 @@ def send_welcome_email(user):
     }
 
     message = render_to_string('welcome_email.html', context)
-    send_mail(subject, message, from_email, to_email, html_message=message)
+    queue_email(subject, message, from_email, to_email, html_message=message)
+
+
+def _build_message(row, connection):
+    message = EmailMultiAlternatives(row.subject, row.body, row.from_email, row.to, connection=connection)
+    if row.html_body:
+        message.attach_alternative(row.html_body, "text/html")
+    return message
+
+
+def _schedule_retry(row, error, now):
+    row.last_error = str(error)
+    if row.attempts >= outbox_setting("MAX_ATTEMPTS"):
+        row.status = "dead"
+        logger.error("Email %s dead-lettered after %d attempts: %s", row.pk, row.attempts, error)
+    else:
+        row.status = "pending"
+        delay = min(outbox_setting("BACKOFF") * 2 ** (row.attempts - 1), outbox_setting("MAX_BACKOFF"))
+        row.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def _due(now):
+    return EmailOutbox.objects.filter(status__in=["pending", "sending"], next_attempt_at__lte=now)
+
+
+def outbox_due(now=None):
+    """True while some email is waiting to be claimed."""
+    return _due(now or timezone.now()).exists()
+
+
+def claim_outbox(batch_size, now):
+    """
+    Reserve a batch of due emails, plus any whose lease ran out, by moving
+    them to ``sending`` in a short transaction. Each claim counts as an
+    attempt.
+    """
+    with transaction.atomic():
+        rows = list(
+            _due(now).select_for_update(skip_locked=True).order_by("id")[:batch_size]
+        )
+        if rows:
+            lease_until = now + timedelta(seconds=outbox_setting("LEASE"))
+            EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                status="sending", next_attempt_at=lease_until, attempts=F("attempts") + 1,
+            )
+            for row in rows:
+                row.status, row.next_attempt_at, row.attempts = "sending", lease_until, row.attempts + 1
+    return rows
+
+
+def deliver_outbox(batch_size=None):
+    """
+    Send one batch of due outbox emails over a single SMTP connection.
+
+    The batch is claimed first and sent outside any transaction, and each
+    email's outcome is written as soon as it is known, so a worker dying
+    mid-batch resends at most the email it was on once the lease expires.
+    Failed emails are retried with exponential backoff and marked ``dead``
+    after ``MAX_ATTEMPTS``. Returns the number of emails sent.
+    """
+    now = timezone.now()
+    rows = claim_outbox(batch_size or outbox_setting("BATCH_SIZE"), now)
+    if not rows:
+        return 0
 
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for row in rows:
+            _schedule_retry(row, error, now)
+        EmailOutbox.objects.bulk_update(rows, ["status", "last_error", "next_attempt_at"])
+        return 0
+    try:
+        for row in rows:
+            # One message per call keeps a bad address from failing,
+            # and later resending, the rest of the batch.
+            try:
+                connection.send_messages([_build_message(row, connection)])
+            except Exception as error:
+                _schedule_retry(row, error, now)
+            else:
+                row.status = "sent"
+                row.sent_at = timezone.now()
+                sent += 1
+            row.save(update_fields=["status", "last_error", "next_attempt_at", "sent_at"])
+    finally:
+        connection.close()
+    return sent
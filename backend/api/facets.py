@@ -0,0 +1,248 @@
+"""
+Filters and facet counts for the contract-template marketplace.
+
+``ContractTemplateFacet`` holds one row per ``(approved, facet, value)`` with
+the number of templates in it. Signals adjust the affected rows with one
+``F()`` update whenever a template is saved or deleted, or a crop changes
+season, so the unfiltered (or approval-only) facet counts are one small query.
+Requests with further filters fall back to grouping the filtered rows.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import ContractTemplate, ContractTemplateFacet, CropListingTemplate
+
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 50000, 100000)
+QUINTAL_BUCKETS = (0, 10, 50, 100, 500, 1000)
+
+# Pseudo-facet counting every template; read back as the "approved" facet.
+TOTAL = "total"
+
+
+def bucket_labels(edges):
+    return [f"{low}-{high}" for low, high in zip(edges, edges[1:])] + [f"{edges[-1]}+"]
+
+
+def bucket(value, edges):
+    """Label of the bucket ``value`` falls in, or None below the first edge."""
+    label = None
+    for edge, edge_label in zip(edges, bucket_labels(edges)):
+        if value is not None and value >= edge:
+            label = edge_label
+    return label
+
+
+def _bucket_expression(field, edges):
+    whens = [When(**{f"{field}__gte": edge}, then=Value(label)) for edge, label in zip(edges, bucket_labels(edges))]
+    return Case(*reversed(whens), default=Value(None), output_field=CharField())
+
+
+# facet name -> expression grouping the templates by that facet
+FACETS = {
+    "crop": F("crop_id"),
+    "crop_type": F("crop__crop_type"),
+    "price": _bucket_expression("price", PRICE_BUCKETS),
+    "quintal": _bucket_expression("total_quintal_required", QUINTAL_BUCKETS),
+}
+
+
+def facet_values(crop_id, crop_type, price, quintal):
+    return {
+        TOTAL: "",
+        "crop": str(crop_id) if crop_id is not None else None,
+        "crop_type": crop_type,
+        "price": bucket(price, PRICE_BUCKETS),
+        "quintal": bucket(quintal, QUINTAL_BUCKETS),
+    }
+
+
+def _match(keys):
+    return reduce(or_, (Q(approved=approved, facet=facet, value=value) for approved, facet, value in keys))
+
+
+def apply_deltas(deltas):
+    """
+    Add ``{(approved, facet, value): delta}`` to the facet table in two
+    queries: create any missing rows at zero, then one ``UPDATE`` with a
+    ``CASE`` per row.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ContractTemplateFacet.objects.bulk_create(
+        [ContractTemplateFacet(approved=approved, facet=facet, value=value, count=0) for approved, facet, value in deltas],
+        ignore_conflicts=True,
+    )
+    change = Case(*[When(_match([key]), then=Value(delta)) for key, delta in deltas.items()], default=Value(0))
+    ContractTemplateFacet.objects.filter(_match(deltas)).update(count=F("count") + change)
+
+
+def _crop_types(template, *crop_ids):
+    crop_ids = {pk for pk in crop_ids if pk is not None}
+    crop_types = {}
+    if ContractTemplate.crop.is_cached(template) and template.crop is not None:
+        crop_types[template.crop.pk] = template.crop.crop_type
+    missing = crop_ids - set(crop_types)
+    if missing:
+        crop_types.update(CropListingTemplate.objects.filter(pk__in=missing).values_list("pk", "crop_type"))
+    return crop_types
+
+
+def _state(values, crop_types):
+    return values["approved"], facet_values(
+        values["crop"], crop_types.get(values["crop"]), values["price"], values["total_quintal_required"]
+    )
+
+
+def template_changed(template, created=False, deleted=False):
+    """
+    Move ``template`` between facet rows after a save or delete. Only facets
+    whose value (or whose approval) changed are touched.
+    """
+    names = ContractTemplate.tracked_fields
+    current = {name: template._current_value(name) for name in names}
+    previous = {name: template.previous(name) for name in names}
+    if not created and any(value is None for value in (previous["approved"], previous["price"])):
+        # Never loaded from the database, so the old values are unknown.
+        previous = current
+
+    # The season only needs looking up when the template moves between crops
+    # or approval states; otherwise the crop_type facet cannot change.
+    moved = created or deleted or any(previous[name] != current[name] for name in ("approved", "crop"))
+    crop_types = _crop_types(template, current["crop"], previous["crop"]) if moved else {}
+    old = None if created else _state(previous, crop_types)
+    new = None if deleted else _state(current, crop_types)
+
+    deltas = defaultdict(int)
+    for facet in facet_values(None, None, None, None):
+        before = (old[0], facet, old[1][facet]) if old else None
+        after = (new[0], facet, new[1][facet]) if new else None
+        if before == after:
+            continue
+        if before and before[2] is not None:
+            deltas[before] -= 1
+        if after and after[2] is not None:
+            deltas[after] += 1
+    apply_deltas(deltas)
+
+
+def crop_type_changed(crop):
+    """Move every template of ``crop`` to its new season."""
+    old, new = crop.previous("crop_type"), crop.crop_type
+    if old is None or old == new:
+        return
+    deltas = defaultdict(int)
+    counts = crop.contract_templates.values("approved").annotate(n=Count("pk")).values_list("approved", "n")
+    for approved, n in counts:
+        deltas[(approved, "crop_type", old)] -= n
+        deltas[(approved, "crop_type", new)] += n
+    apply_deltas(deltas)
+
+
+def group_counts(queryset):
+    """``(approved, facet, value, count)`` rows for ``queryset``, one GROUP BY per facet."""
+    rows = [(approved, TOTAL, "", n) for approved, n in queryset.values_list("approved").annotate(n=Count("pk"))]
+    for facet, expression in FACETS.items():
+        grouped = queryset.annotate(facet_value=expression).values_list("approved", "facet_value").annotate(n=Count("pk"))
+        rows.extend((approved, facet, str(value), n) for approved, value, n in grouped if value is not None)
+    return rows
+
+
+@transaction.atomic
+def rebuild_facets():
+    """Recount every facet from scratch."""
+    ContractTemplateFacet.objects.all().delete()
+    ContractTemplateFacet.objects.bulk_create(
+        ContractTemplateFacet(approved=approved, facet=facet, value=value, count=n)
+        for approved, facet, value, n in group_counts(ContractTemplate.objects.all())
+    )
+
+
+def _combine(rows):
+    counts = {name: {} for name in ("approved", *FACETS)}
+    for approved, facet, value, n in rows:
+        if facet == TOTAL:
+            facet, value = "approved", "true" if approved else "false"
+        if n:
+            counts[facet][value] = counts[facet].get(value, 0) + n
+    return counts
+
+
+def facet_counts(filters=None):
+    """
+    ``{facet: {value: count}}`` for the templates matching ``filters``. Read
+    from the maintained table unless filters other than approval are given.
+    """
+    filters = filters or {}
+    if set(filters) <= {"approved"}:
+        rows = ContractTemplateFacet.objects.filter(count__gt=0)
+        if "approved" in filters:
+            rows = rows.filter(approved=filters["approved"])
+        return _combine(rows.values_list("approved", "facet", "value", "count"))
+    return _combine(group_counts(apply_filters(ContractTemplate.objects.all(), filters)))
+
+
+def _decimal(params, name):
+    try:
+        return Decimal(params[name])
+    except InvalidOperation:
+        raise ValidationError({name: "A number is required."})
+
+
+def parse_filters(params):
+    """Validate marketplace filters from query parameters."""
+    filters = {}
+    if params.get("crop"):
+        try:
+            filters["crop"] = [int(pk) for pk in params["crop"].split(",")]
+        except ValueError:
+            raise ValidationError({"crop": "A comma-separated list of crop ids is required."})
+    if params.get("crop_type"):
+        choices = dict(CropListingTemplate.CROP_TYPES)
+        filters["crop_type"] = [value for value in params["crop_type"].split(",") if value in choices]
+    for name in ("min_price", "max_price", "min_quintal", "max_quintal"):
+        if params.get(name):
+            filters[name] = _decimal(params, name)
+    if params.get("approved") in ("true", "false"):
+        filters["approved"] = params["approved"] == "true"
+    return filters
+
+
+LOOKUPS = {
+    "crop": "crop__in",
+    "crop_type": "crop__crop_type__in",
+    "min_price": "price__gte",
+    "max_price": "price__lte",
+    "min_quintal": "total_quintal_required__gte",
+    "max_quintal": "total_quintal_required__lte",
+    "approved": "approved",
+}
+
+
+def apply_filters(queryset, filters):
+    return queryset.filter(**{LOOKUPS[name]: value for name, value in filters.items()})
+
+
+class ContractTemplateFilter(BaseFilterBackend):
+    """Filter backend for ``?crop=``, ``?crop_type=``, price and quantity ranges and ``?approved=``."""
+
+    def filter_queryset(self, request, queryset, view):
+        return apply_filters(queryset, parse_filters(request.query_params))
+
+
+class FacetedListMixin:
+    """List-view mixin adding ``facets`` for the active filters to the response."""
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        data = response.data if isinstance(response.data, dict) else {"results": response.data}
+        data["facets"] = facet_counts(parse_filters(request.query_params))
+        response.data = data
+        return response
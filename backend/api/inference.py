@@ -0,0 +1,142 @@
+"""
+Bounded executor for chat inference.
+
+``ChatConsumer`` runs on the ASGI event loop, so any CPU-bound work done
+there stalls every other socket in the process. ``InferencePool`` moves that
+work onto a thread or process pool, caps how many calls run at once, and
+turns callers away with ``PoolBusy`` once too many are already waiting.
+
+Configured through ``settings.CHAT_EXECUTOR``::
+
+    CHAT_EXECUTOR = {
+        "KIND": "thread",      # or "process"
+        "MAX_WORKERS": 4,      # concurrent inference calls per process
+        "MAX_PENDING": 32,     # running + waiting calls before PoolBusy
+        "TIMEOUT": 10,         # seconds, None to wait forever
+    }
+"""
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+
+DEFAULTS = {
+    "KIND": "thread",
+    "MAX_WORKERS": 4,
+    "MAX_PENDING": 32,
+    "TIMEOUT": 10,
+}
+
+
+class PoolBusy(Exception):
+    """Raised when the pool already has ``max_pending`` calls in flight."""
+
+
+class InferencePool:
+
+    def __init__(self, kind="thread", max_workers=4, max_pending=32, timeout=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.timeout = timeout
+        self._executor = None
+        self._semaphore = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "wait_seconds": 0.0,
+            "run_seconds": 0.0,
+            "max_run_seconds": 0.0,
+        }
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    executor_class = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+                    self._executor = executor_class(max_workers=self.max_workers)
+        return self._executor
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        return {**self.counters, "pending": self._pending, "max_workers": self.max_workers, "max_pending": self.max_pending}
+
+    async def run(self, fn, *args):
+        """
+        Run ``fn(*args)`` on the pool and return its result.
+
+        Raises ``PoolBusy`` without queueing when the pool is saturated and
+        ``asyncio.TimeoutError`` when the call exceeds ``timeout``.
+        """
+        if self._pending >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise PoolBusy()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        self._pending += 1
+        self.counters["submitted"] += 1
+        enqueued = time.perf_counter()
+        try:
+            # The semaphore hands out slots in FIFO order, so a burst of
+            # messages is served fairly instead of piling into the executor.
+            async with self._semaphore:
+                started = time.perf_counter()
+                self.counters["wait_seconds"] += started - enqueued
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await asyncio.wait_for(loop.run_in_executor(self.executor, fn, *args), self.timeout)
+                except asyncio.TimeoutError:
+                    self.counters["timed_out"] += 1
+                    raise
+                except Exception:
+                    self.counters["failed"] += 1
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - started
+                    self.counters["run_seconds"] += elapsed
+                    self.counters["max_run_seconds"] = max(self.counters["max_run_seconds"], elapsed)
+        finally:
+            self._pending -= 1
+        self.counters["completed"] += 1
+        return result
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide chat inference pool, built from settings on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = {**DEFAULTS, **getattr(settings, "CHAT_EXECUTOR", {})}
+                _pool = InferencePool(
+                    kind=config["KIND"],
+                    max_workers=config["MAX_WORKERS"],
+                    max_pending=config["MAX_PENDING"],
+                    timeout=config["TIMEOUT"],
+                )
+                atexit.register(_pool.shutdown, False)
+    return _pool
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.models import Notifications
+from api.pagination import KeysetPagination
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-page latency of keyset and offset pagination on a throwaway set of "
+        "notifications. Everything is rolled back when the benchmark finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per page; the best is reported.")
+
+    def best_of(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    def handle(self, *args, **options):
+        rows, page_size, repeat = options["rows"], options["page_size"], options["repeat"]
+        factory = RequestFactory()
+
+        with transaction.atomic():
+            user = CustomUser.objects.bulk_create([CustomUser(email="pagination-benchmark@example.invalid")])[0]
+            for start in range(0, rows, options["batch_size"]):
+                count = min(options["batch_size"], rows - start)
+                Notifications.objects.bulk_create(
+                    [Notifications(user=user, title="Benchmark", message=str(start + i)) for i in range(count)]
+                )
+            self.stdout.write(f"Inserted {rows} notifications")
+
+            queryset = Notifications.objects.filter(user=user)
+            ordered = queryset.order_by("-created_at", "-pk")
+            paginator = KeysetPagination()
+            pages = sorted({1, 10, 100, 1000, 10_000, rows // page_size // 2, max(rows // page_size - 1, 1)})
+
+            self.stdout.write(f"{'page':>10} {'offset ms':>12} {'keyset ms':>12}")
+            for page in pages:
+                offset = (page - 1) * page_size
+                if offset >= rows:
+                    continue
+                params = {"page_size": page_size}
+                if offset:
+                    params["cursor"] = paginator.encode_cursor(ordered[offset - 1])
+                request = Request(factory.get("/", params))
+
+                offset_ms = self.best_of(repeat, lambda: list(ordered[offset:offset + page_size]))
+                keyset_ms = self.best_of(repeat, lambda: paginator.paginate_queryset(queryset, request))
+                self.stdout.write(f"{page:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+            transaction.set_rollback(True)
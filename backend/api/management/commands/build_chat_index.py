@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.retrieval import build_index, get_index_dir, get_source_path
+
+
+class Command(BaseCommand):
+    help = "Fit the chatbot retrieval index from ml_data/data.txt and write it to disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=None, help="Question/answer file to index.")
+        parser.add_argument("--output", default=None, help="Directory the index is written to.")
+
+    def handle(self, *args, **options):
+        source = options["source"] or get_source_path()
+        output = options["output"] or get_index_dir()
+        index = build_index(source, output)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(index)} pairs from {source} into {output}"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.schema import get_schema_path, reset_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema and write it to disk, to be served from memory by every process."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=None, help="File the schema is written to.")
+
+    def handle(self, *args, **options):
+        output = options["output"] or get_schema_path()
+        schema = write_schema(output)
+        reset_schema()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(schema.get('paths', {}))} paths to {output}"))
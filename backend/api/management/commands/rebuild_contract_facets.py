@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.facets import rebuild_facets
+from api.models import ContractTemplateFacet
+
+
+class Command(BaseCommand):
+    help = "Recount the contract-template facet table from the templates themselves."
+
+    def handle(self, *args, **options):
+        rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {ContractTemplateFacet.objects.count()} facet counts"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.emails import deliver_outbox, outbox_due
+
+
+class Command(BaseCommand):
+    help = "Deliver pending emails from the outbox table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Emails sent per SMTP connection.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling the outbox instead of exiting when it is empty.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep between polls when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            total += deliver_outbox(options["batch_size"])
+            # A batch that only failed or was deferred reschedules its rows,
+            # so keep going while anything else is due.
+            if outbox_due():
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Sent {total} emails"))
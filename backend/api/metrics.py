@@ -0,0 +1,340 @@
+"""
+Request, SQL and websocket metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and labels it with the resolved URL
+name, method and status. A DB execute wrapper, installed on every connection,
+counts the queries and their time for whatever request or websocket event
+is current (tracked in a context variable, so it follows the work into
+``sync_to_async`` threads). ``ChatConsumer`` records its events through
+``track()`` in the same way.
+
+Each thread writes to its own registry, so recording never takes a lock.
+A background thread in every process writes its merged totals to
+``METRICS["DIR"]/metrics-<pid>.json`` every ``FLUSH_INTERVAL`` seconds, off
+the request path; the staff-only ``MetricsView`` sums those files with the
+live totals of the serving process, which gives one view across gunicorn or
+daphne workers. A worker removes its file when it exits; files left behind
+by a worker that died, or not rewritten for ``STALE_AFTER`` seconds (say
+because their PID now belongs to another process), are ignored and removed.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+DEFAULTS = {
+    "DIR": Path(tempfile.gettempdir()) / "fasal-metrics",
+    "FLUSH_INTERVAL": 5,
+    "STALE_AFTER": 60,
+}
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HISTOGRAMS = {
+    "duration_seconds": SECONDS_BUCKETS,
+    "queries": (0, 1, 2, 5, 10, 20, 50, 100),
+    "query_duration_seconds": SECONDS_BUCKETS,
+    "size_bytes": (100, 1000, 10_000, 100_000, 1_000_000),
+}
+HELP = {
+    "requests_total": "Requests (or websocket events) handled.",
+    "duration_seconds": "Time spent handling the request.",
+    "queries": "SQL queries run while handling the request.",
+    "query_duration_seconds": "Time spent in SQL while handling the request.",
+    "size_bytes": "Size of the response body (or websocket frame).",
+}
+
+
+def metrics_setting(name):
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+class RequestStats:
+    __slots__ = ("endpoint", "method", "status", "queries", "query_seconds", "size")
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = "ok"
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.size = 0
+
+
+_current = ContextVar("metrics_request", default=None)
+
+
+def current_stats():
+    """Stats of the request or websocket event being handled, if any."""
+    return _current.get()
+
+
+class _Registry:
+    """Counters and histograms written by one thread only."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, key, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key, buckets, value):
+        row = self.histograms.get(key)
+        if row is None:
+            # One count per bucket, then sum and count (which is also +Inf).
+            row = self.histograms[key] = [0] * (len(buckets) + 2)
+        # Buckets are stored non-cumulative; render() adds them up.
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+
+_local = threading.local()
+_registries = []
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _registry():
+    registry = getattr(_local, "registry", None)
+    if registry is None:
+        registry = _local.registry = _Registry()
+        _registries.append(registry)
+        _start_flusher()
+    return registry
+
+
+def _start_flusher():
+    """Start this process's flush thread, once (and again in a forked child)."""
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+
+
+def _flush_periodically():
+    pid = os.getpid()
+    while _flusher_pid == pid:
+        time.sleep(metrics_setting("FLUSH_INTERVAL"))
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def reset():
+    """Forget everything recorded by this process."""
+    _registries.clear()
+    _local.__dict__.clear()
+
+
+os.register_at_fork(after_in_child=reset)
+
+
+def record(kind, stats, seconds):
+    registry = _registry()
+    labels = (stats.endpoint, stats.method)
+    registry.inc((f"{kind}_requests_total", labels + (str(stats.status),)))
+    registry.observe((f"{kind}_duration_seconds", labels), HISTOGRAMS["duration_seconds"], seconds)
+    registry.observe((f"{kind}_queries", labels), HISTOGRAMS["queries"], stats.queries)
+    registry.observe((f"{kind}_query_duration_seconds", labels), HISTOGRAMS["query_duration_seconds"], stats.query_seconds)
+    registry.observe((f"{kind}_size_bytes", labels), HISTOGRAMS["size_bytes"], stats.size)
+
+
+@contextmanager
+def track(kind, endpoint, method):
+    """
+    Time the enclosed block as one ``kind`` ("http" or "ws") request and
+    attribute the SQL it runs to it. The yielded stats can be relabelled
+    (endpoint, status, size) before the block ends.
+    """
+    stats = RequestStats(endpoint, method)
+    token = _current.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    except BaseException:
+        stats.status = "error" if kind == "ws" else 500
+        raise
+    finally:
+        _current.reset(token)
+        record(kind, stats, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def _install_on(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_query_recorder():
+    """Attach ``record_query`` to every current and future DB connection."""
+    connection_created.connect(_install_on, dispatch_uid="api.metrics.record_query")
+    for connection in connections.all(initialized_only=True):
+        _install_on(connection)
+
+
+def snapshot():
+    """This process's totals, merged across threads."""
+    counters, histograms = {}, {}
+    for registry in list(_registries):
+        for key, value in dict(registry.counters).items():
+            counters[key] = counters.get(key, 0) + value
+        for key, row in dict(registry.histograms).items():
+            merged = histograms.setdefault(key, [0] * len(row))
+            histograms[key] = [a + b for a, b in zip(merged, row)]
+    return counters, histograms
+
+
+def _process_file(pid):
+    return Path(metrics_setting("DIR")) / f"metrics-{pid}.json"
+
+
+def flush():
+    """Write this process's totals for the other workers' scrapes."""
+    if not _registries:
+        return
+    counters, histograms = snapshot()
+    path = _process_file(os.getpid())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), row] for (name, labels), row in histograms.items()],
+    }
+    tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(payload))
+    os.replace(tmp, path)
+
+
+def _remove_own_file():
+    _process_file(os.getpid()).unlink(missing_ok=True)
+
+
+atexit.register(_remove_own_file)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Totals of every live worker: the other processes' files plus this process live."""
+    counters, histograms = snapshot()
+    own = _process_file(os.getpid())
+    stale_before = time.time() - metrics_setting("STALE_AFTER")
+    for path in Path(metrics_setting("DIR")).glob("metrics-*.json"):
+        if path == own:
+            continue
+        try:
+            pid = int(path.stem.removeprefix("metrics-"))
+        except ValueError:
+            continue
+        try:
+            if not _alive(pid) or path.stat().st_mtime < stale_before:
+                path.unlink(missing_ok=True)
+                continue
+            payload = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in payload["counters"]:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, row in payload["histograms"]:
+            key = (name, tuple(labels))
+            merged = histograms.get(key, [0] * len(row))
+            histograms[key] = [a + b for a, b in zip(merged, row)]
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _header(lines, seen, name, suffix, kind):
+    if name not in seen:
+        seen.add(name)
+        lines.append(f"# HELP {name} {HELP[suffix]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def render(counters, histograms):
+    """Prometheus text exposition (version 0.0.4)."""
+    lines, seen = [], set()
+    for (name, (endpoint, method, status)), value in sorted(counters.items()):
+        _header(lines, seen, name, "requests_total", "counter")
+        lines.append(f"{name}{_labels(endpoint=endpoint, method=method, status=status)} {value}")
+    for (name, (endpoint, method)), row in sorted(histograms.items()):
+        suffix = name.split("_", 1)[1]
+        _header(lines, seen, name, suffix, "histogram")
+        cumulative = 0
+        for bound, count in zip(HISTOGRAMS[suffix], row):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(endpoint=endpoint, method=method, le='+Inf')} {row[-1]}")
+        lines.append(f"{name}_sum{_labels(endpoint=endpoint, method=method)} {row[-2]}")
+        lines.append(f"{name}_count{_labels(endpoint=endpoint, method=method)} {row[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Record latency, SQL, size and status of every request. Add it first in ``MIDDLEWARE``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_query_recorder()
+
+    def __call__(self, request):
+        with track("http", "unmatched", request.method) as stats:
+            response = self.get_response(request)
+            match = request.resolver_match
+            if match is not None:
+                stats.endpoint = match.view_name or match.route
+            stats.status = response.status_code
+            stats.size = 0 if response.streaming else len(response.content)
+        return response
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def get(self, request):
+        return HttpResponse(render(*collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-18 06:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_emailoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['created_at', 'id'], name='contract_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['buyer', 'created_at', 'id'], name='contract_buyer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['seller', 'created_at', 'id'], name='contract_seller_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contracttemplate',
+            index=models.Index(fields=['created_at', 'id'], name='contract_template_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croplistingtemplate',
+            index=models.Index(fields=['created_at', 'id'], name='crop_listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispute',
+            index=models.Index(fields=['created_at', 'id'], name='dispute_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['created_at', 'id'], name='notification_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenderapplication',
+            index=models.Index(fields=['created_at', 'id'], name='tender_application_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportationtender',
+            index=models.Index(fields=['created_at', 'id'], name='tender_created_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:09
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of the bucket edges in api.facets at the time of this migration.
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 50000, 100000)
+QUINTAL_BUCKETS = (0, 10, 50, 100, 500, 1000)
+
+
+def bucket(value, edges):
+    labels = [f"{low}-{high}" for low, high in zip(edges, edges[1:])] + [f"{edges[-1]}+"]
+    label = None
+    for edge, edge_label in zip(edges, labels):
+        if value is not None and value >= edge:
+            label = edge_label
+    return label
+
+
+def count_existing_templates(apps, schema_editor):
+    ContractTemplate = apps.get_model("api", "ContractTemplate")
+    ContractTemplateFacet = apps.get_model("api", "ContractTemplateFacet")
+    counts = Counter()
+    rows = ContractTemplate.objects.values_list("approved", "crop_id", "crop__crop_type", "price", "total_quintal_required")
+    for approved, crop_id, crop_type, price, quintal in rows.iterator():
+        values = {
+            "total": "",
+            "crop": str(crop_id) if crop_id is not None else None,
+            "crop_type": crop_type,
+            "price": bucket(price, PRICE_BUCKETS),
+            "quintal": bucket(quintal, QUINTAL_BUCKETS),
+        }
+        for facet, value in values.items():
+            if value is not None:
+                counts[approved, facet, value] += 1
+    ContractTemplateFacet.objects.bulk_create(
+        ContractTemplateFacet(approved=approved, facet=facet, value=value, count=n)
+        for (approved, facet, value), n in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_created_at_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractTemplateFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approved', models.BooleanField()),
+                ('facet', models.CharField(max_length=32)),
+                ('value', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contracttemplate',
+            index=models.Index(fields=['approved', 'crop', 'price'], name='contract_template_crop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contracttemplate',
+            index=models.Index(fields=['approved', 'price'], name='contract_template_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contracttemplate',
+            index=models.Index(fields=['approved', 'total_quintal_required'], name='contract_template_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croplistingtemplate',
+            index=models.Index(fields=['crop_type'], name='crop_listing_type_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='contracttemplatefacet',
+            constraint=models.UniqueConstraint(fields=('approved', 'facet', 'value'), name='contract_template_facet_unique'),
+        ),
+        migrations.RunPython(count_existing_templates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_unread(apps, schema_editor):
+    Notifications = apps.get_model("api", "Notifications")
+    NotificationCounter = apps.get_model("api", "NotificationCounter")
+    unread = Notifications.objects.filter(is_read=False).values_list("user_id").annotate(n=Count("pk"))
+    NotificationCounter.objects.bulk_create(NotificationCounter(user_id=user_id, unread=n) for user_id, n in unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_contract_template_facets'),
+        ('users', '0002_user_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
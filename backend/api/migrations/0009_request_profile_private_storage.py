@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:38
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_request_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='requestprofile',
+            name='stacks',
+            field=models.FileField(storage=api.models.ProfileStorage(), upload_to='profiles/'),
+        ),
+    ]
@@ -1,10 +1,18 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
 from django.utils.translation import gettext_lazy as _
 from users.models import CustomUser, FarmerProfile, CompanyProfile, BuyerProfile
+from users.tracking import FieldTrackerMixin
 
 
-class CropListingTemplate(models.Model):
-    
+class CropListingTemplate(FieldTrackerMixin, models.Model):
+    tracked_fields = ("crop_type",)
+
     CROP_TYPES = [
         ("kharif", "Kharif"),
         ("rabi", "Rabi"),
@@ -18,11 +26,19 @@ class CropListingTemplate(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     supervised = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="crop_listing_created_idx"),
+            models.Index(fields=["crop_type"], name="crop_listing_type_idx"),
+        ]
+
     def __str__(self):
         return f"{self.crop_type} - {self.name}"
 
 
-class ContractTemplate(models.Model):
+class ContractTemplate(FieldTrackerMixin, models.Model):
+    tracked_fields = ("approved", "crop", "price", "total_quintal_required")
+
     submitted_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="contract_templates")
     contract_name = models.CharField(max_length=255, verbose_name=_("Contract Name"))
     contract_description = models.TextField(verbose_name=_("Contract Description"))
@@ -33,8 +49,33 @@ class ContractTemplate(models.Model):
     crop = models.ForeignKey(CropListingTemplate, on_delete=models.CASCADE, related_name="contract_templates", null=True, blank=True)
     total_quintal_required = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="contract_template_created_idx"),
+            # Marketplace filters: approval first, then crop or a range.
+            models.Index(fields=["approved", "crop", "price"], name="contract_template_crop_idx"),
+            models.Index(fields=["approved", "price"], name="contract_template_price_idx"),
+            models.Index(fields=["approved", "total_quintal_required"], name="contract_template_qty_idx"),
+        ]
+
     def __str__(self):
         return f"{self.contract_name} by {self.submitted_by.email}"
+
+
+class ContractTemplateFacet(models.Model):
+    """Live number of contract templates per facet value, maintained by ``api.facets``."""
+    approved = models.BooleanField()
+    facet = models.CharField(max_length=32)
+    value = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["approved", "facet", "value"], name="contract_template_facet_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({'approved' if self.approved else 'pending'}): {self.count}"
     
 class EsignResponse(models.Model):
     USER_TYPES = [
@@ -52,7 +93,9 @@ class EsignResponse(models.Model):
     def __str__(self):
         return f"E-Sign Response: {self.verification_id}, Status: {self.status}"
 
-class Contract(models.Model):
+class Contract(FieldTrackerMixin, models.Model):
+    tracked_fields = ("status", "estimate_total_price", "buyer", "seller")
+
     STATUS_CHOICES = [
         ("PENDING", "Pending"),
         ("APPROVED", "Approved"),
@@ -76,11 +119,20 @@ class Contract(models.Model):
     buyer_signed = models.BooleanField(default=False)
     buyer_signed_file = models.FileField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="contract_created_idx"),
+            models.Index(fields=["buyer", "created_at", "id"], name="contract_buyer_created_idx"),
+            models.Index(fields=["seller", "created_at", "id"], name="contract_seller_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.contract_template.contract_name} between {self.buyer.email} and {self.seller.email}"
     
 
-class Dispute(models.Model):
+class Dispute(FieldTrackerMixin, models.Model):
+    tracked_fields = ("status", "admin_comment")
+
     DISPUTE_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('resolved', 'Resolved'),
@@ -99,11 +151,18 @@ class Dispute(models.Model):
     admin_comment = models.TextField(verbose_name=_("Admin Comment"), blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="dispute_created_idx"),
+        ]
+
     def __str__(self):
         return f"Dispute by {self.raised_by.email} on Contract {self.contract.id}"
     
 
-class Notifications(models.Model):
+class Notifications(FieldTrackerMixin, models.Model):
+    tracked_fields = ("is_read",)
+
     NOTIFICATION_TYPES = [
         ("info", "Info"),
         ("warning", "Warning"),
@@ -120,10 +179,24 @@ class Notifications(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     type_of = models.CharField(max_length=255, choices=NOTIFICATION_TYPES,default="info")
-    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"], name="notification_user_created_idx"),
+            models.Index(fields=["created_at", "id"], name="notification_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} to {self.user.email}"
+
+
+class NotificationCounter(models.Model):
+    """Number of unread notifications per user, maintained by ``api.notifications``."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name="notification_counter")
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread} unread for {self.user_id}"
     
 
 class Message(models.Model):
@@ -173,6 +246,11 @@ class TransportationTender(models.Model):
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="tender_created_idx"),
+        ]
+
     def __str__(self):
         return self.tender_name
     
@@ -193,5 +271,82 @@ class TenderApplication(models.Model):
     active = models.BooleanField(default=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="tender_application_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} applied for {self.tender.tender_name}"
+
+
+class EmailOutbox(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("dead", "Dead"),
+    ]
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+
+@deconstructible
+class ProfileStorage(FileSystemStorage):
+    """
+    Storage for profiler output, under ``PROFILING["STORAGE_ROOT"]`` (default
+    ``BASE_DIR/profiles``) rather than ``MEDIA_ROOT``. Files have no URL; the
+    admin serves them to staff.
+    """
+
+    @property
+    def base_location(self):
+        return getattr(settings, "PROFILING", {}).get("STORAGE_ROOT") or os.path.join(settings.BASE_DIR, "profiles")
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError("Profiler output is not accessible via a URL.")
+
+
+class RequestProfile(models.Model):
+    """A request run under ``api.profiling``: collapsed stacks plus its SQL."""
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="request_profiles")
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    view_name = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    stacks = models.FileField(upload_to="profiles/", storage=ProfileStorage())
+    queries = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="request_profile_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,98 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import NotificationCounter, Notifications
+from .serializers import MarkNotificationsReadSerializer
+
+CATCHUP_LIMIT = 100
+
+
+def notification_group(user_id):
+    return f"notifications_{user_id}"
+
+
+def serialize_notification(notification):
+    return {
+        "id": notification.id,
+        "title": notification.title,
+        "message": notification.message,
+        "type_of": notification.type_of,
+        "is_read": notification.is_read,
+        "created_at": notification.created_at.isoformat(),
+    }
+
+
+def notifications_since(user_id, last_id, limit=CATCHUP_LIMIT):
+    """Notifications the client has not seen yet, oldest first."""
+    queryset = Notifications.objects.filter(user_id=user_id, id__gt=last_id).order_by("id")[:limit]
+    return [serialize_notification(notification) for notification in queryset]
+
+
+def publish_notification(notification):
+    """Fan a saved notification out to the user's sockets once the transaction commits."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    payload = serialize_notification(notification)
+    group = notification_group(notification.user_id)
+
+    def send():
+        async_to_sync(channel_layer.group_send)(group, {"type": "notification.created", "notification": payload})
+
+    transaction.on_commit(send)
+
+
+def adjust_unread(user_id, delta):
+    """Add ``delta`` to the user's unread counter, creating the row on first use."""
+    if not delta:
+        return
+    counter = NotificationCounter.objects.filter(user_id=user_id)
+    if counter.update(unread=F("unread") + delta):
+        return
+    NotificationCounter.objects.bulk_create([NotificationCounter(user_id=user_id)], ignore_conflicts=True)
+    counter.update(unread=F("unread") + delta)
+
+
+def unread_count(user_id):
+    """The badge number: one primary-key lookup."""
+    return NotificationCounter.objects.filter(pk=user_id).values_list("unread", flat=True).first() or 0
+
+
+def mark_read(user_id, type_of=None, up_to_id=None):
+    """
+    Mark the user's unread notifications as read, optionally only one type or
+    only up to an id. One ``UPDATE`` plus the counter adjustment; returns the
+    number of notifications marked.
+    """
+    unread = Notifications.objects.filter(user_id=user_id, is_read=False)
+    if type_of is not None:
+        unread = unread.filter(type_of=type_of)
+    if up_to_id is not None:
+        unread = unread.filter(id__lte=up_to_id)
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        adjust_unread(user_id, -marked)
+    return marked
+
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread": unread_count(request.user.pk)})
+
+
+class MarkNotificationsReadView(APIView):
+    """Mark all notifications read, or only those of ``type_of`` and/or up to ``up_to_id``."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = MarkNotificationsReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marked = mark_read(request.user.pk, **serializer.validated_data)
+        return Response({"marked": marked, "unread": unread_count(request.user.pk)})
@@ -0,0 +1,192 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+def parse_field_paths(value):
+    """
+    Turn ``"id,buyer.email,buyer.farmer_profile.bio"`` into the nested dict
+    ``{"id": {}, "buyer": {"email": {}, "farmer_profile": {"bio": {}}}}``.
+    """
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets.
+
+    ``?fields=id,buyer.email`` limits the output to the listed fields, with
+    dotted paths selecting fields of nested serializers. A nested serializer
+    listed without sub-fields is collapsed to its primary key(s) unless it is
+    also named in ``?expand=``, which renders it in full. Without ``?fields=``
+    the output is unchanged.
+
+    Only the top-level serializer reads the query string; it hands each nested
+    serializer its part of the selection. Writes ignore ``?fields=``, so it can
+    never drop submitted input.
+    """
+
+    sparse_fields = None
+    sparse_expand = None
+
+    @property
+    def is_sparse(self):
+        return self.sparse_fields is not None
+
+    def _read_query_params(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        request = self.context.get("request")
+        if parent is not None or request is None or request.method not in SAFE_METHODS:
+            return
+        params = getattr(request, "query_params", request.GET)
+        if params.get(FIELDS_PARAM):
+            self.sparse_fields = parse_field_paths(params[FIELDS_PARAM])
+            self.sparse_expand = parse_field_paths(params.get(EXPAND_PARAM, ""))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is None:
+            self._read_query_params()
+        if self.sparse_fields is None:
+            return fields
+
+        expand = self.sparse_expand or {}
+        selected = {}
+        for name, field in fields.items():
+            if name not in self.sparse_fields:
+                continue
+            subfields = self.sparse_fields[name]
+            if isinstance(field, serializers.BaseSerializer):
+                if subfields or name in expand:
+                    nested = field.child if isinstance(field, serializers.ListSerializer) else field
+                    nested.sparse_fields = subfields or None
+                    nested.sparse_expand = expand.get(name, {})
+                else:
+                    kwargs = {"source": field.source} if field.source else {}
+                    many = isinstance(field, serializers.ListSerializer)
+                    field = PrimaryKeyRelatedField(read_only=True, many=many, **kwargs)
+            selected[name] = field
+        return selected
+
+
+def _model_field(model, source):
+    if not source or "." in source or source == "*":
+        return None
+    try:
+        return model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+
+
+def collect_relations(serializer, model, prefix=""):
+    """
+    Walk the declared fields of ``serializer`` and return the
+    ``(select_related, prefetch_related, only)`` lookups it needs on ``model``.
+
+    Nested single objects are joined with ``select_related``; nested lists
+    and primary-key lists are prefetched, with the prefetch queryset itself
+    optimised for the nested serializer. ``only`` lists the columns the
+    serializer reads, or is ``None`` when a field does not map onto a model
+    field and the row has to be loaded in full.
+    """
+    select, prefetch, only = [], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        model_field = _model_field(model, field.source)
+        if model_field is None:
+            only = None
+            continue
+        path = f"{prefix}{field.source}"
+        if not model_field.is_relation:
+            if only is not None:
+                only.append(path)
+            continue
+        related_model = model_field.related_model
+
+        if isinstance(field, serializers.ListSerializer):
+            required = [model_field.field.name] if model_field.one_to_many else []
+            queryset = optimize_queryset(related_model._default_manager.all(), field.child, required=required)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            nested_select, nested_prefetch, nested_only = collect_relations(field, related_model, f"{path}__")
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+            if only is not None and nested_only is not None:
+                only.extend(nested_only or [f"{path}__{related_model._meta.pk.name}"])
+            else:
+                only = None
+        elif isinstance(field, ManyRelatedField):
+            if model_field.one_to_many:
+                # Only the keys are rendered; skip the rest of each row.
+                keys = related_model._default_manager.only(model_field.field.name)
+                prefetch.append(Prefetch(path, queryset=keys))
+            else:
+                prefetch.append(path)
+        elif isinstance(field, PrimaryKeyRelatedField) and model_field.concrete:
+            # Primary keys are read from the local ``*_id`` column.
+            if only is not None:
+                only.append(path)
+        elif isinstance(field, PrimaryKeyRelatedField) and model_field.one_to_one:
+            select.append(path)
+            if only is not None:
+                only.append(f"{path}__{related_model._meta.pk.name}")
+        elif isinstance(field, RelatedField):
+            # Reverse one-to-ones, slugs and __str__ need the related row.
+            select.append(path)
+            only = None
+    return select, prefetch, only
+
+
+def optimize_queryset(queryset, serializer, narrow=None, required=()):
+    """
+    Apply the joins and prefetches ``serializer`` needs to ``queryset``.
+
+    With ``narrow`` (the default for sparse serializers) the columns are
+    limited to the ones the serializer reads, plus ``required``.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    select, prefetch, only = collect_relations(serializer, queryset.model)
+    if narrow is None:
+        narrow = getattr(serializer, "is_sparse", False)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if narrow and only is not None:
+        queryset = queryset.only(*only, *required)
+    return queryset
+
+
+class OptimizedQuerysetMixin:
+    """
+    View mixin that derives ``select_related``/``prefetch_related`` from the
+    view's serializer, so nested serializers never cause N+1 queries. For
+    sparse requests the query only loads the selected columns.
+
+    Views that filter per request override ``get_base_queryset`` rather than
+    ``get_queryset``, so the optimisation is still applied on top.
+    """
+
+    def get_base_queryset(self):
+        return super().get_queryset()
+
+    def get_queryset(self):
+        return optimize_queryset(self.get_base_queryset(), self.get_serializer())
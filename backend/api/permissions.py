@@ -5,18 +5,18 @@ class IsFarmer(permissions.BasePermission):
     Custom permission to only allow farmers to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and request.user.role == 'farmer'
+        return bool(request.user and request.user.is_authenticated and request.user.user_type == 'farmer')
 
 class IsBuyer(permissions.BasePermission):
     """
     Custom permission to only allow buyers to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and request.user.role == 'buyer'
+        return bool(request.user and request.user.is_authenticated and request.user.user_type == 'buyer')
 
 class IsCompany(permissions.BasePermission):
     """
     Custom permission to only allow companies to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and request.user.role == 'company'
\ No newline at end of file
+        return bool(request.user and request.user.is_authenticated and request.user.user_type == 'company')
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+On-demand sampling profiler for single requests.
+
+A staff request carrying the ``X-Profile: 1`` header (or ``?_profile=1``) is
+run with a sampler thread that records the stack of the request's thread
+every ``INTERVAL`` seconds, and with an execute wrapper that records every
+SQL statement and its time. The samples are written in collapsed-stack format
+(``frame;frame;frame count``, ready for flamegraph.pl or speedscope) to the
+private ``RequestProfile`` storage under a random name, and the row with the
+SQL is shown in the admin.
+
+The flag is ignored for everyone else, before any profiling starts. Only
+``MAX_CONCURRENT`` requests per process are profiled at a time; further
+flagged requests run normally.
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from rest_framework.exceptions import APIException
+from users.auth_cache import CachedJWTAuthentication
+
+from .models import RequestProfile
+
+DEFAULTS = {
+    "INTERVAL": 0.005,
+    "HEADER": "X-Profile",
+    "QUERY_PARAM": "_profile",
+    "MAX_CONCURRENT": 1,
+    "MAX_DEPTH": 128,
+}
+
+
+def profiling_setting(name):
+    return getattr(settings, "PROFILING", {}).get(name, DEFAULTS[name])
+
+
+_slots = threading.BoundedSemaphore(profiling_setting("MAX_CONCURRENT"))
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+class StackSampler:
+    """Background thread sampling the stack of one other thread."""
+
+    def __init__(self, thread_id, interval, max_depth):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({"sql": sql, "ms": round((time.perf_counter() - start) * 1000, 3), "many": many})
+
+
+def profile_requested(request):
+    value = request.headers.get(profiling_setting("HEADER")) or request.GET.get(profiling_setting("QUERY_PARAM"))
+    return value not in (None, "", "0", "false")
+
+
+def profiling_user(request):
+    """The staff user behind ``request`` (session or bearer token), or None."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            user, _ = CachedJWTAuthentication().authenticate(request) or (None, None)
+        except APIException:
+            user = None
+    return user if user is not None and user.is_staff else None
+
+
+class ProfilingMiddleware:
+    """
+    Profile flagged requests from staff. Place it after the authentication
+    middleware; bearer tokens are checked here, since DRF only authenticates
+    them inside the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profile_requested(request):
+            return self.get_response(request)
+        user = profiling_user(request)
+        if user is None or not _slots.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, user)
+        finally:
+            _slots.release()
+
+    def profile(self, request, user):
+        recorder = QueryRecorder()
+        sampler = StackSampler(threading.get_ident(), profiling_setting("INTERVAL"), profiling_setting("MAX_DEPTH"))
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            stack.enter_context(sampler)
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        profile = RequestProfile(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:2048],
+            view_name=(match.view_name or match.route) if match else "",
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            samples=sum(sampler.stacks.values()),
+            query_count=len(recorder.queries),
+            query_ms=sum(query["ms"] for query in recorder.queries),
+            queries=recorder.queries,
+        )
+        profile.stacks.save(f"{uuid.uuid4().hex}.collapsed", ContentFile(sampler.collapsed()), save=False)
+        profile.save()
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
@@ -0,0 +1,240 @@
+"""
+Retrieval engine behind the chatbot.
+
+The question/answer pairs in ``ml_data/data.txt`` are parsed once and fitted
+into a TF-IDF matrix. The fitted matrix is written to ``ml_data/index/`` as
+plain ``.npy`` arrays so that worker processes can open it with ``mmap``
+instead of refitting, and answering a message is a single sparse
+dot-product followed by a top-k pick.
+
+Each build goes into a new subdirectory, and the ``CURRENT`` file naming the
+live one is swapped with ``os.replace``. Files that other workers have
+mapped are never rewritten in place.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PAIR_RE = re.compile(r"<s>\s*\[INST\](.*?)\[/INST\](.*?)</s>", re.S)
+
+VECTORIZER_PARAMS = {
+    "lowercase": True,
+    "strip_accents": "unicode",
+    "ngram_range": (1, 2),
+    "sublinear_tf": True,
+    "norm": "l2",
+}
+
+FALLBACK_ANSWER = "Sorry, I could not find an answer to that. Please rephrase your question or contact support."
+
+
+def get_source_path():
+    return Path(getattr(settings, "CHAT_INDEX_SOURCE", BASE_DIR / "ml_data" / "data.txt"))
+
+
+def get_index_dir():
+    return Path(getattr(settings, "CHAT_INDEX_DIR", BASE_DIR / "ml_data" / "index"))
+
+
+def current_location(directory=None):
+    """Name of the live build under ``directory``, or None if there is none."""
+    try:
+        return (Path(directory or get_index_dir()) / "CURRENT").read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def parse_pairs(text):
+    """Return the ``(question, answer)`` pairs found in ``<s>[INST] q [/INST] a</s>`` text."""
+    pairs = []
+    for question, answer in PAIR_RE.findall(text):
+        question, answer = " ".join(question.split()), " ".join(answer.split())
+        if question and answer:
+            pairs.append((question, answer))
+    return pairs
+
+
+def source_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _make_vectorizer(vocabulary=None, idf=None):
+    vectorizer = TfidfVectorizer(vocabulary=vocabulary, **VECTORIZER_PARAMS)
+    if idf is not None:
+        vectorizer.idf_ = idf
+    return vectorizer
+
+
+class RetrievalIndex:
+    """
+    A fitted TF-IDF index over the chatbot question/answer pairs.
+
+    ``matrix`` holds one L2-normalised row per pair, so the dot-product with a
+    vectorised query is the cosine similarity.
+    """
+
+    def __init__(self, matrix, vocabulary, idf, questions, answers, version):
+        self.matrix = matrix
+        self.questions = questions
+        self.answers = answers
+        self.version = version
+        self.location = None
+        self.vectorizer = _make_vectorizer(vocabulary, idf)
+
+    def __len__(self):
+        return len(self.answers)
+
+    @classmethod
+    def build(cls, source=None):
+        source = Path(source or get_source_path())
+        data = source.read_bytes()
+        pairs = parse_pairs(data.decode("utf-8"))
+        if not pairs:
+            raise ValueError(f"No [INST] question/answer pairs found in {source}")
+
+        questions = [question for question, _ in pairs]
+        answers = [answer for _, answer in pairs]
+        vectorizer = _make_vectorizer()
+        # Questions are repeated so that they outweigh the longer answer text.
+        matrix = vectorizer.fit_transform(f"{q} {q} {a}" for q, a in pairs).tocsr().astype(np.float32)
+        return cls(matrix, vectorizer.vocabulary_, vectorizer.idf_, questions, answers, source_digest(data))
+
+    def save(self, directory=None):
+        root = Path(directory or get_index_dir())
+        previous = current_location(root)
+        location = f"{self.version[:12]}-{uuid.uuid4().hex[:8]}"
+        target = root / location
+        target.mkdir(parents=True)
+        np.save(target / "data.npy", self.matrix.data)
+        np.save(target / "indices.npy", self.matrix.indices)
+        np.save(target / "indptr.npy", self.matrix.indptr)
+        np.save(target / "idf.npy", self.vectorizer.idf_)
+        meta = {
+            "version": self.version,
+            "shape": list(self.matrix.shape),
+            "vocabulary": {term: int(col) for term, col in self.vectorizer.vocabulary.items()},
+            "questions": self.questions,
+            "answers": self.answers,
+        }
+        (target / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        tmp = root / f"CURRENT.{location}.tmp"
+        tmp.write_text(location, encoding="utf-8")
+        os.replace(tmp, root / "CURRENT")
+        self.location = location
+        # Older builds go; unlinking leaves existing mappings intact, and the
+        # previous build is kept for workers that have not switched yet.
+        for child in root.iterdir():
+            if child.is_dir() and child.name not in (location, previous):
+                shutil.rmtree(child, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory=None):
+        root = Path(directory or get_index_dir())
+        location = current_location(root)
+        if location is None:
+            raise FileNotFoundError(root / "CURRENT")
+        directory = root / location
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        matrix = sparse.csr_matrix(
+            (
+                np.load(directory / "data.npy", mmap_mode="r"),
+                np.load(directory / "indices.npy", mmap_mode="r"),
+                np.load(directory / "indptr.npy", mmap_mode="r"),
+            ),
+            shape=tuple(meta["shape"]),
+            copy=False,
+        )
+        idf = np.load(directory / "idf.npy", mmap_mode="r")
+        index = cls(matrix, meta["vocabulary"], idf, meta["questions"], meta["answers"], meta["version"])
+        index.location = location
+        return index
+
+    def vectorize(self, text):
+        return self.vectorizer.transform([text])
+
+    def search(self, text, k=3):
+        """Return up to ``k`` ``(score, question, answer)`` tuples, best first."""
+        query = self.vectorize(text)
+        if not query.nnz:
+            return []
+        scores = (self.matrix @ query.T).toarray().ravel()
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.questions[i], self.answers[i]) for i in top if scores[i] > 0]
+
+    def answer(self, text, min_score=None):
+        if min_score is None:
+            min_score = getattr(settings, "CHAT_MIN_SCORE", 0.1)
+        results = self.search(text, k=1)
+        if not results or results[0][0] < min_score:
+            return FALLBACK_ANSWER
+        return results[0][2]
+
+
+_index = None
+_index_checked = 0.0
+_index_lock = threading.Lock()
+
+
+def build_index(source=None, directory=None):
+    """Fit the index from ``source`` and persist it to ``directory``."""
+    index = RetrievalIndex.build(source)
+    index.save(directory)
+    return index
+
+
+def load_index(source=None, directory=None):
+    """
+    Open the persisted index, refitting it only when it is missing or was
+    built from a different version of the source file.
+    """
+    source = Path(source or get_source_path())
+    version = source_digest(source.read_bytes())
+    try:
+        index = RetrievalIndex.load(directory)
+    except (FileNotFoundError, ValueError, KeyError):
+        index = None
+    if index is None or index.version != version:
+        index = build_index(source, directory)
+    return index
+
+
+def get_index():
+    """
+    Return the process-wide index, loading it on first use and switching to
+    a newer build (e.g. from ``build_chat_index``) at most every
+    ``CHAT_INDEX_RELOAD_INTERVAL`` seconds.
+    """
+    global _index, _index_checked
+    now = time.monotonic()
+    if _index is None or now - _index_checked >= getattr(settings, "CHAT_INDEX_RELOAD_INTERVAL", 10):
+        with _index_lock:
+            if _index is None:
+                _index = load_index()
+            elif now - _index_checked >= getattr(settings, "CHAT_INDEX_RELOAD_INTERVAL", 10):
+                location = current_location()
+                if location is not None and location != _index.location:
+                    _index = RetrievalIndex.load()
+            _index_checked = now
+    return _index
+
+
+def reset_index():
+    global _index, _index_checked
+    with _index_lock:
+        _index = None
+        _index_checked = 0.0
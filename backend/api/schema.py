@@ -0,0 +1,110 @@
+"""
+OpenAPI schema served from memory.
+
+``SpectacularAPIView`` introspects every view and serializer on each hit.
+Here the schema is generated once, by ``manage.py generate_schema`` at build
+time (written to ``openapi.json``) or on the first request if no file was
+built, and kept per process as pre-rendered YAML and JSON bytes with an
+ETag. A new deploy ships a new file and new processes, which is the only
+invalidation; run ``generate_schema`` again after changing views locally.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+RENDERERS = (OpenApiYamlRenderer, OpenApiJsonRenderer)
+
+
+def get_schema_path():
+    return Path(getattr(settings, "OPENAPI_SCHEMA_PATH", BASE_DIR / "openapi.json"))
+
+
+def generate_schema():
+    """Introspect the URLconf the way ``SpectacularAPIView`` does, without a request."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(urlconf=spectacular_settings.SERVE_URLCONF)
+    return generator.get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+
+
+def write_schema(path=None):
+    path = Path(path or get_schema_path())
+    schema = generate_schema()
+    path.write_text(json.dumps(schema, indent=2))
+    return schema
+
+
+class RenderedSchema:
+    """The schema rendered once per format, as ``{format: (body, etag)}``."""
+
+    def __init__(self, schema):
+        self.bodies = {}
+        for renderer_class in RENDERERS:
+            body = renderer_class().render(schema, renderer_context={})
+            self.bodies[renderer_class.format] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+
+    def get(self, format):
+        return self.bodies[format]
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def load_schema(path=None):
+    """The schema in ``path`` if it was built, otherwise a freshly generated one."""
+    path = Path(path or get_schema_path())
+    try:
+        schema = json.loads(path.read_text())
+    except FileNotFoundError:
+        schema = generate_schema()
+    return RenderedSchema(schema)
+
+
+def get_schema():
+    """Return the process-wide rendered schema, loading it on first use."""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _schema = load_schema()
+    return _schema
+
+
+def preload_schema():
+    """Load a built schema file at startup; without one, wait for the first request."""
+    global _schema
+    if get_schema_path().exists():
+        with _schema_lock:
+            _schema = load_schema()
+
+
+def reset_schema():
+    global _schema
+    with _schema_lock:
+        _schema = None
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """``SpectacularAPIView`` answering from the in-memory schema, with ``If-None-Match`` support."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        body, etag = get_schema().get(renderer.format)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type=f"{renderer.media_type}; charset=utf-8")
+            response["Content-Disposition"] = f'inline; filename="{self._get_filename(request, None)}"'
+        response["ETag"] = etag
+        response["Cache-Control"] = "public, no-cache"
+        return response
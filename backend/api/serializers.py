@@ -1,16 +1,17 @@
 from rest_framework import serializers
+from .optimization import DynamicFieldsMixin
 from .models import ContractTemplate, Contract, CropListingTemplate, Dispute, Notifications, UploadedDocument, EsignResponse, TenderApplication, TransportationTender
 from users.serializers import OtherUserSerializer
 from payments.serializers import OrderSerializer
 
-class CropListingTemplateSerializer(serializers.ModelSerializer):
+class CropListingTemplateSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CropListingTemplate
         fields = ['id', 'name', 'description', 'image', 'is_active', 'created_at', 'crop_type']
         read_only_fields = ['id', 'created_at']
 
 
-class ConractTemplateSerializer(serializers.ModelSerializer):
+class ConractTemplateSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     submitted_by = OtherUserSerializer(read_only=True)
     class Meta:
         model = ContractTemplate
@@ -18,7 +19,7 @@ class ConractTemplateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'submitted_by', 'created_at', 'approved']
 
 
-class ContractSerializer(serializers.ModelSerializer):
+class ContractSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     seller = OtherUserSerializer(read_only=True)
     buyer = OtherUserSerializer(read_only=True)
     class Meta:
@@ -26,12 +27,12 @@ class ContractSerializer(serializers.ModelSerializer):
         fields = ['id', 'contract_template', 'buyer', 'seller', 'created_at', 'approved', 'status', 'signed_contract', 'estimate_production_in_quintal', 'estimate_total_price', 'buyer_signed', 'seller_signed']
         read_only_fields = ['id', 'created_at', 'approved', 'buyer', 'seller', 'status', 'signed_contract', 'buyer_signed', 'seller_signed']
 
-class ESignSerializer(serializers.ModelSerializer):
+class ESignSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EsignResponse
         fields = ["contract", "type_of", "status", "verification_id", "reference_id", "document_id", "signing_link"]
 
-class GetContractSerializer(serializers.ModelSerializer):
+class GetContractSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     seller = OtherUserSerializer(read_only=True)
     buyer = OtherUserSerializer(read_only=True)
     esign_responses = ESignSerializer(many=True)
@@ -42,25 +43,29 @@ class GetContractSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'approved', 'buyer', 'seller', 'status', 'signed_contract', 'buyer_signed', 'seller_signed']
 
 
-class DisputeSerializer(serializers.ModelSerializer):
+class DisputeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     contract = ContractSerializer()
     class Meta:
         model = Dispute
         fields = ['id', 'contract', 'raised_by', 'description', 'status', 'admin_comment', 'created_at']
         read_only_fields = ['id', 'status', 'admin_comment', 'created_at', 'raised_by']
 
-class AdminDisputeSerializer(serializers.ModelSerializer):
+class AdminDisputeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Dispute
         fields = ['id', 'status', 'admin_comment']
         read_only_fields = ['id']
 
-class NotificationsSerializer(serializers.ModelSerializer):
+class NotificationsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Notifications
         fields = '__all__'
 
-class DocumentUploadSerializer(serializers.ModelSerializer):
+class MarkNotificationsReadSerializer(serializers.Serializer):
+    type_of = serializers.ChoiceField(choices=Notifications.NOTIFICATION_TYPES, required=False)
+    up_to_id = serializers.IntegerField(required=False, min_value=1)
+
+class DocumentUploadSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = UploadedDocument
         fields = ['file']
@@ -94,13 +99,13 @@ class EsignStatusQuerySerializer(serializers.Serializer):
             )
         return data
     
-class TenderApplicationSerializer(serializers.ModelSerializer):
+class TenderApplicationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TenderApplication
         fields = ['id', 'tender', 'applicant_name', 'applicant_contact', 'status', 'created_at', 'application_file', 'address', 'company_name']
         read_only_fields = ['id', 'created_at', 'status']
 
-class TransportationTenderSerializer(serializers.ModelSerializer):
+class TransportationTenderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TransportationTender
         fields = '__all__'
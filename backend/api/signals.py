@@ -1,45 +1,97 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .models import ContractTemplate, Contract, Dispute
+from .models import ContractTemplate, Contract, CropListingTemplate, Dispute, Notifications, EsignResponse
+from .contract_cache import bump_contract, bump_user
+from .facets import crop_type_changed, template_changed
 from .emails import send_notification_email
+from .notifications import adjust_unread, publish_notification
 from django.conf import settings
-from django.core.mail import send_mail
+from payments.models import Order, Payment
+from users.models import CustomUser, FarmerProfile, BuyerProfile, CompanyProfile
 
 
-@receiver(pre_save, sender=ContractTemplate)
-def cache_previous_is_verified_state(sender, instance, **kwargs):
-    if instance.pk:
-        previous_instance = ContractTemplate.objects.get(pk=instance.pk)
-        instance._previous_approved = previous_instance.approved
-    else:
-        instance._previous_approved = None
-
 @receiver(post_save, sender=ContractTemplate)
-def verify_gst_info(instance, **kwargs):
-    previous_approved = getattr(instance, '_previous_approved', None)
+def verify_gst_info(instance, created, **kwargs):
+    if created:
+        return
 
-    if previous_approved is not None and not previous_approved and instance.approved:
+    if instance.previous("approved") is False and instance.approved:
         message = f'Your contract template has been approved.'
         send_notification_email(instance.submitted_by.email, {'title': 'Contract Template Approved', 'message': message})
 
-@receiver(pre_save, sender=Dispute)
-def cache_previous_status_state(sender, instance, **kwargs):
-    if instance.pk:
-        previous_instance = Dispute.objects.get(pk=instance.pk)
-        instance._previous_status = previous_instance.status
-        instance._previous_admin_comment = previous_instance.admin_comment
-    else:
-        instance._previous_status = None
-        instance._previous_admin_comment = None
+@receiver(post_save, sender=ContractTemplate)
+def count_template_facets(instance, created, **kwargs):
+    template_changed(instance, created=created)
+
+@receiver(post_delete, sender=ContractTemplate)
+def uncount_template_facets(instance, **kwargs):
+    template_changed(instance, deleted=True)
+
+@receiver(post_save, sender=CropListingTemplate)
+def move_crop_type_facets(instance, created, **kwargs):
+    if not created:
+        crop_type_changed(instance)
 
 @receiver(post_save, sender=Dispute)
-def notify_dispute_status_change(instance, **kwargs):
-    previous_status = getattr(instance, '_previous_status', None)
-    previous_admin_comment = getattr(instance, '_previous_admin_comment', None)
+def notify_dispute_status_change(instance, created, **kwargs):
+    if created:
+        return
 
-    if previous_status is not None and instance.status != previous_status:
+    if instance.previous('status') is not None and instance.has_changed('status'):
         message = f'Your dispute status has been changed to {instance.status}.'
         send_notification_email(instance.raised_by.email, {'title': 'Dispute Status Change', 'message': message})
 
-    if previous_admin_comment is not None and instance.admin_comment != previous_admin_comment:
+    if instance.previous('admin_comment') is not None and instance.has_changed('admin_comment'):
         send_notification_email(instance.raised_by.email, {'title': 'Admin Comment', 'message': instance.admin_comment})
+
+@receiver(post_save, sender=Notifications)
+def push_notification(instance, created, **kwargs):
+    if created:
+        publish_notification(instance)
+
+@receiver(post_save, sender=Notifications)
+def count_unread_notification(instance, created, **kwargs):
+    if created:
+        adjust_unread(instance.user_id, 0 if instance.is_read else 1)
+    elif instance.has_changed("is_read") and instance.previous("is_read") is not None:
+        adjust_unread(instance.user_id, 1 if not instance.is_read else -1)
+
+@receiver(post_delete, sender=Notifications)
+def uncount_unread_notification(instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread(instance.user_id, -1)
+
+@receiver([post_save, post_delete], sender=Contract)
+def invalidate_contract_detail(instance, **kwargs):
+    bump_contract(instance.pk)
+
+@receiver([post_save, post_delete], sender=EsignResponse)
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_contract_detail_from_child(instance, **kwargs):
+    bump_contract(instance.contract_id)
+
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_contract_detail_from_payment(instance, **kwargs):
+    if Payment.order.is_cached(instance):
+        contract_id = instance.order.contract_id
+    else:
+        contract_id = Order.objects.filter(pk=instance.order_id).values_list("contract_id", flat=True).first()
+    bump_contract(contract_id)
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_contracts(instance, **kwargs):
+    bump_user(instance.pk)
+
+@receiver([post_save, post_delete], sender=FarmerProfile)
+@receiver([post_save, post_delete], sender=BuyerProfile)
+@receiver([post_save, post_delete], sender=CompanyProfile)
+def invalidate_profile_contracts(instance, **kwargs):
+    bump_user(instance.user_id)
+
+@receiver(m2m_changed, sender=BuyerProfile.listings.through)
+def invalidate_buyer_listings(instance, reverse, pk_set, **kwargs):
+    if not reverse:
+        bump_user(instance.user_id)
+    elif pk_set:
+        for user_id in BuyerProfile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True):
+            bump_user(user_id)
@@ -0,0 +1,229 @@
+"""
+Test helpers: seeded data and per-route query budgets.
+
+``RouteQueryBudgetTestCase`` calls every route of a URLconf once against a
+small seed and once against a larger one. A route passes when it runs the
+same number of queries at both sizes and no more than the budget recorded for
+it in ``query_budgets.json``. On failure the SQL of both runs is printed as
+fingerprints (literals replaced by ``?``) with the statements that grew
+marked, which usually points straight at the missing ``select_related``.
+
+Run the suite with ``UPDATE_QUERY_BUDGETS=1`` to write the measured counts
+to the baseline instead of checking them; commit the file with the change
+that moved them.
+"""
+import json
+import os
+import re
+from collections import Counter
+from importlib import import_module
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from rest_framework.test import APIClient
+
+from payments.ledger import refresh_ledgers
+from payments.models import Order, Payment
+from users.models import BuyerProfile, CustomUser, FarmerProfile
+
+from .models import Contract, ContractTemplate, CropListingTemplate, Dispute, EsignResponse
+
+BASELINE_PATH = Path(__file__).resolve().parent.parent / "query_budgets.json"
+UPDATE_ENV = "UPDATE_QUERY_BUDGETS"
+SAFE_METHODS = ("get",)
+
+
+def seed_contracts(n, start=0):
+    """
+    Bulk-create ``n`` approved contracts, each with its own buyer, farmer,
+    order, payment, ledger row, e-sign and dispute. ``start`` offsets the
+    emails and ids so the helper can be called again to grow an existing seed.
+    """
+    crop = CropListingTemplate.objects.create(name="Wheat", crop_type="rabi", description="Wheat", image="crop_images/w.jpg")
+    numbers = range(start, start + n)
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(email=f"buyer{i}@example.com", user_type="buyer") for i in numbers]
+        + [CustomUser(email=f"farmer{i}@example.com", user_type="farmer") for i in numbers]
+    )
+    buyers, farmers = users[:n], users[n:]
+    buyer_profiles = BuyerProfile.objects.bulk_create([BuyerProfile(user=u, bio="", profile_image="b.jpg") for u in buyers])
+    BuyerProfile.listings.through.objects.bulk_create(
+        [BuyerProfile.listings.through(buyerprofile_id=p.pk, croplistingtemplate_id=crop.pk) for p in buyer_profiles]
+    )
+    FarmerProfile.objects.bulk_create([FarmerProfile(user=u, bio="", profile_image="f.jpg") for u in farmers])
+    template = ContractTemplate.objects.create(
+        submitted_by=buyers[0], contract_name="Wheat", contract_description="Rabi wheat", contract_file="c.pdf", crop=crop,
+    )
+    contracts = Contract.objects.bulk_create(
+        [Contract(contract_template=template, buyer=b, seller=f, status="APPROVED", estimate_total_price=1000) for b, f in zip(buyers, farmers)]
+    )
+    orders = Order.objects.bulk_create([Order(contract=c, amount=1000) for c in contracts])
+    Payment.objects.bulk_create([
+        Payment(payment_id=f"order_{i}", stage="advance", order=o, amount=250, email="b@example.com")
+        for i, o in zip(numbers, orders)
+    ])
+    refresh_ledgers([o.pk for o in orders])
+    EsignResponse.objects.bulk_create([
+        EsignResponse(contract=c, type_of="buyer", status="SIGNED", verification_id=f"v{i}", reference_id=i, document_id=i, signing_link="https://example.com")
+        for i, c in zip(numbers, contracts)
+    ])
+    Dispute.objects.bulk_create([Dispute(contract=c, raised_by=c.seller, description="Late") for c in contracts])
+
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SPACE_RE = re.compile(r"\s+")
+COLUMNS_RE = re.compile(r'SELECT (?:"\w+"\."\w+", )+"\w+"\."\w+" FROM')
+
+
+def fingerprint(sql):
+    """
+    ``sql`` with its literals, ``IN`` lists and column lists replaced, so
+    repeats of one statement compare equal and the report stays readable.
+    """
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = LIST_RE.sub("(...)", sql)
+    sql = COLUMNS_RE.sub("SELECT ... FROM", sql)
+    return SPACE_RE.sub(" ", sql).strip()
+
+
+def fingerprints(queries):
+    return Counter(fingerprint(query["sql"]) for query in queries)
+
+
+def iter_routes(patterns, prefix=""):
+    """``(route, pattern)`` for every endpoint under ``patterns``, with included prefixes joined."""
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        else:
+            yield route, pattern
+
+
+def view_methods(pattern):
+    view_class = getattr(pattern.callback, "view_class", None) or getattr(pattern.callback, "cls", None)
+    if view_class is None:
+        return list(SAFE_METHODS)
+    return [method for method in SAFE_METHODS if hasattr(view_class, method)]
+
+
+CONVERTER_RE = re.compile(r"<(?:\w+:)?(\w+)>")
+
+
+def build_path(route, kwargs):
+    return "/" + CONVERTER_RE.sub(lambda match: str(kwargs[match.group(1)]), route)
+
+
+def load_budgets(path=BASELINE_PATH):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_budgets(budgets, path=BASELINE_PATH):
+    Path(path).write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + "\n")
+
+
+def describe_failure(key, budget, small, large):
+    """Per-endpoint report: counts, then every fingerprint with its count at both sizes."""
+    small_prints, large_prints = fingerprints(small["queries"]), fingerprints(large["queries"])
+    lines = [
+        f"{key}: {len(small['queries'])} queries with {small['rows']} rows, "
+        f"{len(large['queries'])} with {large['rows']} rows (budget {budget})"
+    ]
+    for sql in sorted(set(small_prints) | set(large_prints), key=lambda sql: -large_prints[sql]):
+        marker = "+" if large_prints[sql] > small_prints[sql] else " "
+        lines.append(f"  {marker} {small_prints[sql]:>3} -> {large_prints[sql]:>3}  {sql}")
+    return "\n".join(lines)
+
+
+class RouteQueryBudgetTestCase(TestCase):
+    """
+    Abstract: the class itself is skipped, and a subclass must define
+
+    - ``urlconf``, the dotted path of the URLconf whose routes are budgeted;
+    - ``seed(n, start)``, which adds ``n`` more rows of everything the routes
+      read, numbered from ``start``;
+    - ``route_kwargs()``, which returns the ``(user, kwargs)`` to call the
+      routes with; kwargs fill the URL parameters.
+
+    ``route_requests`` maps a route to the ``(method, data)`` calls to make
+    instead of a plain GET, which is how unsafe methods are budgeted; routes
+    mapped to an empty list are left out.
+    """
+
+    __unittest_skip__ = True
+    __unittest_skip_why__ = "abstract base of the route query budget suites"
+
+    urlconf = None
+    sizes = (2, 20)
+    route_requests = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        missing = [name for name in ("seed", "route_kwargs") if not callable(getattr(cls, name, None))]
+        if not cls.urlconf:
+            missing.insert(0, "urlconf")
+        if missing:
+            raise TypeError(f"{cls.__name__} must define {', '.join(missing)}")
+        cls.__unittest_skip__ = False
+
+    def route_calls(self, patterns):
+        for route, pattern in iter_routes(patterns):
+            calls = self.route_requests.get(route)
+            if calls is None:
+                calls = [(method, None) for method in view_methods(pattern)]
+            for method, data in calls:
+                yield route, method, data
+
+    def measure(self, patterns, rows):
+        user, kwargs = self.route_kwargs()
+        client = APIClient()
+        client.force_authenticate(user)
+        results = {}
+        for route, method, data in self.route_calls(patterns):
+            key = f"{self.urlconf} {method.upper()} {route}"
+            options = {} if method in SAFE_METHODS else {"format": "json"}
+            with CaptureQueriesContext(connection) as queries:
+                getattr(client, method)(build_path(route, kwargs), data, **options)
+            results[key] = {"rows": rows, "queries": queries.captured_queries}
+        return results
+
+    def test_routes_within_query_budget(self):
+        try:
+            module = import_module(self.urlconf)
+        except ImportError as exc:
+            self.skipTest(f"{self.urlconf} cannot be imported ({exc}); none of its routes are budgeted until it can")
+
+        runs, seeded = [], 0
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            for size in self.sizes:
+                self.seed(size - seeded, seeded)
+                seeded = size
+                runs.append(self.measure(module.urlpatterns, size))
+        small, large = runs[0], runs[-1]
+
+        budgets = load_budgets()
+        if os.environ.get(UPDATE_ENV):
+            budgets.update({key: len(run["queries"]) for key, run in large.items()})
+            save_budgets(budgets)
+            return
+
+        failures = []
+        for key in large:
+            budget = budgets.get(key)
+            count = len(large[key]["queries"])
+            if budget is None or count != len(small[key]["queries"]) or count > budget:
+                failures.append(describe_failure(key, budget, small[key], large[key]))
+        if failures:
+            self.fail(
+                "Query budget exceeded (rerun with UPDATE_QUERY_BUDGETS=1 if the new counts are intended):\n\n"
+                + "\n\n".join(failures)
+            )
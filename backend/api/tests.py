@@ -1,3 +1,1076 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from scipy import sparse
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import metrics, testing
+from .answer_cache import AnswerCache, cached_answer, normalize
+from .facets import apply_filters, facet_counts, parse_filters, rebuild_facets
+from .emails import deliver_outbox, queue_email, send_notification_email
+from .contract_cache import CachedContractDetailMixin
+from .consumers import STREAM_ERROR_MESSAGE, ChatConsumer, NotificationConsumer
+from .chat_log import MessageBuffer
+from .inference import InferencePool, PoolBusy
+from .metrics import MetricsView
+from payments.models import Payment
+from payments.serializers import OrderSerializer
+from users.models import CustomUser, FarmerProfile
+from users.serializers import OtherUserSerializer
+from .models import Contract, ContractTemplate, ContractTemplateFacet, CropListingTemplate, Dispute, EmailOutbox, Message, Notifications, RequestProfile
+from .notifications import MarkNotificationsReadView, mark_read, notification_group, unread_count
+from .pagination import KeysetPagination
+from .optimization import OptimizedQuerysetMixin, optimize_queryset
+from .serializers import AdminDisputeSerializer, ContractSerializer, DisputeSerializer, GetContractSerializer
+from .testing import seed_contracts
+from .schema import CachedSpectacularAPIView, generate_schema, get_schema, reset_schema
+from .retrieval import FALLBACK_ANSWER, RetrievalIndex, build_index, get_index, load_index, parse_pairs, reset_index
+
+
+SAMPLE_DATA = """
+<s>[INST] How will email verification be implemented? [/INST] A verification email with a unique token is sent.</s>
+<s>[INST] How will the payment gateway ensure secure transactions? [/INST] Payments go through Razorpay escrow.</s>
+<s>[INST] What multilingual features does the chatbot provide? [/INST] The chatbot speaks Hindi and English.</s>
+"""
+
+
+class RetrievalIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = Path(self.tmp.name) / "data.txt"
+        self.source.write_text(SAMPLE_DATA, encoding="utf-8")
+        self.index_dir = Path(self.tmp.name) / "index"
+
+    def test_parse_pairs(self):
+        pairs = parse_pairs(SAMPLE_DATA)
+        self.assertEqual(len(pairs), 3)
+        self.assertEqual(pairs[0][0], "How will email verification be implemented?")
+        self.assertEqual(pairs[1][1], "Payments go through Razorpay escrow.")
+
+    def test_answer_uses_best_match(self):
+        index = RetrievalIndex.build(self.source)
+        self.assertEqual(index.answer("is the payment secure"), "Payments go through Razorpay escrow.")
+        self.assertEqual(index.answer("qwerty"), FALLBACK_ANSWER)
+
+    def test_persisted_index_is_loaded_without_refitting(self):
+        built = build_index(self.source, self.index_dir)
+        loaded = load_index(self.source, self.index_dir)
+        self.assertEqual(loaded.version, built.version)
+        self.assertEqual(loaded.answers, built.answers)
+        self.assertEqual(loaded.answer("email verification"), built.answer("email verification"))
+
+    def test_changed_source_is_reindexed(self):
+        build_index(self.source, self.index_dir)
+        self.source.write_text(SAMPLE_DATA + "<s>[INST] Can I change my role? [/INST] No.</s>", encoding="utf-8")
+        index = load_index(self.source, self.index_dir)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(RetrievalIndex.load(self.index_dir).version, index.version)
+
+    def test_workers_pick_up_a_rebuilt_index(self):
+        build_index(self.source, self.index_dir)
+        with override_settings(CHAT_INDEX_SOURCE=self.source, CHAT_INDEX_DIR=self.index_dir, CHAT_INDEX_RELOAD_INTERVAL=0):
+            reset_index()
+            self.addCleanup(reset_index)
+            self.assertEqual(len(get_index()), 3)
+            self.source.write_text(SAMPLE_DATA + "<s>[INST] Can I change my role? [/INST] No.</s>", encoding="utf-8")
+            build_index(self.source, self.index_dir)
+            self.assertEqual(len(get_index()), 4)
+
+    def test_rebuild_never_rewrites_a_live_index(self):
+        build_index(self.source, self.index_dir)
+        old = RetrievalIndex.load(self.index_dir)
+        self.source.write_text(SAMPLE_DATA + "<s>[INST] Can I change my role? [/INST] No.</s>", encoding="utf-8")
+        new = build_index(self.source, self.index_dir)
+        third = build_index(self.source, self.index_dir)
+
+        self.assertEqual((self.index_dir / "CURRENT").read_text(), third.location)
+        self.assertEqual(len({old.location, new.location, third.location}), 3)
+        # The build before the live one is kept for workers still using it.
+        self.assertEqual(sorted(p.name for p in self.index_dir.iterdir() if p.is_dir()), sorted([new.location, third.location]))
+        self.assertEqual(len(RetrievalIndex.load(self.index_dir)), 4)
+        # A worker still holding the first build's mappings keeps answering.
+        self.assertEqual(old.answer("email verification"), "A verification email with a unique token is sent.")
+
+
+class InferencePoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = InferencePool(kind="thread", max_workers=1, max_pending=2, timeout=5)
+        self.addCleanup(self.pool.shutdown)
+
+    async def test_run_returns_result_and_counts(self):
+        self.assertEqual(await self.pool.run(sum, [1, 2, 3]), 6)
+        stats = self.pool.stats()
+        self.assertEqual(stats["submitted"], 1)
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["pending"], 0)
+
+    async def test_rejects_when_queue_is_full(self):
+        release = threading.Event()
+        running = [asyncio.ensure_future(self.pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with self.assertRaises(PoolBusy):
+            await self.pool.run(sum, [1])
+        release.set()
+        self.assertEqual(await asyncio.gather(*running), [True, True])
+        self.assertEqual(self.pool.stats()["rejected"], 1)
+
+    async def test_timeout_is_counted(self):
+        pool = InferencePool(kind="thread", max_workers=1, max_pending=1, timeout=0.01)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(asyncio.TimeoutError):
+            await pool.run(release.wait)
+        self.assertEqual(pool.stats()["timed_out"], 1)
+
+
+class MessageBufferTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="farmer@example.com", password="foo")
+
+    async def test_flushes_when_full(self):
+        buffer = MessageBuffer(max_size=2, flush_interval=60)
+        await buffer.add(self.user, "user", "hello")
+        self.assertEqual(await Message.objects.acount(), 0)
+        await buffer.add(self.user, "ai", "namaste")
+        self.assertEqual(len(buffer), 0)
+        messages = [m async for m in Message.objects.order_by("id").values_list("sent_by", "message")]
+        self.assertEqual(messages, [("user", "hello"), ("ai", "namaste")])
+        self.assertEqual(buffer.counters["batches"], 1)
+
+    async def test_flushes_after_interval(self):
+        buffer = MessageBuffer(max_size=100, flush_interval=0.01)
+        await buffer.add(self.user, "user", "hello")
+        await asyncio.sleep(0.1)
+        self.assertEqual(await Message.objects.acount(), 1)
+
+    async def test_explicit_flush_drains_buffer(self):
+        buffer = MessageBuffer(max_size=100, flush_interval=60)
+        for i in range(5):
+            await buffer.add(self.user, "user", f"question {i}")
+        self.assertEqual(await buffer.flush(), 5)
+        self.assertEqual(await Message.objects.acount(), 5)
+        self.assertEqual(await buffer.flush(), 0)
+
+    async def test_failed_flush_is_retried_with_backoff(self):
+        real_bulk_create = Message.objects.bulk_create
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(time.monotonic())
+            if len(calls) < 3:
+                raise DatabaseError("database is down")
+            return real_bulk_create(*args, **kwargs)
+
+        buffer = MessageBuffer(max_size=100, flush_interval=0.02)
+        with self.assertLogs("api.chat_log", "ERROR"), mock.patch.object(Message.objects, "bulk_create", flaky):
+            await buffer.add(self.user, "user", "hello")
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if len(calls) == 3:
+                    break
+        self.assertEqual(await Message.objects.acount(), 1)
+        self.assertEqual((buffer.counters["errors"], len(buffer)), (2, 0))
+        self.assertGreater(calls[2] - calls[1], calls[1] - calls[0])
+
+    async def test_buffer_is_capped_while_writes_fail(self):
+        buffer = MessageBuffer(max_size=2, flush_interval=60, max_pending=3)
+        with self.assertLogs("api.chat_log", "WARNING"), \
+                mock.patch.object(Message.objects, "bulk_create", side_effect=DatabaseError("database is down")):
+            for i in range(5):
+                await buffer.add(self.user, "user", f"question {i}")
+        self.assertEqual([m.message for m in buffer._pending], ["question 2", "question 3", "question 4"])
+        self.assertEqual(buffer.counters["dropped"], 2)
+        # Only the first full batch was tried; later adds wait for the retry timer.
+        self.assertEqual(buffer.counters["errors"], 1)
+        buffer._timer.cancel()
+
+
+class AnswerCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source = Path(tmp.name) / "data.txt"
+        source.write_text(SAMPLE_DATA, encoding="utf-8")
+        self.index = RetrievalIndex.build(source)
+        self.cache = AnswerCache(max_entries=2, ttl=60, similarity=0.6)
+
+    def test_normalize_folds_spelling_variants(self):
+        self.assertEqual(normalize("How do I verify my AADHAAR?"), normalize("verify adhar, how"))
+        self.assertEqual(normalize("Kisaan   payment!!"), normalize("payment kisan"))
+
+    def test_normalize_keeps_question_words_and_negations(self):
+        self.assertNotEqual(normalize("when do I get paid"), normalize("how do I get paid"))
+        self.assertNotEqual(normalize("is payment secure"), normalize("is payment not secure"))
+
+    def test_near_hits_need_the_same_question_words(self):
+        self.cache.set("How will the payment gateway ensure secure transactions?", self.index, "how")
+        self.assertIsNone(self.cache.get("Why will the payment gateway ensure secure transactions?", self.index))
+        self.assertEqual(self.cache.get("how will payment gateway ensure secure transaction", self.index), "how")
+
+    def test_rows_are_added_in_batches(self):
+        cache = AnswerCache(max_entries=1000, ttl=60, similarity=0.6)
+        with mock.patch("api.answer_cache.sparse.vstack", wraps=sparse.vstack) as vstack:
+            for i in range(65):
+                cache.set(f"payment gateway question {i}", self.index, str(i))
+        self.assertEqual(vstack.call_count, 1)
+        self.assertEqual((cache._matrix.shape[0], len(cache._pending)), (64, 1))
+        self.assertIsNotNone(cache.get("payment gateway question", self.index))
+
+    def test_exact_and_near_duplicate_hits(self):
+        self.assertIsNone(self.cache.get("Is the payment gateway secure?", self.index))
+        self.cache.set("Is the payment gateway secure?", self.index, "cached")
+        self.assertEqual(self.cache.get("is the PAYMENT gateway secure", self.index), "cached")
+        self.assertEqual(self.cache.get("payment gateway secure transactions?", self.index), "cached")
+        self.assertIsNone(self.cache.get("Does the chatbot speak Hindi?", self.index))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["near_hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_lru_eviction(self):
+        self.cache.set("email verification", self.index, "a")
+        self.cache.set("payment gateway", self.index, "b")
+        self.cache.get("email verification", self.index)
+        self.cache.set("chatbot languages", self.index, "c")
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get("email verification", self.index), "a")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_expired_entries_miss(self):
+        cache = AnswerCache(ttl=-1)
+        cache.set("email verification", self.index, "a")
+        self.assertIsNone(cache.get("email verification", self.index))
+
+    def test_reindex_invalidates(self):
+        self.cache.set("email verification", self.index, "a")
+        self.index.version = "rebuilt"
+        self.assertIsNone(self.cache.get("email verification", self.index))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_fallback_answers_are_not_cached(self):
+        with mock.patch("api.answer_cache.get_index", return_value=self.index), \
+                mock.patch("api.answer_cache.get_answer_cache", return_value=self.cache):
+            self.assertEqual(cached_answer("qwerty"), FALLBACK_ANSWER)
+            self.assertEqual(len(self.cache), 0)
+            self.assertNotEqual(cached_answer("email verification"), FALLBACK_ANSWER)
+            self.assertEqual(len(self.cache), 1)
+
+
+@override_settings(CHAT_STREAM={"CHUNK_WORDS": 2, "WINDOW": 2, "ACK_TIMEOUT": 0.2})
+@mock.patch.object(ChatConsumer, "get_response", mock.AsyncMock(return_value="one two three four five"))
+class ChatStreamingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="farmer@example.com", password="foo")
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/ws/chat/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # welcome message
+        return communicator
+
+    async def test_streams_deltas_then_done(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({"message": "hello", "stream": True})
+        frames = []
+        while True:
+            frame = await communicator.receive_json_from()
+            frames.append(frame)
+            if frame.get("done"):
+                break
+            await communicator.send_json_to({"ack": frame["seq"], "stream": frame["stream"]})
+        self.assertEqual("".join(f["delta"] for f in frames[:-1]), "one two three four five")
+        self.assertEqual(frames[-1], {"done": True, "seq": 3, "stream": 1})
+        await communicator.disconnect()
+
+    async def test_bad_and_stale_acks_are_ignored(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({"message": "hello", "stream": True})
+        await communicator.receive_json_from()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"message": "again", "stream": True})
+        self.assertEqual(await communicator.receive_json_from(), {"delta": "one two ", "seq": 1, "stream": 2})
+        await communicator.receive_json_from()
+        # Junk, acks for the abandoned stream and acks ahead of what was sent
+        # neither crash the consumer nor open the window.
+        for ack in ({"ack": "soon"}, {"ack": None}, {"ack": 2, "stream": 1}, {"ack": 9}):
+            await communicator.send_json_to(ack)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        await communicator.send_json_to({"ack": 2, "stream": 2})
+        self.assertEqual((await communicator.receive_json_from())["seq"], 3)
+        await communicator.disconnect()
+
+    async def test_stops_when_client_falls_behind(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({"message": "hello", "stream": True})
+        self.assertEqual((await communicator.receive_json_from())["seq"], 1)
+        self.assertEqual((await communicator.receive_json_from())["seq"], 2)
+        # No acks were sent, so the window is full and nothing else arrives.
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+        await communicator.disconnect()
+        self.assertEqual(await Message.objects.filter(sent_by="ai").acount(), 1)
+
+    async def test_failed_stream_is_logged_and_reported(self):
+        communicator = await self.connect()
+        with self.assertLogs("api.consumers", "ERROR") as logs, \
+                mock.patch.object(ChatConsumer, "get_response", mock.AsyncMock(side_effect=RuntimeError("index missing"))):
+            await communicator.send_json_to({"message": "hello", "stream": True})
+            self.assertEqual(await communicator.receive_json_from(), {"error": STREAM_ERROR_MESSAGE, "stream": 1})
+        self.assertIn("index missing", logs.output[0])
+        await communicator.disconnect()
+
+    async def test_non_streaming_reply_is_unchanged(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({"message": "hello"})
+        self.assertEqual(await communicator.receive_json_from(), {"message": "one two three four five"})
+        await communicator.disconnect()
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    NOTIFICATIONS_COALESCE_WINDOW=0.05,
+)
+class NotificationConsumerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="farmer@example.com", password="foo")
+
+    async def connect(self, path="/ws/notifications/"):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), path)
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_new_notification_is_published_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Notifications.objects.create(user=self.user, title="Contract", message="Approved")
+        self.assertEqual(len(callbacks), 1)
+
+    async def test_burst_is_coalesced_into_one_frame(self):
+        communicator = await self.connect()
+        layer = get_channel_layer()
+        for i in range(3):
+            await layer.group_send(notification_group(self.user.pk), {
+                "type": "notification.created",
+                "notification": {"id": i, "title": f"n{i}"},
+            })
+        frame = await communicator.receive_json_from()
+        self.assertEqual([n["id"] for n in frame["notifications"]], [0, 1, 2])
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        await communicator.disconnect()
+
+    async def test_catch_up_since_last_seen_id(self):
+        seen = await Notifications.objects.acreate(user=self.user, title="old", message="seen")
+        await Notifications.objects.acreate(user=self.user, title="new", message="missed")
+        communicator = await self.connect(f"/ws/notifications/?since={seen.id}")
+        frame = await communicator.receive_json_from()
+        self.assertEqual([n["title"] for n in frame["notifications"]], ["new"])
+        await communicator.send_json_to({"since": 0})
+        frame = await communicator.receive_json_from()
+        self.assertEqual(len(frame["notifications"]), 2)
+        await communicator.disconnect()
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    EMAIL_OUTBOX={"MAX_ATTEMPTS": 2, "BACKOFF": 60},
+)
+class EmailOutboxTests(TestCase):
+
+    def test_emails_are_queued_not_sent(self):
+        send_notification_email("farmer@example.com", {"title": "Dispute Status Change", "message": "Resolved"})
+        self.assertEqual(len(mail.outbox), 0)
+        row = EmailOutbox.objects.get()
+        self.assertEqual(row.to, ["farmer@example.com"])
+        self.assertEqual(row.status, "pending")
+
+    def test_deliver_sends_batch_over_one_connection(self):
+        for i in range(3):
+            queue_email(f"Subject {i}", "body", "noreply@example.com", [f"user{i}@example.com"], html_message="<p>hi</p>")
+        # Claim (savepoint, select, update, release), then one update per email.
+        with self.assertNumQueries(7):
+            self.assertEqual(deliver_outbox(), 3)
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 0", "Subject 1", "Subject 2"])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        self.assertFalse(EmailOutbox.objects.exclude(status="sent").exists())
+        self.assertEqual(deliver_outbox(), 0)
+
+    def test_failures_back_off_then_dead_letter(self):
+        row = queue_email("Subject", "body", "noreply@example.com", ["user@example.com"])
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("refused")):
+            self.assertEqual(deliver_outbox(), 0)
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts, row.last_error), ("pending", 1, "refused"))
+            self.assertGreater(row.next_attempt_at, row.created_at)
+
+            # Not due yet, so nothing is picked up.
+            self.assertEqual(deliver_outbox(), 0)
+            EmailOutbox.objects.update(next_attempt_at=row.created_at)
+            deliver_outbox()
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ("dead", 2))
+
+    def test_a_dead_worker_resends_only_unrecorded_emails(self):
+        rows = [queue_email(f"Subject {i}", "body", "noreply@example.com", [f"user{i}@example.com"]) for i in range(3)]
+        real_send = mail.get_connection().__class__.send_messages
+
+        def die_on_second(connection, messages):
+            if messages[0].subject == "Subject 1":
+                raise KeyboardInterrupt
+            return real_send(connection, messages)
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", die_on_second):
+            with self.assertRaises(KeyboardInterrupt):
+                deliver_outbox()
+        statuses = list(EmailOutbox.objects.order_by("id").values_list("status", flat=True))
+        self.assertEqual(statuses, ["sent", "sending", "sending"])
+        # Leased rows are left alone until the lease runs out.
+        self.assertEqual(deliver_outbox(), 0)
+        EmailOutbox.objects.filter(status="sending").update(next_attempt_at=rows[0].created_at)
+        self.assertEqual(deliver_outbox(), 2)
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 0", "Subject 1", "Subject 2"])
+
+    def test_command_drains_past_a_failed_batch(self):
+        for i in range(3):
+            queue_email(f"Subject {i}", "body", "noreply@example.com", [f"user{i}@example.com"])
+        real_send = mail.get_connection().__class__.send_messages
+
+        def refuse_first(connection, messages):
+            if messages[0].subject == "Subject 0":
+                raise OSError("refused")
+            return real_send(connection, messages)
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", refuse_first):
+            call_command("send_outbox_emails", batch_size=1, stdout=StringIO())
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 1", "Subject 2"])
+        self.assertEqual(EmailOutbox.objects.get(status="pending").subject, "Subject 0")
+
+
+class ChangeTrackingSignalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.buyer = User.objects.create_user(email="buyer@example.com", password="foo", user_type="buyer")
+        cls.seller = User.objects.create_user(email="farmer@example.com", password="foo", user_type="farmer")
+        cls.template = ContractTemplate.objects.create(
+            submitted_by=cls.buyer,
+            contract_name="Wheat",
+            contract_description="Rabi wheat",
+            contract_file="contract_documents/wheat.pdf",
+            approved=False,
+        )
+        cls.contract = Contract.objects.create(contract_template=cls.template, buyer=cls.buyer, seller=cls.seller)
+        cls.dispute = Dispute.objects.create(contract=cls.contract, raised_by=cls.seller, description="Late payment")
+
+    def setUp(self):
+        EmailOutbox.objects.all().delete()
+
+    def test_unchanged_save_is_a_single_update(self):
+        template = ContractTemplate.objects.get(pk=self.template.pk)
+        with self.assertNumQueries(1):
+            template.save()
+        dispute = Dispute.objects.get(pk=self.dispute.pk)
+        with self.assertNumQueries(1):
+            dispute.save()
+
+    def test_template_approval_notifies_without_refetching(self):
+        template = ContractTemplate.objects.get(pk=self.template.pk)
+        template.approved = True
+        # UPDATE, facet row INSERT and UPDATE, submitted_by lookup, outbox INSERT.
+        with self.assertNumQueries(5):
+            template.save()
+        self.assertEqual(EmailOutbox.objects.get().subject, "Contract Template Approved - Fasal Mitra")
+
+        # Already approved, so a second save does not notify again.
+        template.save()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_dispute_status_change_notifies(self):
+        dispute = Dispute.objects.get(pk=self.dispute.pk)
+        self.assertFalse(dispute.has_changed("status"))
+        dispute.status = "resolved"
+        self.assertEqual(dispute.changed_fields(), ["status"])
+        self.assertEqual(dispute.previous("status"), "pending")
+        dispute.save()
+        self.assertEqual(EmailOutbox.objects.get().subject, "Dispute Status Change - Fasal Mitra")
+        self.assertFalse(dispute.has_changed("status"))
+
+
+class SerializerQuerysetOptimizationTests(TestCase):
+    # serializer, model, expected queries regardless of row count
+    cases = [
+        (GetContractSerializer, Contract, 4),  # contracts, listings, esign_responses, payments
+        (ContractSerializer, Contract, 2),  # contracts, listings
+        (DisputeSerializer, Dispute, 2),  # disputes, listings
+        (OtherUserSerializer, CustomUser, 2),  # users, listings
+    ]
+
+    def assertConstantQueries(self, rows):
+        seed_contracts(rows)
+        for serializer_class, model, expected in self.cases:
+            with self.subTest(serializer=serializer_class.__name__, rows=rows):
+                queryset = optimize_queryset(model.objects.all(), serializer_class)
+                with self.assertNumQueries(expected):
+                    data = serializer_class(queryset, many=True).data
+                self.assertGreaterEqual(len(data), rows)
+
+    def test_one_row(self):
+        self.assertConstantQueries(1)
+
+    def test_thousand_rows(self):
+        self.assertConstantQueries(1000)
+
+
+class CachedContractView(CachedContractDetailMixin, OptimizedQuerysetMixin, RetrieveAPIView):
+    queryset = Contract.objects.all()
+    serializer_class = GetContractSerializer
+
+
+class CachedContractDetailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_contracts(1)
+        cls.contract = Contract.objects.get()
+
+    def setUp(self):
+        cache.clear()
+        self.view = CachedContractView.as_view()
+
+    def get(self, user=None, **headers):
+        request = APIRequestFactory().get(f"/api/v1/contracts/{self.contract.pk}/", headers=headers)
+        force_authenticate(request, user=user or self.contract.buyer)
+        return self.view(request, pk=self.contract.pk)
+
+    def test_hit_makes_no_queries_and_honours_etag(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+        with self.assertNumQueries(0):
+            not_modified = self.get(if_none_match=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_if_none_match_lists_and_wildcard(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(if_none_match=f'"stale", W/{etag}').status_code, 304)
+        self.assertEqual(self.get(if_none_match="*").status_code, 304)
+        self.assertEqual(self.get(if_none_match=f'"{etag[1:-2]}", "x{etag[1:]}').status_code, 200)
+
+    def test_payment_change_invalidates(self):
+        first = self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(order__contract=self.contract).get().delete()
+        second = self.get(if_none_match=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data["order"]["payments"], [])
+
+    def test_profile_change_invalidates(self):
+        first = self.get()
+        profile = FarmerProfile.objects.get(user=self.contract.seller)
+        profile.bio = "Organic farmer"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        second = self.get()
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.data["seller"]["farmer_profile"]["bio"], "Organic farmer")
+
+    def test_other_users_do_not_get_cached_copy(self):
+        self.get()
+        stranger = CustomUser.objects.create(email="stranger@example.com")
+        with CaptureQueriesContext(connection) as ctx:
+            # Falls through to get_object(); the view decides access.
+            self.get(user=stranger)
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="farmer@example.com")
+        Notifications.objects.bulk_create([Notifications(user=cls.user, title=str(i), message="") for i in range(25)])
+        # Force ties on created_at so the id tie-break is exercised.
+        first = Notifications.objects.order_by("id").first()
+        Notifications.objects.filter(id__lte=first.id + 9).update(created_at=first.created_at)
+
+    def page(self, **params):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get("/api/v1/notifications/", params))
+        rows = paginator.paginate_queryset(Notifications.objects.all(), request)
+        return rows, paginator
+
+    def test_walks_every_row_once_newest_first(self):
+        seen, params = [], {"page_size": 4}
+        while True:
+            rows, paginator = self.page(**params)
+            seen.extend(rows)
+            if paginator.next_cursor is None:
+                break
+            params["cursor"] = paginator.next_cursor
+        expected = list(Notifications.objects.order_by("-created_at", "-id"))
+        self.assertEqual(seen, expected)
+
+    def test_page_is_a_single_query(self):
+        _, paginator = self.page(page_size=5)
+        with self.assertNumQueries(1):
+            rows, _ = self.page(page_size=5, cursor=paginator.next_cursor)
+        self.assertEqual(len(rows), 5)
+
+    def test_malformed_cursors_are_not_found(self):
+        created_at = Notifications.objects.first().created_at
+        for raw in (f"{created_at.isoformat()}|abc", f"{created_at.replace(tzinfo=None).isoformat()}|1", "not a cursor", f"{created_at.isoformat()}|"):
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            with self.subTest(raw=raw), self.assertRaises(NotFound):
+                self.page(cursor=cursor)
+
+    def test_response_links_next_page(self):
+        rows, paginator = self.page(page_size=30)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(paginator.get_paginated_response([]).data, {"next": None, "results": []})
+        _, paginator = self.page(page_size=10)
+        self.assertIn("cursor=", paginator.get_paginated_response([]).data["next"])
+
+
+class ContractListView(OptimizedQuerysetMixin, ListAPIView):
+    queryset = Contract.objects.all()
+    serializer_class = GetContractSerializer
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_contracts(3)
+
+    def get(self, **params):
+        request = APIRequestFactory().get("/api/v1/contracts/", params)
+        force_authenticate(request, user=CustomUser.objects.first())
+        with CaptureQueriesContext(connection) as ctx:
+            response = ContractListView.as_view()(request)
+        return response.data, ctx.captured_queries
+
+    def test_no_params_keeps_full_output(self):
+        data, queries = self.get()
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(set(data[0]), set(GetContractSerializer().fields))
+        self.assertIn("payments", data[0]["order"])
+
+    def test_fields_selects_nested_paths_and_collapses_relations(self):
+        data, queries = self.get(fields="id,status,seller.email,order,esign_responses")
+        row = data[0]
+        self.assertEqual(set(row), {"id", "status", "seller", "order", "esign_responses"})
+        self.assertEqual(set(row["seller"]), {"email"})
+        contract = Contract.objects.get(pk=row["id"])
+        self.assertEqual(row["order"], contract.order.pk)
+        self.assertEqual(row["esign_responses"], [contract.esign_responses.get().pk])
+        # Contracts with seller and order joined, then e-sign keys; no listings or payments.
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("signed_contract", queries[0]["sql"])
+        self.assertNotIn("signing_link", queries[1]["sql"])
+
+    def test_expand_renders_nested_in_full(self):
+        data, queries = self.get(fields="id,order", expand="order")
+        self.assertEqual(set(data[0]["order"]), set(OrderSerializer().fields))
+        self.assertEqual(len(queries), 2)  # contracts with orders, payments
+
+    def test_dotted_fields_inside_lists(self):
+        data, _ = self.get(fields="id,order.amount,order.payments.stage")
+        self.assertEqual(data[0]["order"]["payments"], [{"stage": "advance"}])
+
+    def test_writes_ignore_fields(self):
+        dispute = Dispute.objects.first()
+        request = APIRequestFactory().patch("/api/v1/disputes/?fields=id")
+        serializer = AdminDisputeSerializer(
+            dispute, data={"status": "resolved", "admin_comment": "Paid"}, partial=True, context={"request": request},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data, {"status": "resolved", "admin_comment": "Paid"})
+        serializer.save()
+        dispute.refresh_from_db()
+        self.assertEqual((dispute.status, dispute.admin_comment), ("resolved", "Paid"))
+
+
+class ContractTemplateFacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CustomUser.objects.create(email="company@example.com", user_type="company")
+        cls.wheat = CropListingTemplate.objects.create(name="Wheat", crop_type="rabi", description="", image="crop_images/w.jpg")
+        cls.rice = CropListingTemplate.objects.create(name="Rice", crop_type="kharif", description="", image="crop_images/r.jpg")
+
+    def template(self, crop, price, quintal=20, approved=True):
+        return ContractTemplate.objects.create(
+            submitted_by=self.company, contract_name="Bulk", contract_description="", contract_file="c.pdf",
+            crop=crop, price=price, total_quintal_required=quintal, approved=approved,
+        )
+
+    def assertMatchesRecount(self):
+        maintained = facet_counts()
+        rebuild_facets()
+        self.assertEqual(maintained, facet_counts())
+
+    def test_counts_follow_save_and_delete(self):
+        first = self.template(self.wheat, 800)
+        self.template(self.wheat, 2500, approved=False)
+        self.template(self.rice, 60000, quintal=600)
+        self.assertEqual(facet_counts(), {
+            "approved": {"true": 2, "false": 1},
+            "crop": {str(self.wheat.pk): 2, str(self.rice.pk): 1},
+            "crop_type": {"rabi": 2, "kharif": 1},
+            "price": {"0-1000": 1, "1000-5000": 1, "50000-100000": 1},
+            "quintal": {"10-50": 2, "500-1000": 1},
+        })
+
+        first = ContractTemplate.objects.get(pk=first.pk)
+        first.crop, first.price, first.approved = self.rice, 1200, False
+        first.save()
+        self.assertMatchesRecount()
+        self.assertEqual(facet_counts({"approved": False})["crop_type"], {"rabi": 1, "kharif": 1})
+
+        first.delete()
+        self.assertMatchesRecount()
+
+    def test_crop_season_change_moves_templates(self):
+        self.template(self.wheat, 800)
+        self.template(self.wheat, 900)
+        wheat = CropListingTemplate.objects.get(pk=self.wheat.pk)
+        wheat.crop_type = "zaid"
+        wheat.save()
+        self.assertEqual(facet_counts()["crop_type"], {"zaid": 2})
+        self.assertMatchesRecount()
+
+    def test_price_change_touches_only_the_price_facet(self):
+        template = ContractTemplate.objects.get(pk=self.template(self.wheat, 800).pk)
+        template.price = 1500
+        # UPDATE, then the facet row INSERT and UPDATE; the crop is not looked up.
+        with self.assertNumQueries(3):
+            template.save()
+        self.assertEqual(facet_counts()["price"], {"1000-5000": 1})
+
+    def test_migration_backfill_matches_recount(self):
+        from django.apps import apps
+        backfill = import_module("api.migrations.0006_contract_template_facets").count_existing_templates
+        self.template(self.wheat, 800)
+        self.template(self.wheat, 2500, approved=False)
+        self.template(self.rice, 60000, quintal=600)
+        rebuild_facets()
+        expected = facet_counts()
+        ContractTemplateFacet.objects.all().delete()
+        backfill(apps, None)
+        self.assertEqual(facet_counts(), expected)
+
+    def test_unfiltered_counts_are_one_query(self):
+        for price in (100, 2000, 7000):
+            self.template(self.wheat, price)
+        with self.assertNumQueries(1):
+            facet_counts({"approved": True})
+
+    def test_filters(self):
+        self.template(self.wheat, 800)
+        cheap_rice = self.template(self.rice, 900)
+        self.template(self.rice, 9000)
+        filters = parse_filters(QueryDict("crop_type=kharif&max_price=1000&approved=true"))
+        self.assertEqual(list(apply_filters(ContractTemplate.objects.all(), filters)), [cheap_rice])
+        self.assertEqual(facet_counts(filters)["crop"], {str(self.rice.pk): 1})
+        with self.assertRaises(ValidationError):
+            parse_filters(QueryDict("min_price=cheap"))
+
+
+class NotificationCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="farmer@example.com")
+        for type_of in ("info", "payment", "payment", "contract"):
+            Notifications.objects.create(user=cls.user, title=type_of, message="", type_of=type_of)
+
+    def test_counter_follows_create_read_and_delete(self):
+        self.assertEqual(unread_count(self.user.pk), 4)
+        notification = Notifications.objects.filter(type_of="info").get()
+        notification.is_read = True
+        notification.save()
+        self.assertEqual(unread_count(self.user.pk), 3)
+        notification.delete()
+        Notifications.objects.filter(type_of="contract").get().delete()
+        self.assertEqual(unread_count(self.user.pk), 2)
+        self.assertEqual(unread_count(CustomUser.objects.create(email="new@example.com").pk), 0)
+
+    def test_badge_is_a_primary_key_lookup(self):
+        with CaptureQueriesContext(connection) as ctx:
+            unread_count(self.user.pk)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('"api_notificationcounter"."user_id" = ', ctx.captured_queries[0]["sql"])
+
+    def test_mark_read_by_type_and_up_to_id(self):
+        self.assertEqual(mark_read(self.user.pk, type_of="payment"), 2)
+        self.assertEqual(unread_count(self.user.pk), 2)
+        first = Notifications.objects.order_by("id").first()
+        self.assertEqual(mark_read(self.user.pk, up_to_id=first.pk), 1)
+        self.assertEqual(mark_read(self.user.pk), 1)
+        self.assertEqual(unread_count(self.user.pk), 0)
+        self.assertFalse(Notifications.objects.filter(is_read=False).exists())
+
+    def test_mark_read_endpoint(self):
+        request = APIRequestFactory().post("/api/v1/notifications/mark-read/", {"type_of": "payment"}, format="json")
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = MarkNotificationsReadView.as_view()(request)
+        self.assertEqual(response.data, {"marked": 2, "unread": 2})
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)  # notifications, counter
+
+        request = APIRequestFactory().post("/api/v1/notifications/mark-read/", {"type_of": "spam"}, format="json")
+        force_authenticate(request, user=self.user)
+        self.assertEqual(MarkNotificationsReadView.as_view()(request).status_code, 400)
+
+
+class MetricsProbeView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        time.sleep(float(request.GET.get("sleep", 0)))
+        return Response({"contracts": Contract.objects.count(), "users": CustomUser.objects.count()})
+
+
+urlpatterns = [
+    path("probe/<int:pk>/", MetricsProbeView.as_view(), name="metrics-probe"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("schema/", CachedSpectacularAPIView.as_view(), name="schema"),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+@modify_settings(MIDDLEWARE={"prepend": "api.metrics.MetricsMiddleware"})
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(email="staff@example.com", is_staff=True)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_patch = override_settings(METRICS={"DIR": self.tmp.name, "FLUSH_INTERVAL": 3600})
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_records_requests_per_url_name(self):
+        for pk in (1, 2):
+            self.client.get(f"/probe/{pk}/")
+        text = self.scrape()
+        self.assertIn('http_requests_total{endpoint="metrics-probe",method="GET",status="200"} 2', text)
+        self.assertIn('http_queries_bucket{endpoint="metrics-probe",method="GET",le="2"} 2', text)
+        self.assertIn('http_queries_sum{endpoint="metrics-probe",method="GET"} 4', text)
+        self.assertIn('http_duration_seconds_count{endpoint="metrics-probe",method="GET"} 2', text)
+        self.assertIn('# TYPE http_size_bytes histogram', text)
+
+    def test_merges_other_worker_files(self):
+        self.client.get("/probe/1/")
+        metrics.flush()
+        own = Path(self.tmp.name) / f"metrics-{os.getpid()}.json"
+        (Path(self.tmp.name) / "metrics-1.json").write_text(own.read_text())
+        self.assertIn('http_requests_total{endpoint="metrics-probe",method="GET",status="200"} 2', self.scrape())
+
+    def test_dead_and_stale_worker_files_are_dropped(self):
+        self.client.get("/probe/1/")
+        metrics.flush()
+        own = Path(self.tmp.name) / f"metrics-{os.getpid()}.json"
+        dead = subprocess.Popen([sys.executable, "-c", ""])
+        dead.wait()
+        dead_file = Path(self.tmp.name) / f"metrics-{dead.pid}.json"
+        dead_file.write_text(own.read_text())
+        stale_file = Path(self.tmp.name) / "metrics-1.json"
+        stale_file.write_text(own.read_text())
+        os.utime(stale_file, (time.time() - 3600,) * 2)
+        self.assertIn('http_requests_total{endpoint="metrics-probe",method="GET",status="200"} 1', self.scrape())
+        self.assertFalse(dead_file.exists() or stale_file.exists())
+
+    def test_requests_do_not_flush(self):
+        with mock.patch.object(metrics, "flush") as flush:
+            self.client.get("/probe/1/")
+        flush.assert_not_called()
+
+    def test_staff_only(self):
+        self.client.force_login(CustomUser.objects.create(email="farmer@example.com"))
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+
+    async def test_chat_events_are_recorded(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/ws/chat/")
+        communicator.scope["user"] = await database_sync_to_async(CustomUser.objects.get)(pk=self.staff.pk)
+        await communicator.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"ack": 1})
+        await communicator.send_json_to({"cancel": True})
+        await communicator.receive_nothing(timeout=0.1)
+        await communicator.disconnect()
+        counters, _ = metrics.snapshot()
+        self.assertEqual(counters[("ws_requests_total", ("chat", "ack", "ok"))], 1)
+        self.assertEqual(counters[("ws_requests_total", ("chat", "cancel", "ok"))], 1)
+
+
+@override_settings(ROOT_URLCONF=__name__, PROFILING={"INTERVAL": 0.001})
+@modify_settings(MIDDLEWARE={"append": "api.profiling.ProfilingMiddleware"})
+class ProfilingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(email="staff@example.com", is_staff=True)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        storage = override_settings(PROFILING={"INTERVAL": 0.001, "STORAGE_ROOT": self.tmp.name})
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/probe/1/?sleep=0.05", headers={"X-Profile": "1"})
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.view_name, profile.status_code, profile.user), ("metrics-probe", 200, self.staff))
+        # Session and user lookups, then the view's two counts.
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertEqual(sum("COUNT(*)" in query["sql"] for query in profile.queries), 2)
+        self.assertGreater(profile.samples, 0)
+        self.assertIn("api.tests:get:", profile.stacks.read().decode())
+        # Private storage, unguessable name, no public URL.
+        self.assertTrue(profile.stacks.path.startswith(self.tmp.name))
+        self.assertRegex(profile.stacks.name, r"^profiles/[0-9a-f]{32}\.collapsed$")
+        with self.assertRaises(ValueError):
+            profile.stacks.url
+
+    def test_bearer_token_staff_is_profiled(self):
+        token = AccessToken.for_user(self.staff)
+        response = self.client.get("/probe/1/", headers={"X-Profile": "1", "Authorization": f"Bearer {token}"})
+        self.assertEqual(RequestProfile.objects.get(pk=response["X-Profile-Id"]).user, self.staff)
+
+    def test_query_flag_and_unflagged_requests(self):
+        self.client.force_login(self.staff)
+        self.assertNotIn("X-Profile-Id", self.client.get("/probe/1/"))
+        self.assertIn("X-Profile-Id", self.client.get("/probe/1/?_profile=1"))
+
+    def test_non_staff_requests_are_not_profiled(self):
+        self.client.force_login(CustomUser.objects.create(email="farmer@example.com"))
+        with mock.patch("api.profiling.StackSampler") as sampler, mock.patch("api.profiling._slots") as slots:
+            response = self.client.get("/probe/1/", headers={"X-Profile": "1"})
+            self.client.logout()
+            self.client.get("/probe/1/?_profile=1")
+        self.assertEqual(response.status_code, 200)
+        sampler.assert_not_called()
+        slots.acquire.assert_not_called()
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class ApiRouteQueryBudgetTests(testing.RouteQueryBudgetTestCase):
+    urlconf = "api.urls"
+
+    def seed(self, n, start):
+        seed_contracts(n, start)
+
+    def route_kwargs(self):
+        contract = Contract.objects.order_by("pk").select_related("buyer").first()
+        return contract.buyer, {"pk": contract.pk}
+
+
+class RouteQueryBudgetHooksTests(SimpleTestCase):
+
+    def test_subclasses_must_define_the_hooks(self):
+        with self.assertRaisesMessage(TypeError, "must define urlconf, route_kwargs"):
+            type("Incomplete", (testing.RouteQueryBudgetTestCase,), {"seed": lambda self, n, start: None})
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CachedSchemaTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "openapi.json"
+        settings_patch = override_settings(OPENAPI_SCHEMA_PATH=self.path)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        reset_schema()
+        self.addCleanup(reset_schema)
+
+    def test_generated_once_and_revalidated_by_etag(self):
+        with mock.patch("api.schema.generate_schema", wraps=generate_schema) as generate:
+            first = self.client.get("/schema/")
+            second = self.client.get("/schema/", HTTP_ACCEPT="application/json")
+            not_modified = self.client.get("/schema/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first["Content-Type"].startswith("application/vnd.oai.openapi"))
+        self.assertIn(b"/probe/{id}/", first.content)
+        self.assertIn("/probe/{id}/", json.loads(second.content)["paths"])
+        self.assertNotEqual(first["ETag"], second["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], first["ETag"])
+
+    def test_if_none_match_is_compared_per_tag(self):
+        etag = self.client.get("/schema/")["ETag"]
+        self.assertEqual(self.client.get("/schema/", HTTP_IF_NONE_MATCH=f'"other", {etag}').status_code, 304)
+        self.assertEqual(self.client.get("/schema/", HTTP_IF_NONE_MATCH="*").status_code, 304)
+        # The old substring check matched a tag that merely contains this one.
+        self.assertEqual(self.client.get("/schema/", HTTP_IF_NONE_MATCH=f'"x{etag}"').status_code, 200)
+
+    def test_serves_the_built_file(self):
+        call_command("generate_schema", stdout=StringIO())
+        self.assertIn("/probe/{id}/", json.loads(self.path.read_text())["paths"])
+        with mock.patch("api.schema.generate_schema") as generate:
+            body, _ = get_schema().get("json")
+        generate.assert_not_called()
+        self.assertIn("/probe/{id}/", json.loads(body)["paths"])
@@ -1,13 +1,16 @@
 from django.urls import path
 from .views import Home, ConractTemplateListCreateView, ContractView, DisputeListCreateView, AdminDisputeResolveView, CropListingTemplateView, GetContractView, EsignatureWebhookView, TenderApplicationView, TransportationTenderView, EsignBuyerView
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from drf_spectacular.views import SpectacularRedocView, SpectacularSwaggerView
 from users.views import OtherUserView
+from .metrics import MetricsView
+from .schema import CachedSpectacularAPIView
+from .notifications import MarkNotificationsReadView, UnreadNotificationCountView
 
 
 urlpatterns = [
     path('', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('ping/', Home.as_view()),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/schema/', CachedSpectacularAPIView.as_view(), name='schema'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('business/contract-templates/', ConractTemplateListCreateView.as_view()),
     path('contracts/', ContractView.as_view()),
@@ -20,4 +23,7 @@ urlpatterns = [
     path('tender-application/', TenderApplicationView.as_view()),
     path('transportation-tenders/', TransportationTenderView.as_view()),
     path('esign-buyer/<int:pk>/', EsignBuyerView.as_view()),
+    path('notifications/unread-count/', UnreadNotificationCountView.as_view(), name='notification-unread-count'),
+    path('notifications/mark-read/', MarkNotificationsReadView.as_view(), name='notification-mark-read'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -13,16 +13,16 @@ django.setup()
 
 django_asgi_app = get_asgi_application()
 
-from django_channels_jwt.middleware import JwtAuthMiddlewareStack
 from api.routing import websocket_urlpatterns
+from users.auth_cache import CachedTicketAuthMiddleware
+
+websocket_app = URLRouter(
+    websocket_urlpatterns,
+)
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
-        "websocket": JwtAuthMiddlewareStack(
-        URLRouter(
-            websocket_urlpatterns,
-        )
-    ),
+        "websocket": CachedTicketAuthMiddleware(websocket_app),
     }
 )
\ No newline at end of file
@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -24,6 +24,7 @@ from rest_framework_simplejwt.views import (
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import urls as auth_urls
+from users.auth_cache import WebsocketTicketView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -34,7 +35,7 @@ urlpatterns = [
     path('api/v1/auth/', include('dj_rest_auth.urls')),
     path('api/v1/auth/registration/', include('dj_rest_auth.registration.urls')),
     path('accounts/', include(auth_urls)),
-    path("api/v1/ws-auth/", include('django_channels_jwt.urls'), name='ws-auth'),
+    re_path(r"^api/v1/ws-auth/auth_for_ws_connection/?$", WebsocketTicketView.as_view(), name='ws-auth'),
     path('api/v1/allauth/', include('allauth.urls')),
     path('api/v1/verification/', include('users.urls')),
     path('api/v1/payments/', include('payments.urls')),
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Order, Payment
+from .models import Order, Payment, PaymentEvent, PaymentLedger
 
 admin.site.register(Order)
 admin.site.register(Payment)
+admin.site.register(PaymentEvent)
+admin.site.register(PaymentLedger)
@@ -0,0 +1,153 @@
+"""
+Razorpay webhook ingestion.
+
+``RazorpayWebhookView`` checks the ``X-Razorpay-Signature`` HMAC, stores the
+delivery as a ``PaymentEvent`` with one ``INSERT ... ON CONFLICT DO NOTHING``
+on its event id (Razorpay retries deliveries, so duplicates are expected)
+and answers 200 straight away. ``manage.py apply_payment_events`` picks the
+stored events up in arrival order, groups them per Razorpay order and moves
+the matching ``Payment`` and its ``Order`` forward, with one bulk update per
+batch.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from razorpay.errors import SignatureVerificationError
+from razorpay.utility.utility import Utility
+
+from .ledger import refresh_ledgers
+from .models import STATUS_RANK, Order, Payment, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BATCH_SIZE": 500,
+    "INTERVAL": 0.5,
+}
+
+# webhook event -> Payment.status it implies
+EVENT_STATUS = {
+    "payment.authorized": "authorized",
+    "payment.captured": "captured",
+    "payment.failed": "failed",
+    "order.paid": "captured",
+    "refund.processed": "refunded",
+}
+
+
+def events_setting(name):
+    return getattr(settings, "PAYMENT_EVENTS", {}).get(name, DEFAULTS[name])
+
+
+def verify_signature(body, signature):
+    secret = getattr(settings, "RAZORPAY_WEBHOOK_SECRET", None)
+    if not secret:
+        logger.error("RAZORPAY_WEBHOOK_SECRET is not set; rejecting webhook")
+        return False
+    try:
+        return Utility(None).verify_webhook_signature(body.decode(), signature or "", secret)
+    except (SignatureVerificationError, UnicodeDecodeError):
+        return False
+
+
+def _entity(data, name):
+    payload = data.get("payload")
+    wrapper = payload.get(name) if isinstance(payload, dict) else None
+    entity = wrapper.get("entity") if isinstance(wrapper, dict) else None
+    return entity if isinstance(entity, dict) else {}
+
+
+def parse_event(body, event_id=None):
+    """An unsaved ``PaymentEvent`` for a webhook body; ValueError if it is not one."""
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Webhook body is not a JSON object")
+    payment, order = _entity(data, "payment"), _entity(data, "order")
+    occurred = data.get("created_at")
+    try:
+        occurred_at = datetime.fromtimestamp(occurred, dt_timezone.utc) if occurred else timezone.now()
+    except (TypeError, OverflowError, OSError):
+        raise ValueError(f"Invalid created_at: {occurred!r}")
+    return PaymentEvent(
+        event_id=event_id or hashlib.sha256(body).hexdigest(),
+        event=str(data.get("event", "")),
+        razorpay_order_id=str(payment.get("order_id") or order.get("id") or ""),
+        payload=data,
+        occurred_at=occurred_at,
+    )
+
+
+def record_event(event):
+    """Store ``event`` unless its id was seen before."""
+    PaymentEvent.objects.bulk_create([event], ignore_conflicts=True)
+
+
+def advance(payment, event):
+    """Apply one event to ``payment``; statuses only move forward. True if it changed."""
+    status = EVENT_STATUS.get(event.event)
+    if status is None or STATUS_RANK[status] <= STATUS_RANK.get(payment.status, -1):
+        return False
+    payment.status = status
+    entity = _entity(event.payload, "payment")
+    payment.method = entity.get("method") or payment.method
+    payment.contact = entity.get("contact") or payment.contact
+    return True
+
+
+@transaction.atomic
+def apply_events(batch_size=None):
+    """Apply the oldest unprocessed events; returns how many were processed."""
+    events = list(
+        PaymentEvent.objects.filter(processed_at__isnull=True)
+        .order_by("occurred_at", "pk")
+        .select_for_update(skip_locked=True)[:batch_size or events_setting("BATCH_SIZE")]
+    )
+    if not events:
+        return 0
+
+    by_order = defaultdict(list)
+    for event in events:
+        by_order[event.razorpay_order_id].append(event)
+    payments = {
+        payment.payment_id: payment
+        # Locked, so the reconciler's conditional write waits for this batch.
+        for payment in Payment.objects.select_related("order").select_for_update(of=("self",))
+        .filter(payment_id__in=[pk for pk in by_order if pk])
+    }
+
+    changed_payments, changed_orders = {}, {}
+    for razorpay_order_id, order_events in by_order.items():
+        payment = payments.get(razorpay_order_id)
+        if payment is None:
+            logger.warning("No payment for Razorpay order %r; skipping %d events", razorpay_order_id, len(order_events))
+            continue
+        for event in order_events:
+            if advance(payment, event):
+                changed_payments[payment.pk] = payment
+        if payment.order.advance(payment):
+            changed_orders[payment.order.pk] = payment.order
+
+    if changed_payments:
+        Payment.objects.bulk_update(changed_payments.values(), ["status", "method", "contact"])
+        refresh_ledgers({payment.order_id for payment in changed_payments.values()})
+    if changed_orders:
+        Order.objects.bulk_update(changed_orders.values(), ["status"])
+    PaymentEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+    return len(events)
+
+
+def run_forever(interval=None):
+    interval = interval or events_setting("INTERVAL")
+    while True:
+        close_old_connections()
+        # Drain the backlog before waiting again.
+        while apply_events():
+            pass
+        time.sleep(interval)
@@ -0,0 +1,29 @@
+"""
+Razorpay client construction.
+
+Every client talks to Razorpay over its own ``requests.Session`` with a
+connection pool sized for the number of threads that will share it, so
+concurrent calls reuse TLS connections instead of opening one per request.
+"""
+import razorpay
+import requests
+from django.conf import settings
+from razorpay.constants.url import URL
+from requests.adapters import HTTPAdapter
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def make_client(pool_size=10):
+    """A Razorpay client on a pooled session, pointed at ``RAZORPAY_BASE_URL`` if set."""
+    return razorpay.Client(
+        session=make_session(pool_size),
+        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+        base_url=getattr(settings, "RAZORPAY_BASE_URL", URL.BASE_URL),
+    )
@@ -0,0 +1,125 @@
+"""
+``Idempotency-Key`` support for payment views.
+
+The first request carrying a key claims an ``IdempotencyKey`` row (unique per
+user and key) and runs; its response is stored on the row. A retry with the
+same key is answered from the row without running the view again, and a
+retry arriving while the first request is still running waits for it (up to
+``WAIT`` seconds, then 409). Reusing a key for a different request is a 422.
+
+Claims left behind by a crashed worker are taken over after ``LOCK_TIMEOUT``,
+and completed keys are forgotten after ``TTL``. Server errors are not
+stored, so the client can retry them.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+DEFAULTS = {
+    "HEADER": "Idempotency-Key",
+    "WAIT": 10,
+    "POLL_INTERVAL": 0.05,
+    "LOCK_TIMEOUT": timedelta(minutes=1),
+    "TTL": timedelta(hours=24),
+}
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def idempotency_setting(name):
+    return getattr(settings, "IDEMPOTENCY", {}).get(name, DEFAULTS[name])
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(f"{request.method} {request.get_full_path()}".encode()).hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """``(record, owned)``: the key's row, and whether this request should run."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint, created_at=now), True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        # The owner failed and released the key in the meantime.
+        return claim(user, key, fingerprint)
+    # Take over an expired key, or a claim whose owner died, with a
+    # conditional update so only one retry wins.
+    if record.status_code is None:
+        stale = Q(status_code__isnull=True, created_at__lt=now - idempotency_setting("LOCK_TIMEOUT"))
+    else:
+        stale = Q(status_code__isnull=False, created_at__lt=now - idempotency_setting("TTL"))
+    if IdempotencyKey.objects.filter(stale, pk=record.pk).update(fingerprint=fingerprint, status_code=None, response=None, created_at=now):
+        record.fingerprint, record.status_code, record.response, record.created_at = fingerprint, None, None, now
+        return record, True
+    return record, False
+
+
+def wait_for(record):
+    """Poll until the owner of ``record`` stores its response, or give up after ``WAIT``."""
+    deadline = time.monotonic() + idempotency_setting("WAIT")
+    while record.status_code is None and time.monotonic() < deadline:
+        time.sleep(idempotency_setting("POLL_INTERVAL"))
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+
+def replay(record):
+    response = Response(record.response, status=record.status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(handler):
+    """Make a view method honour ``Idempotency-Key`` for authenticated users."""
+
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(idempotency_setting("HEADER"))
+        if not key or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+
+        fingerprint = request_fingerprint(request)
+        record, owned = claim(request.user, key[:255], fingerprint)
+        if not owned:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {"error": "Idempotency-Key was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            record = wait_for(record)
+            if record is None or record.status_code is None:
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still in progress"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return replay(record)
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code, record.response = response.status_code, response.data
+            record.save(update_fields=["status_code", "response"])
+        return response
+
+    return wrapper
@@ -0,0 +1,95 @@
+"""
+Per-contract payment ledger.
+
+``PaymentLedger`` holds, for each contract with an order, the amount due,
+what has been captured for the advance and final stages, what is still
+outstanding and how far each stage has got. ``refresh_ledgers`` recomputes
+the rows of some orders with two reads and one upsert; it runs in the same
+transaction as every change to an order, a payment status or the price and
+parties of a contract (see
+``payments.signals`` and the bulk updates in ``reconciler`` and ``events``),
+so readers never see a ledger that disagrees with the payments.
+
+Orders are provisioned when a contract is approved, not when someone first
+looks at its payment page.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from .models import STATUS_RANK, Order, Payment, PaymentLedger
+
+STAGES = ("advance", "final")
+UPDATE_FIELDS = [
+    "order", "buyer", "seller", "currency", "total", "advance_paid", "final_paid",
+    "outstanding", "advance_status", "final_status", "updated_at",
+]
+
+
+def build_ledgers(orders, payments):
+    """
+    Ledger field values, one dict per order. ``orders`` and ``payments`` are
+    rows as returned by ``ledger_sources``.
+    """
+    paid = defaultdict(Decimal)
+    furthest = {}
+    for payment in payments:
+        key = (payment["order_id"], payment["stage"])
+        if payment["status"] == "captured":
+            paid[key] += payment["amount"]
+        if STATUS_RANK.get(payment["status"], -1) > STATUS_RANK.get(furthest.get(key), -1):
+            furthest[key] = payment["status"]
+
+    ledgers = []
+    for order in orders:
+        values = {
+            "contract_id": order["contract_id"],
+            "order_id": order["pk"],
+            "buyer_id": order["contract__buyer_id"],
+            "seller_id": order["contract__seller_id"],
+            "currency": order["currency"],
+            "total": order["amount"],
+        }
+        for stage in STAGES:
+            values[f"{stage}_paid"] = paid[order["pk"], stage]
+            values[f"{stage}_status"] = furthest.get((order["pk"], stage), "")
+        values["outstanding"] = max(order["amount"] - values["advance_paid"] - values["final_paid"], Decimal(0))
+        ledgers.append(values)
+    return ledgers
+
+
+def ledger_sources(orders):
+    orders = list(orders.filter(contract__isnull=False).values(
+        "pk", "contract_id", "contract__buyer_id", "contract__seller_id", "amount", "currency",
+    ))
+    payments = Payment.objects.filter(order_id__in=[order["pk"] for order in orders]).values("order_id", "stage", "status", "amount")
+    return orders, list(payments)
+
+
+def _refresh(orders):
+    orders, payments = ledger_sources(orders)
+    if not orders:
+        return
+    PaymentLedger.objects.bulk_create(
+        [PaymentLedger(**values) for values in build_ledgers(orders, payments)],
+        update_conflicts=True,
+        unique_fields=["contract"],
+        update_fields=UPDATE_FIELDS,
+    )
+
+
+def refresh_ledgers(order_ids):
+    """Recompute the ledger rows of ``order_ids``."""
+    order_ids = list(order_ids)
+    if order_ids:
+        _refresh(Order.objects.filter(pk__in=order_ids))
+
+
+def refresh_contract_ledger(contract_id):
+    """Recompute the ledger row of a contract, if it has an order."""
+    _refresh(Order.objects.filter(contract_id=contract_id))
+
+
+def provision_order(contract):
+    """The contract's order, created (along with its ledger row) if it has none yet."""
+    order, _ = Order.objects.get_or_create(contract=contract)
+    return order
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from payments.events import apply_events, run_forever
+
+
+class Command(BaseCommand):
+    help = "Apply stored Razorpay webhook events to payments and orders. Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Apply the current backlog and exit.")
+        parser.add_argument("--interval", type=float, default=None, help="Seconds to wait when there is nothing to apply.")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            applied = 0
+            while count := apply_events():
+                applied += count
+            self.stdout.write(self.style.SUCCESS(f"Applied {applied} events"))
+            return
+        run_forever(options["interval"])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from payments.reconciler import Reconciler
+
+
+class Command(BaseCommand):
+    help = "Keep created/authorized payments in step with Razorpay. Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Check every pending payment once and exit.")
+        parser.add_argument("--interval", type=float, default=None, help="Seconds between passes.")
+        parser.add_argument("--concurrency", type=int, default=None, help="Razorpay calls in flight at once.")
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        reconciler = Reconciler(concurrency=options["concurrency"], batch_size=options["batch_size"])
+        if options["once"]:
+            updated = reconciler.run_once()
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} payments"))
+            return
+        reconciler.run_forever(options["interval"])
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 06:54
+
+import django.db.models.deletion
+import payments.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.CharField(default=payments.models.random_order_id, max_length=255, primary_key=True, serialize=False, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='INR', max_length=10)),
+                ('receipt', models.CharField(blank=True, default=payments.models.random_receipt_id, max_length=255, null=True)),
+                ('status', models.CharField(default='created', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('contract', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order', to='api.contract')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=255, unique=True)),
+                ('stage', models.CharField(choices=[('advance', 'Advance Payment'), ('final', 'Final Payment')], max_length=50)),
+                ('status', models.CharField(choices=[('created', 'Created'), ('authorized', 'Authorized'), ('captured', 'Captured'), ('refunded', 'Refunded'), ('failed', 'Failed')], default='created', max_length=50)),
+                ('method', models.CharField(blank=True, choices=[('card', 'Card'), ('netbanking', 'Net Banking'), ('wallet', 'Wallet'), ('emi', 'EMI'), ('upi', 'UPI')], max_length=50, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('email', models.EmailField(max_length=254)),
+                ('contact', models.CharField(default='9999999999', max_length=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='payments.order')),
+            ],
+        ),
+    ]
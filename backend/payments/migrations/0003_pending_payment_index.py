@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_created_at_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status__in', ['created', 'authorized'])), fields=['id'], name='payment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:31
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copies of payments.models.STATUS_RANK and the ledger computation as
+# of this migration; later changes to payments.ledger must not alter it.
+STATUS_RANK = {"refunded": 4, "captured": 3, "authorized": 2, "failed": 1, "created": 0}
+STAGES = ("advance", "final")
+UPDATE_FIELDS = [
+    "order", "buyer", "seller", "currency", "total", "advance_paid", "final_paid",
+    "outstanding", "advance_status", "final_status", "updated_at",
+]
+
+
+def backfill_ledgers(order_ids, Order, Payment, PaymentLedger):
+    orders = Order.objects.filter(pk__in=order_ids).values(
+        "pk", "contract_id", "contract__buyer_id", "contract__seller_id", "amount", "currency",
+    )
+    paid = defaultdict(Decimal)
+    furthest = {}
+    for payment in Payment.objects.filter(order_id__in=order_ids).values("order_id", "stage", "status", "amount"):
+        key = (payment["order_id"], payment["stage"])
+        if payment["status"] == "captured":
+            paid[key] += payment["amount"]
+        if STATUS_RANK.get(payment["status"], -1) > STATUS_RANK.get(furthest.get(key), -1):
+            furthest[key] = payment["status"]
+
+    ledgers = []
+    for order in orders:
+        values = {
+            "contract_id": order["contract_id"],
+            "order_id": order["pk"],
+            "buyer_id": order["contract__buyer_id"],
+            "seller_id": order["contract__seller_id"],
+            "currency": order["currency"],
+            "total": order["amount"],
+        }
+        for stage in STAGES:
+            values[f"{stage}_paid"] = paid[order["pk"], stage]
+            values[f"{stage}_status"] = furthest.get((order["pk"], stage), "")
+        values["outstanding"] = max(order["amount"] - values["advance_paid"] - values["final_paid"], Decimal(0))
+        ledgers.append(PaymentLedger(**values))
+    PaymentLedger.objects.bulk_create(
+        ledgers, update_conflicts=True, unique_fields=["contract"], update_fields=UPDATE_FIELDS,
+    )
+
+
+def provision_and_backfill(apps, schema_editor):
+    Contract = apps.get_model("api", "Contract")
+    Order = apps.get_model("payments", "Order")
+    Payment = apps.get_model("payments", "Payment")
+    PaymentLedger = apps.get_model("payments", "PaymentLedger")
+
+    # Orders used to be created on first read; approved contracts get theirs now.
+    Order.objects.bulk_create([
+        Order(contract_id=pk, amount=amount)
+        for pk, amount in Contract.objects.filter(status="APPROVED", order__isnull=True).values_list("pk", "estimate_total_price")
+    ])
+    order_ids = list(Order.objects.filter(contract__isnull=False).values_list("pk", flat=True))
+    for start in range(0, len(order_ids), 500):
+        backfill_ledgers(order_ids[start:start + 500], Order, Payment, PaymentLedger)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_request_profile'),
+        ('payments', '0005_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentLedger',
+            fields=[
+                ('contract', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='api.contract')),
+                ('currency', models.CharField(default='INR', max_length=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('advance_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('final_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('advance_status', models.CharField(blank=True, default='', max_length=50)),
+                ('final_status', models.CharField(blank=True, default='', max_length=50)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledgers_as_buyer', to=settings.AUTH_USER_MODEL)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='payments.order')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledgers_as_seller', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(provision_and_backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status__in', ['created', 'authorized', 'failed'])), fields=['id'], name='payment_pending_idx'),
+        ),
+    ]
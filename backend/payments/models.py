@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from api.models import Contract
+from users.tracking import FieldTrackerMixin
 import uuid
 import decimal
 
+# When an order has several payment attempts, the one that got furthest wins.
+STATUS_RANK = {"refunded": 4, "captured": 3, "authorized": 2, "failed": 1, "created": 0}
+
+# Order.status once the payment of a stage is captured
+ORDER_STATUS = {
+    "advance": "advance_paid",
+    "final": "paid",
+}
+
 def random_order_id():
     return f"ORD_{uuid.uuid4().hex}"
 
@@ -18,6 +30,11 @@ class Order(models.Model):
     status = models.CharField(max_length=50, default="created")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="order_created_idx"),
+        ]
+
     def _str_(self):
         return self.id
     
@@ -25,8 +42,18 @@ class Order(models.Model):
         self.amount = self.contract.estimate_total_price
         super().save(*args, **kwargs)
 
+    def advance(self, payment):
+        """Move the status on if ``payment`` (one of ours) is captured; True if it changed."""
+        status = ORDER_STATUS.get(payment.stage) if payment.status == "captured" else None
+        if status is None or self.status in (status, "paid"):
+            return False
+        self.status = status
+        return True
+
+
+class Payment(FieldTrackerMixin, models.Model):
+    tracked_fields = ("status",)
 
-class Payment(models.Model):
     PAYMENT_STAGE = (
         ("advance", "Advance Payment"),
         ("final", "Final Payment"),
@@ -55,6 +82,12 @@ class Payment(models.Model):
     contact = models.CharField(max_length=15, default="9999999999")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Only the rows the reconciler still has to check.
+            models.Index(fields=["id"], name="payment_pending_idx", condition=models.Q(status__in=["created", "authorized", "failed"])),
+        ]
+
     def _str_(self):
         return self.payment_id
     
@@ -62,7 +95,70 @@ class Payment(models.Model):
         if self.stage == "advance":
             self.amount = self.order.amount * decimal.Decimal('0.25')
         elif self.stage == "final":
-            self.amount = self.order.amount * 0.75
+            self.amount = self.order.amount * decimal.Decimal('0.75')
         self.email = self.order.contract.buyer.email
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class PaymentEvent(models.Model):
+    """A Razorpay webhook delivery, stored once per event id and applied by ``manage.py apply_payment_events``."""
+    event_id = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=100)
+    razorpay_order_id = models.CharField(max_length=255, blank=True, db_index=True)
+    payload = models.JSONField()
+    occurred_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["occurred_at", "id"], name="payment_event_pending_idx", condition=models.Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.event_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of the first request sent with an ``Idempotency-Key``. A row
+    without a ``status_code`` is a request still in flight.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_user_key_unique"),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class PaymentLedger(models.Model):
+    """
+    What has been paid against a contract, kept in step with its ``Payment``
+    rows by ``payments.ledger.refresh_ledgers`` so that payment pages and
+    dashboards read one row instead of the order and all its attempts.
+    """
+    contract = models.OneToOneField(Contract, primary_key=True, related_name="ledger", on_delete=models.CASCADE)
+    order = models.OneToOneField(Order, related_name="ledger", on_delete=models.CASCADE)
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="ledgers_as_buyer", on_delete=models.CASCADE)
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="ledgers_as_seller", on_delete=models.CASCADE)
+    currency = models.CharField(max_length=10, default="INR")
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    advance_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    final_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Furthest status reached by any attempt of the stage, blank before the first one.
+    advance_status = models.CharField(max_length=50, blank=True, default="")
+    final_status = models.CharField(max_length=50, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Ledger for contract {self.contract_id}"
@@ -0,0 +1,136 @@
+"""
+Background reconciliation of pending payments against Razorpay.
+
+Buyers used to poll ``payment-status/`` while waiting for a UPI or card
+confirmation, and every poll called Razorpay inside the request. Instead a
+worker (``manage.py reconcile_payments``) walks the ``Payment`` rows still in
+``created``, ``authorized`` or ``failed`` state in batches, asks Razorpay for each
+order's payments with at most ``CONCURRENCY`` calls in flight over one pooled
+session, and writes the changed rows back with one ``bulk_update`` per batch.
+A captured payment moves its ``Order`` on just as a webhook would, so a lost
+delivery still settles the order. The status endpoint only reads the local row.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .gateway import make_client
+from .ledger import refresh_ledgers
+from .models import STATUS_RANK, Order, Payment
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "CONCURRENCY": 8,
+    "BATCH_SIZE": 100,
+    "TIMEOUT": 10,
+    "INTERVAL": 5,
+    "MAX_AGE": timedelta(days=2),
+}
+
+# A failed attempt can still be followed by a successful retry on the same
+# Razorpay order, so failed payments are checked until MAX_AGE too.
+PENDING = ("created", "authorized", "failed")
+UPDATE_FIELDS = ["status", "method", "contact"]
+
+
+def reconciler_setting(name):
+    return getattr(settings, "PAYMENT_RECONCILER", {}).get(name, DEFAULTS[name])
+
+
+def pick_attempt(items):
+    """The attempt deciding the order's state; Razorpay lists newest first, which breaks ties."""
+    if not items:
+        return None
+    return max(items, key=lambda item: STATUS_RANK.get(item.get("status"), -1))
+
+
+def pending_payments():
+    return Payment.objects.filter(
+        status__in=PENDING,
+        payment_id__startswith="order_",
+        created_at__gte=timezone.now() - reconciler_setting("MAX_AGE"),
+    )
+
+
+class Reconciler:
+
+    def __init__(self, client=None, concurrency=None, batch_size=None):
+        self.concurrency = concurrency or reconciler_setting("CONCURRENCY")
+        self.batch_size = batch_size or reconciler_setting("BATCH_SIZE")
+        self.client = client or make_client(pool_size=self.concurrency)
+
+    def fetch(self, payment_id):
+        """Razorpay's attempts for the order ``payment_id``, or None if the call failed."""
+        try:
+            response = self.client.order.payments(payment_id, timeout=reconciler_setting("TIMEOUT"))
+        except Exception:
+            logger.warning("Could not fetch Razorpay payments for %s", payment_id, exc_info=True)
+            return None
+        return response.get("items", [])
+
+    def apply(self, payment, attempt):
+        """Copy ``attempt`` onto ``payment``; True if anything changed."""
+        values = {
+            "status": attempt["status"],
+            "method": attempt.get("method") or payment.method,
+            "contact": attempt.get("contact") or payment.contact,
+        }
+        changed = any(getattr(payment, name) != value for name, value in values.items())
+        for name, value in values.items():
+            setattr(payment, name, value)
+        return changed
+
+    def reconcile_batch(self, payments, executor):
+        read_status = {payment.pk: payment.status for payment in payments}
+        results = executor.map(self.fetch, [payment.payment_id for payment in payments])
+        changed = []
+        for payment, items in zip(payments, results):
+            attempt = pick_attempt(items or [])
+            if attempt is not None and self.apply(payment, attempt):
+                changed.append(payment)
+        if not changed:
+            return changed
+        with transaction.atomic():
+            # The fetches take a while; skip rows a webhook moved meanwhile
+            # rather than overwrite them with what Razorpay said earlier.
+            current = dict(
+                Payment.objects.select_for_update().filter(pk__in=[payment.pk for payment in changed]).values_list("pk", "status")
+            )
+            changed = [payment for payment in changed if current.get(payment.pk) == read_status[payment.pk]]
+            if changed:
+                Payment.objects.bulk_update(changed, UPDATE_FIELDS)
+                orders = [payment.order for payment in changed if payment.order.advance(payment)]
+                if orders:
+                    Order.objects.bulk_update(orders, ["status"])
+                refresh_ledgers({payment.order_id for payment in changed})
+        return changed
+
+    def run_once(self):
+        """Check every pending payment once; returns the number of rows updated."""
+        updated, last_pk = 0, 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="razorpay") as executor:
+            while True:
+                batch = list(
+                    pending_payments().filter(pk__gt=last_pk).order_by("pk").select_related("order")
+                    .only("pk", "payment_id", "stage", "order__id", "order__status", *UPDATE_FIELDS)[:self.batch_size]
+                )
+                if not batch:
+                    return updated
+                last_pk = batch[-1].pk
+                updated += len(self.reconcile_batch(batch, executor))
+
+    def run_forever(self, interval=None):
+        interval = interval or reconciler_setting("INTERVAL")
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            updated = self.run_once()
+            if updated:
+                logger.info("Reconciled %d payments", updated)
+            time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -1,13 +1,31 @@
 from rest_framework import serializers
-from .models import Order, Payment
+from api.optimization import DynamicFieldsMixin
+from .models import Order, Payment, PaymentLedger
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = "__all__"
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     payments = PaymentSerializer(many=True)
     class Meta:
         model = Order
-        fields = ['id', 'contract', 'amount', 'currency', 'receipt', 'status', 'created_at', 'payments']
\ No newline at end of file
+        fields = ['id', 'contract', 'amount', 'currency', 'receipt', 'status', 'created_at', 'payments']
+
+class PaymentLedgerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = PaymentLedger
+        fields = ['contract', 'order', 'buyer', 'seller', 'currency', 'total', 'advance_paid', 'final_paid',
+                  'outstanding', 'advance_status', 'final_status', 'updated_at']
+
+class PortfolioTotalsSerializer(serializers.Serializer):
+    contracts = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    advance_paid = serializers.DecimalField(max_digits=14, decimal_places=2)
+    final_paid = serializers.DecimalField(max_digits=14, decimal_places=2)
+    outstanding = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class PortfolioSummarySerializer(serializers.Serializer):
+    as_buyer = PortfolioTotalsSerializer()
+    as_seller = PortfolioTotalsSerializer()
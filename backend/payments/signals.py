@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.models import Contract
+from .ledger import provision_order, refresh_contract_ledger, refresh_ledgers
+from .models import Order, Payment
+
+
+@receiver(post_save, sender=Contract)
+def provision_approved_contract(instance, created, raw=False, **kwargs):
+    if raw or instance.status != "APPROVED":
+        return
+    if created or instance.previous("status") != "APPROVED":
+        provision_order(instance)
+
+@receiver(post_save, sender=Contract)
+def refresh_contract_ledger_on_change(instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    changed = set(instance.changed_fields())
+    if "estimate_total_price" in changed:
+        # Orders charge the contract price; keep an existing one in step.
+        Order.objects.filter(contract=instance).update(amount=instance.estimate_total_price)
+    if changed & {"estimate_total_price", "buyer", "seller"}:
+        refresh_contract_ledger(instance.pk)
+
+@receiver(post_save, sender=Order)
+def refresh_order_ledger(instance, raw=False, **kwargs):
+    if not raw:
+        refresh_ledgers([instance.pk])
+
+@receiver(post_save, sender=Payment)
+def refresh_payment_ledger(instance, created, raw=False, **kwargs):
+    if not raw and (created or instance.has_changed("status")):
+        refresh_ledgers([instance.order_id])
+
+@receiver(post_delete, sender=Payment)
+def refresh_ledger_after_payment_delete(instance, **kwargs):
+    # After commit: when the whole order is being deleted, its ledger row
+    # goes with it and must not be written back.
+    order_id = instance.order_id
+    transaction.on_commit(lambda: refresh_ledgers([order_id]))
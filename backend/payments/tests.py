@@ -1,3 +1,476 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from api import testing
+from api.models import Contract
+from .events import apply_events
+from .idempotency import REPLAYED_HEADER
+from .ledger import refresh_ledgers
+from .models import IdempotencyKey, Order, Payment, PaymentEvent, PaymentLedger
+from .reconciler import Reconciler
+from .views import OrderView
+
+
+class PaymentRouteQueryBudgetTests(testing.RouteQueryBudgetTestCase):
+    urlconf = "payments.urls"
+
+    def setUp(self):
+        ids = count()
+        client = mock.Mock()
+        client.order.create.side_effect = lambda data: {"id": f"order_rzp{next(ids)}", **data}
+        # The views talk to Razorpay through a module-level client.
+        patcher = mock.patch("payments.views.client", client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def seed(self, n, start):
+        testing.seed_contracts(n, start)
+
+    def route_kwargs(self):
+        contract = Contract.objects.order_by("pk").select_related("buyer").first()
+        return contract.buyer, {"payment_id": "order_0", "contract_id": contract.pk, "stage": "final"}
+
+
+class StubRazorpayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    path_re = re.compile(r"^/v1/orders/(?P<order_id>[^/]+)/payments")
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.ports.add(self.client_address[1])
+        try:
+            time.sleep(server.delay)
+            match = self.path_re.match(self.path)
+            if self.headers.get("Authorization") != server.authorization or match is None:
+                return self.reply(401, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Authentication failed"}})
+            items = server.orders.get(match["order_id"])
+            if items is None:
+                return self.reply(500, {"error": {"code": "SERVER_ERROR", "description": "Something went wrong"}})
+            self.reply(200, {"entity": "collection", "count": len(items), "items": items})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRazorpay(ThreadingHTTPServer):
+    """Local stand-in for ``GET /v1/orders/<id>/payments``."""
+
+    daemon_threads = True
+
+    def __init__(self, orders, delay=0.0):
+        super().__init__(("127.0.0.1", 0), StubRazorpayHandler)
+        self.orders = orders
+        self.delay = delay
+        self.authorization = "Basic " + base64.b64encode(b"rzp_test:secret").decode()
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+        self.ports = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def attempt(status, method="upi"):
+    return {"entity": "payment", "status": status, "method": method, "amount": 25000, "email": "b@example.com", "contact": "+919876543210"}
+
+
+class PaymentReconcilerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(6)
+
+    def reconcile(self, orders, **kwargs):
+        with StubRazorpay(orders, delay=kwargs.pop("delay", 0.0)) as stub:
+            with override_settings(RAZORPAY_KEY_ID="rzp_test", RAZORPAY_KEY_SECRET="secret", RAZORPAY_BASE_URL=stub.url):
+                with CaptureQueriesContext(connection) as ctx:
+                    updated = Reconciler(**kwargs).run_once()
+        return stub, updated, ctx.captured_queries
+
+    def status(self, payment_id):
+        return Payment.objects.get(payment_id=payment_id).status
+
+    def test_updates_changed_payments_in_one_bulk_update(self):
+        orders = {
+            "order_0": [attempt("captured")],
+            "order_1": [attempt("created"), attempt("failed")],
+            "order_2": [attempt("authorized", method="card")],
+            "order_4": [],
+            "order_5": [{"entity": "payment", "status": "created"}],
+        }
+        with self.assertLogs("payments.reconciler", "WARNING") as logs:
+            _, updated, queries = self.reconcile(orders)
+        self.assertIn("order_3", logs.output[0])
+        self.assertEqual(updated, 3)
+        self.assertEqual(
+            [self.status(f"order_{i}") for i in range(6)],
+            ["captured", "failed", "authorized", "created", "created", "created"],
+        )
+        payment = Payment.objects.get(payment_id="order_2")
+        self.assertEqual((payment.method, payment.contact), ("card", "+919876543210"))
+        # A capture settles the order even if its webhook never arrives.
+        orders = dict(Order.objects.values_list("payments__payment_id", "status"))
+        self.assertEqual((orders["order_0"], orders["order_2"]), ("advance_paid", "created"))
+        self.assertEqual(len([q for q in queries if q["sql"].startswith('UPDATE "payments_payment"')]), 1)
+
+        # Only the rows still pending are checked on the next pass.
+        stub, updated, _ = self.reconcile({"order_2": [attempt("captured", method="card")]})
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.status("order_2"), "captured")
+
+    def test_does_not_overwrite_a_webhook_applied_meanwhile(self):
+        real_apply = Reconciler.apply
+
+        def webhook_lands_first(reconciler, payment, attempt):
+            if payment.payment_id == "order_0":
+                Payment.objects.filter(payment_id="order_0").update(status="captured")
+            return real_apply(reconciler, payment, attempt)
+
+        orders = {"order_0": [attempt("authorized")], "order_1": [attempt("authorized")]}
+        with mock.patch.object(Reconciler, "apply", webhook_lands_first), self.assertLogs("payments.reconciler", "WARNING"):
+            _, updated, _ = self.reconcile(orders)
+        self.assertEqual(updated, 1)
+        self.assertEqual((self.status("order_0"), self.status("order_1")), ("captured", "authorized"))
+
+    def test_failed_payments_pick_up_a_successful_retry(self):
+        with self.assertLogs("payments.reconciler", "WARNING"):
+            self.reconcile({"order_0": [attempt("failed")]})
+            self.assertEqual(self.status("order_0"), "failed")
+            _, updated, _ = self.reconcile({"order_0": [attempt("captured"), attempt("failed")]})
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.status("order_0"), "captured")
+
+    def test_bounded_concurrency_over_pooled_connections(self):
+        orders = {f"order_{i}": [attempt("captured")] for i in range(6)}
+        stub, updated, _ = self.reconcile(orders, delay=0.05, concurrency=2, batch_size=4)
+        self.assertEqual(updated, 6)
+        self.assertEqual(stub.max_in_flight, 2)
+        self.assertLessEqual(len(stub.ports), 2)
+
+
+class OrderViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(4)
+        cls.buyer = Contract.objects.select_related("buyer").order_by("pk").first().buyer
+
+    def list_orders(self):
+        request = APIRequestFactory().get("/orders/")
+        force_authenticate(request, self.buyer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = OrderView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_nested_payments_are_prefetched(self):
+        _, single = self.list_orders()
+        Contract.objects.update(buyer=self.buyer)
+        for order in Order.objects.select_related("contract"):
+            Payment.objects.create(order=order, payment_id=f"{order.pk}_final", stage="final")
+
+        response, many = self.list_orders()
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertEqual(len(response.data["results"][0]["payments"]), 2)
+        # orders, then one prefetch for all their payments
+        self.assertEqual((single, many), (2, 2))
+
+
+@override_settings(ROOT_URLCONF="payments.urls")
+class PaymentStatusViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(2)
+        cls.contract = Contract.objects.select_related("buyer").order_by("pk").first()
+
+    def test_reads_the_local_row(self):
+        Payment.objects.filter(payment_id="order_0").update(status="captured")
+        client = APIClient()
+        client.force_authenticate(self.contract.buyer)
+        with mock.patch("payments.views.client") as razorpay:
+            response = client.get("/payment-status/order_0/")
+            self.assertEqual(client.get("/payment-status/order_1/").status_code, 403)
+            self.assertEqual(client.get("/payment-status/order_9/").status_code, 404)
+        razorpay.order.payments.assert_not_called()
+        self.assertEqual(response.data["status"], "captured")
+
+
+def webhook_body(event, order_id, status=None, created_at=1700000000):
+    entity = {"id": f"pay_{order_id}", "entity": "payment", "order_id": order_id, "status": status or event.split(".")[1], "method": "upi", "contact": "+919876543210"}
+    return json.dumps({"entity": "event", "event": event, "payload": {"payment": {"entity": entity}}, "created_at": created_at}).encode()
+
+
+@override_settings(ROOT_URLCONF="payments.urls", RAZORPAY_WEBHOOK_SECRET="whsec")
+class RazorpayWebhookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(3)
+        Payment.objects.filter(payment_id="order_1").update(stage="final")
+
+    def deliver(self, body, event_id, secret="whsec"):
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            "/webhook/", body, content_type="application/json",
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_verifies_and_stores_each_event_once(self):
+        body = webhook_body("payment.captured", "order_0")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.deliver(body, "evt_1").status_code, 200)
+        self.assertEqual(self.deliver(body, "evt_1").status_code, 200)
+        self.assertEqual(self.deliver(body, "evt_2", secret="wrong").status_code, 400)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.event_id, event.event, event.razorpay_order_id), ("evt_1", "payment.captured", "order_0"))
+        self.assertIsNone(event.processed_at)
+
+    def test_rejects_unsigned_setups_and_malformed_bodies(self):
+        body = webhook_body("payment.captured", "order_0")
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=""):
+            self.assertEqual(self.deliver(body, "evt_1").status_code, 400)
+        for bad in (b"[1, 2]", b'"captured"', b'{"created_at": "yesterday"}', b'{"payload": []}'):
+            response = self.deliver(bad, "evt_2")
+            self.assertEqual(response.status_code, 200 if bad == b'{"payload": []}' else 400, bad)
+
+    def test_worker_applies_events_in_order_per_payment(self):
+        deliveries = [
+            ("evt_1", webhook_body("payment.authorized", "order_0", created_at=1)),
+            ("evt_2", webhook_body("payment.captured", "order_0", created_at=2)),
+            # A late failure of another attempt does not undo the capture.
+            ("evt_3", webhook_body("payment.failed", "order_0", created_at=3)),
+            ("evt_4", webhook_body("order.paid", "order_1", status="captured", created_at=2)),
+            ("evt_5", webhook_body("payment.failed", "order_2", created_at=1)),
+            ("evt_6", webhook_body("payment.captured", "order_unknown", created_at=1)),
+        ]
+        for event_id, body in deliveries:
+            self.deliver(body, event_id)
+
+        with self.assertLogs("payments.events", "WARNING"), CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(apply_events(), 6)
+        # events, payments, payment update, ledger refresh (2 reads, 1 upsert), order update, processed mark
+        self.assertEqual(len([q for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]), 8)
+        self.assertEqual(apply_events(), 0)
+
+        statuses = dict(Payment.objects.values_list("payment_id", "status"))
+        self.assertEqual(statuses, {"order_0": "captured", "order_1": "captured", "order_2": "failed"})
+        self.assertEqual(Payment.objects.get(payment_id="order_0").contact, "+919876543210")
+        orders = dict(Order.objects.values_list("payments__payment_id", "status"))
+        self.assertEqual(orders, {"order_0": "advance_paid", "order_1": "paid", "order_2": "created"})
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+@override_settings(ROOT_URLCONF="payments.urls")
+class IdempotentCreatePaymentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(1)
+        cls.contract = Contract.objects.select_related("buyer").get()
+
+    def setUp(self):
+        ids = count()
+        self.razorpay = mock.Mock()
+        self.razorpay.order.create.side_effect = lambda data: {"id": f"order_rzp{next(ids)}", **data}
+        patcher = mock.patch("payments.views.client", self.razorpay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.contract.buyer)
+
+    def create(self, key, stage="final"):
+        return self.client.get(f"/create/{self.contract.pk}/{stage}/", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_unknown_contract_is_a_replayable_404(self):
+        first = self.client.get("/create/0/final/", HTTP_IDEMPOTENCY_KEY="k1")
+        retry = self.client.get("/create/0/final/", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual((first.status_code, retry.status_code), (404, 404))
+        self.assertEqual(retry[REPLAYED_HEADER], "true")
+        self.razorpay.order.create.assert_not_called()
+
+    def test_retries_replay_the_first_response(self):
+        first = self.create("k1")
+        retry = self.create("k1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry[REPLAYED_HEADER], "true")
+        self.assertEqual(self.razorpay.order.create.call_count, 1)
+        self.assertEqual(Payment.objects.filter(stage="final").count(), 1)
+
+        self.assertEqual(self.create("k1", stage="advance").status_code, 422)
+        self.assertEqual(self.create("k2").json()["id"], "order_rzp1")
+
+    def test_concurrent_retry_waits_for_the_first_request(self):
+        path = f"/create/{self.contract.pk}/final/"
+        record = IdempotencyKey.objects.create(
+            user=self.contract.buyer, key="k1",
+            fingerprint=hashlib.sha256(f"GET {path}".encode()).hexdigest(),
+        )
+
+        def finish_first_request(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=200, response={"id": "order_first"})
+
+        with mock.patch("payments.idempotency.time.sleep", side_effect=finish_first_request) as sleep:
+            response = self.create("k1")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(response.json(), {"id": "order_first"})
+        self.razorpay.order.create.assert_not_called()
+
+    def test_still_running_after_the_wait_is_a_conflict(self):
+        IdempotencyKey.objects.create(user=self.contract.buyer, key="k1", fingerprint=hashlib.sha256(
+            f"GET /create/{self.contract.pk}/final/".encode()).hexdigest())
+        with override_settings(IDEMPOTENCY={"WAIT": 0.01, "POLL_INTERVAL": 0.005}):
+            self.assertEqual(self.create("k1").status_code, 409)
+
+    def test_failures_release_the_key(self):
+        self.razorpay.order.create.side_effect = RuntimeError("gateway down")
+        with self.assertRaises(RuntimeError):
+            self.create("k1")
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.razorpay.order.create.side_effect = lambda data: {"id": "order_retry", **data}
+        self.assertEqual(self.create("k1").json()["id"], "order_retry")
+
+
+@override_settings(ROOT_URLCONF="payments.urls")
+class PaymentLedgerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        testing.seed_contracts(2)
+        cls.contract, cls.other = Contract.objects.select_related("buyer", "seller").order_by("pk")
+
+    def ledger(self, contract=None):
+        return PaymentLedger.objects.get(contract=contract or self.contract)
+
+    def get(self, user, path):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(path)
+
+    def test_approval_provisions_the_order_and_its_ledger(self):
+        contract = Contract.objects.create(
+            contract_template=self.contract.contract_template, buyer=self.contract.buyer, seller=self.other.seller,
+            estimate_total_price=800,
+        )
+        self.assertFalse(Order.objects.filter(contract=contract).exists())
+        self.assertEqual(self.get(contract.buyer, f"/contract/{contract.pk}/").status_code, 404)
+
+        contract.status = "APPROVED"
+        contract.save()
+        ledger = self.ledger(contract)
+        self.assertEqual(ledger.order, contract.order)
+        self.assertEqual((ledger.total, ledger.outstanding, ledger.advance_status), (800, 800, ""))
+
+        # Reading never writes.
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get(contract.seller, f"/contract/{contract.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["outstanding"], "800.00")
+        self.assertFalse([q for q in ctx.captured_queries if not q["sql"].startswith("SELECT")])
+
+    def test_payment_status_changes_move_the_ledger(self):
+        payment = Payment.objects.get(payment_id="order_0")
+        self.assertEqual(self.ledger().advance_status, "created")
+        payment.status = "captured"
+        payment.save()
+        Payment.objects.create(order=payment.order, payment_id="order_final", stage="final")
+        ledger = self.ledger()
+        self.assertEqual((ledger.advance_paid, ledger.final_paid, ledger.outstanding), (250, 0, 750))
+        self.assertEqual((ledger.advance_status, ledger.final_status), ("captured", "created"))
+
+        # Webhook-applied captures go through a bulk update, not save().
+        PaymentEvent.objects.create(
+            event_id="evt_1", event="payment.captured", razorpay_order_id="order_final",
+            payload=json.loads(webhook_body("payment.captured", "order_final")), occurred_at="2024-01-01T00:00Z",
+        )
+        apply_events()
+        ledger = self.ledger()
+        self.assertEqual((ledger.final_paid, ledger.outstanding, ledger.final_status), (750, 0, "captured"))
+
+    def test_contract_edits_move_the_ledger(self):
+        contract = Contract.objects.get(pk=self.contract.pk)
+        contract.estimate_total_price = 1200
+        contract.seller = self.other.seller
+        contract.save()
+        ledger = self.ledger()
+        self.assertEqual(Order.objects.get(contract=contract).amount, 1200)
+        self.assertEqual((ledger.total, ledger.outstanding, ledger.seller), (1200, 1200, self.other.seller))
+
+        # Saves that leave the price and the parties alone do not touch it.
+        contract.status = "APPROVED"
+        with self.assertNumQueries(1):
+            contract.save(update_fields=["status"])
+
+    def test_migration_backfill_matches_refresh(self):
+        backfill = import_module("payments.migrations.0006_payment_ledger").provision_and_backfill
+        payment = Payment.objects.get(payment_id="order_0")
+        payment.status = "captured"
+        payment.save()
+        expected = list(PaymentLedger.objects.order_by("pk").values())
+        PaymentLedger.objects.all().delete()
+        backfill(apps, None)
+        fields = [name for name in expected[0] if name != "updated_at"]
+        self.assertEqual(
+            list(PaymentLedger.objects.order_by("pk").values(*fields)),
+            [{name: row[name] for name in fields} for row in expected],
+        )
+
+    def test_only_the_parties_see_a_contract_ledger(self):
+        path = f"/contract/{self.contract.pk}/"
+        self.assertEqual(self.get(self.contract.buyer, path).data["total"], "1000.00")
+        self.assertEqual(self.get(self.contract.seller, path).status_code, 200)
+        self.assertEqual(self.get(self.other.buyer, path).status_code, 403)
+        self.assertEqual(self.get(self.contract.buyer, "/contract/0/").status_code, 404)
+
+    def test_portfolio_sums_ledgers_per_role(self):
+        payment = Payment.objects.get(payment_id="order_0")
+        payment.status = "captured"
+        payment.save()
+        # The first contract's farmer also buys on the second one.
+        Contract.objects.filter(pk=self.other.pk).update(buyer=self.contract.seller)
+        refresh_ledgers([self.other.order.pk])
+
+        with self.assertNumQueries(1):
+            response = self.get(self.contract.seller, "/portfolio/")
+        self.assertEqual(response.data, {
+            "as_buyer": {"contracts": 1, "total": "1000.00", "advance_paid": "0.00", "final_paid": "0.00", "outstanding": "1000.00"},
+            "as_seller": {"contracts": 1, "total": "1000.00", "advance_paid": "250.00", "final_paid": "0.00", "outstanding": "750.00"},
+        })
@@ -1,26 +1,67 @@
-import razorpay
-from django.conf import settings
+from decimal import Decimal
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Order, Payment
+from .models import Order, Payment, PaymentLedger
 from api.models import Contract
-from .serializers import OrderSerializer, PaymentSerializer
+from api.optimization import OptimizedQuerysetMixin
+from api.pagination import KeysetPagination
+from .events import parse_event, record_event, verify_signature
+from .gateway import make_client
+from .idempotency import idempotent
+from .serializers import OrderSerializer, PaymentLedgerSerializer, PaymentSerializer, PortfolioSummarySerializer
+
+client = make_client()
+
+PORTFOLIO_SUMS = ("total", "advance_paid", "final_paid", "outstanding")
 
 class GetOrderPayment(APIView):
+    """
+    Payment position of a contract for its buyer or seller, read from the
+    contract's ledger row. The order is provisioned when the contract is
+    approved, so a contract without one has nothing to pay yet.
+    """
+    permission_classes = [IsAuthenticated]
 
     def get(self, request, contract_id):
-        contract = Contract.objects.get(id = contract_id)
-        if contract.buyer != request.user:
+        ledger = PaymentLedger.objects.filter(contract_id=contract_id).first()
+        if ledger is None:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.pk not in (ledger.buyer_id, ledger.seller_id):
             return Response({"error": "You are not authorized to view this order"}, status=status.HTTP_403_FORBIDDEN)
-        order, _ = Order.objects.get_or_create(contract=contract)
-        resp_data = OrderSerializer(order)
-        return Response(resp_data.data, status=status.HTTP_200_OK)
-    
+        return Response(PaymentLedgerSerializer(ledger).data, status=status.HTTP_200_OK)
+
+
+class PortfolioSummaryView(APIView):
+    """Totals over every contract of the user, as buyer and as seller, in one query."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        totals = {}
+        for role in ("buyer", "seller"):
+            mine = Q(**{role: user})
+            totals[f"{role}_contracts"] = Count("pk", filter=mine)
+            for name in PORTFOLIO_SUMS:
+                totals[f"{role}_{name}"] = Coalesce(Sum(name, filter=mine), Value(Decimal(0)), output_field=DecimalField())
+        totals = PaymentLedger.objects.filter(Q(buyer=user) | Q(seller=user)).aggregate(**totals)
+        data = {
+            f"as_{role}": {
+                "contracts": totals[f"{role}_contracts"],
+                **{name: totals[f"{role}_{name}"] for name in PORTFOLIO_SUMS},
+            }
+            for role in ("buyer", "seller")
+        }
+        return Response(PortfolioSummarySerializer(data).data, status=status.HTTP_200_OK)
+
 
 class CreatePaymentView(APIView):
 
+    @idempotent
     def get(self, request, contract_id, stage):
         try:
             order = Contract.objects.get(id=contract_id).order
@@ -41,71 +82,74 @@ class CreatePaymentView(APIView):
                 stage=stage,
             )
             
-            response = client.order.create({
-                "amount": int(payment.amount * 100),  # Convert from INR to paisa
-                "currency": order.currency,
-                "receipt": order.receipt,
-                "notes": {
-                    "email": payment.email,
-                    "contact": payment.contact,
-                },
-            })
+            try:
+                response = client.order.create({
+                    "amount": int(payment.amount * 100),  # Convert from INR to paisa
+                    "currency": order.currency,
+                    "receipt": order.receipt,
+                    "notes": {
+                        "email": payment.email,
+                        "contact": payment.contact,
+                    },
+                })
+            except Exception:
+                # Leave no placeholder row behind for the client's retry to trip over.
+                payment.delete()
+                raise
 
             if response.get("error"):
                 payment.delete()
                 return Response({"error": "some error occured"}, status=status.HTTP_400_BAD_REQUEST)
 
             payment.payment_id = response["id"] 
-            print(payment.payment_id)
             payment.save()
             return Response(response, status=status.HTTP_200_OK)
-        except Order.DoesNotExist:
+        except (Contract.DoesNotExist, Order.DoesNotExist):
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
 
-class OrderView(ListAPIView):
+class OrderView(OptimizedQuerysetMixin, ListAPIView):
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
+    def get_base_queryset(self):
         return Order.objects.filter(contract__buyer=self.request.user)
 
 
 class PaymentStatusView(APIView):
+    """
+    Local state of a payment. ``manage.py reconcile_payments`` keeps pending
+    rows in step with Razorpay, so polling this never calls out.
+    """
+
     def get(self, request, payment_id):
+        if not payment_id.lower().startswith("order_"):
+            return Response({"error": "Invalid payment id"}, status=status.HTTP_400_BAD_REQUEST)
+        payment_obj = Payment.objects.select_related("order__contract").filter(payment_id=payment_id).first()
+        if payment_obj is None:
+            return Response({"error": "Payment not found"}, status=status.HTTP_404_NOT_FOUND)
+        if payment_obj.order.contract.buyer_id != request.user.pk:
+            return Response({"error": "You are not authorized to view this payment"}, status=status.HTTP_403_FORBIDDEN)
+        serializer = PaymentSerializer(payment_obj)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class RazorpayWebhookView(APIView):
+    """
+    Razorpay webhook. The delivery is verified, stored once per event id and
+    acknowledged; ``manage.py apply_payment_events`` applies it.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if not verify_signature(body, request.headers.get("X-Razorpay-Signature")):
+            return Response({"error": "Invalid signature"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            if not payment_id.lower().startswith("order_"):
-                return Response({"error": "Invalid payment id"}, status=status.HTTP_400_BAD_REQUEST)
-            if not Payment.objects.filter(payment_id=payment_id).exists():
-                return Response({"error": "Payment not found"}, status=status.HTTP_404_NOT_FOUND)
-            payment_obj = Payment.objects.get(payment_id=payment_id)
-            if payment_obj.order.contract.buyer != request.user:
-                return Response({"error": "You are not authorized to view this payment"}, status=status.HTTP_403_FORBIDDEN)
-            
-            try:
-                razorpay_payments = client.order.payments(payment_id)
-            except razorpay.errors.ServerError as e:
-                print(f"Razorpay Server Error: {e}")
-                return Response({"error": "Payment retrieval failed"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            payments_data = razorpay_payments.get("items", [])
-
-            if not payments_data:
-                return Response({"error": "No Payment Found"}, status=status.HTTP_404_NOT_FOUND)
-
-            print(payments_data)
-
-            payment_obj.status = payments_data[0]["status"]
-            payment_obj.method = payments_data[0].get("method", "")
-            payment_obj.amount = payments_data[0]["amount"] / 100  # Convert from paisa to INR
-            payment_obj.email = payments_data[0]["email"]
-            payment_obj.contact = payments_data[0]["contact"]
-            payment_obj.method = payments_data[0]["method"]
-            payment_obj.save()
-
-            # Serialize payments
-            serializer = PaymentSerializer(payment_obj)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
-        
\ No newline at end of file
+            event = parse_event(body, request.headers.get("X-Razorpay-Event-Id"))
+        except ValueError:
+            return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+        record_event(event)
+        return Response({"status": "ok"}, status=status.HTTP_200_OK)
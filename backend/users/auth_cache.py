@@ -0,0 +1,185 @@
+"""
+Per-process cache of authenticated users.
+
+JWT authentication (HTTP and websocket) resolves the token's user id through
+``get_cached_user`` instead of querying ``CustomUser`` on every call. Each
+process keeps the user, with its profiles joined in, for ``TTL`` seconds
+under ``(user_id, version)``. The version is a counter in the shared Django
+cache that ``invalidate_user`` bumps when the user or one of its profiles is
+saved, so every worker drops its copy on the next request and a request
+costs one cache read and no query.
+
+Callers get their own copy of the cached instance, so views that change
+``request.user`` never touch another request's object.
+
+Websockets authenticate with a ticket: an authenticated client fetches one
+from ``WebsocketTicketView`` (``ws-auth/auth_for_ws_connection``) and connects
+with ``?uuid=<ticket>``. ``CachedTicketAuthMiddleware`` redeems the ticket
+once and resolves its user through the same cache, so the access token never
+appears in a URL.
+
+Tickets and version counters live in the default Django cache, which must
+therefore be shared by every worker (Redis or memcached). With the
+per-process ``LocMemCache`` a ticket issued by one worker cannot be redeemed
+by another and a save in one worker leaves the others serving the old user
+for up to ``TTL`` seconds; ``manage.py check --deploy`` warns about it.
+"""
+import copy
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import CustomUser
+
+DEFAULTS = {
+    "TTL": 30,
+    "TICKET_TTL": 60,
+}
+
+# Cache backends that keep their data inside one process.
+LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+PROFILE_RELATIONS = ("farmer_profile", "buyer_profile", "company_profile")
+
+
+def auth_cache_setting(name):
+    return getattr(settings, "AUTH_USER_CACHE", {}).get(name, DEFAULTS[name])
+
+
+_users = {}
+_users_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"auth-user-version:{user_id}"
+
+
+def user_version(user_id):
+    return cache.get(_version_key(user_id), 0)
+
+
+def get_cached_user(user_id):
+    """The user with ``user_id`` and its profiles, or None if there is no such user."""
+    version = user_version(user_id)
+    entry = _users.get(user_id)
+    if entry is None or entry[0] != version or entry[1] < time.monotonic():
+        user = CustomUser.objects.select_related(*PROFILE_RELATIONS).filter(pk=user_id).first()
+        entry = (version, time.monotonic() + auth_cache_setting("TTL"), user)
+        with _users_lock:
+            _users[user_id] = entry
+    return copy.deepcopy(entry[2])
+
+
+def invalidate_user(user_id):
+    """Make every process reload ``user_id`` once the current transaction commits."""
+
+    def bump():
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+        with _users_lock:
+            _users.pop(user_id, None)
+
+    transaction.on_commit(bump)
+
+
+def clear():
+    with _users_lock:
+        _users.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` resolving the user through the process cache."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def _ticket_key(ticket):
+    return f"ws-ticket:{ticket}"
+
+
+def issue_ticket(user):
+    """A single-use websocket ticket for ``user``, valid for ``TICKET_TTL`` seconds."""
+    ticket = uuid.uuid4().hex
+    cache.set(_ticket_key(ticket), user.pk, auth_cache_setting("TICKET_TTL"))
+    return ticket
+
+
+def user_for_ticket(ticket):
+    """Redeem ``ticket``: the active user it was issued to, or ``AnonymousUser``."""
+    key = _ticket_key(ticket)
+    user_id = cache.get(key)
+    # delete() reports whether this call removed it, so a ticket is redeemed once.
+    if user_id is None or not cache.delete(key):
+        return AnonymousUser()
+    user = get_cached_user(user_id)
+    if user is None or not user.is_active:
+        return AnonymousUser()
+    return user
+
+
+class WebsocketTicketView(APIView):
+    """Issue the ticket a client passes as ``?uuid=`` when opening a websocket."""
+
+    permission_classes = [IsAuthenticated]
+    schema = None
+
+    def get(self, request):
+        return Response({"uuid": issue_ticket(request.user)})
+
+
+class CachedTicketAuthMiddleware(BaseMiddleware):
+    """Websocket auth from a ``?uuid=`` ticket, resolved through the user cache."""
+
+    async def __call__(self, scope, receive, send):
+        tickets = parse_qs(scope.get("query_string", b"").decode()).get("uuid")
+        user = await database_sync_to_async(user_for_ticket)(tickets[0]) if tickets else AnonymousUser()
+        return await super().__call__(dict(scope, user=user), receive, send)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get("BACKEND", "")
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint="Websocket tickets and cached-user invalidation need a shared cache such as Redis or memcached.",
+        id="users.W001",
+    )]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from users.models import CustomUser
+from users.search import REINDEX_BATCH_SIZE, reindex_users
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search document of every user. Signals keep it current afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        ids = CustomUser.objects.order_by("pk").values_list("pk", flat=True)
+        total, batch = 0, []
+        for pk in ids.iterator(chunk_size=options["batch_size"]):
+            batch.append(pk)
+            if len(batch) == options["batch_size"]:
+                reindex_users(batch)
+                total, batch = total + len(batch), []
+        reindex_users(batch)
+        total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} users"))
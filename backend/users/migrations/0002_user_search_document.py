@@ -0,0 +1,86 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the index DDL; users.search queries these objects by name.
+TABLE = "users_usersearchdocument"
+
+SQLITE_INDEXES = {
+    # Prefix indexes keep short prefixes ("ra*") from expanding into
+    # thousands of terms.
+    "users_search_words": "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'",
+    "users_search_trigrams": "tokenize='trigram'",
+}
+
+INSTALL = {
+    "sqlite": [
+        statement
+        for name, options in SQLITE_INDEXES.items()
+        for statement in (
+            f"CREATE VIRTUAL TABLE {name} USING fts5("
+            f"document, user_type, content='{TABLE}', content_rowid='user_id', {options})",
+            f"CREATE TRIGGER {name}_ai AFTER INSERT ON {TABLE} BEGIN "
+            f"INSERT INTO {name}(rowid, document, user_type) VALUES (new.user_id, new.document, new.user_type); END",
+            f"CREATE TRIGGER {name}_ad AFTER DELETE ON {TABLE} BEGIN "
+            f"INSERT INTO {name}({name}, rowid, document, user_type) "
+            f"VALUES ('delete', old.user_id, old.document, old.user_type); END",
+            f"CREATE TRIGGER {name}_au AFTER UPDATE ON {TABLE} BEGIN "
+            f"INSERT INTO {name}({name}, rowid, document, user_type) "
+            f"VALUES ('delete', old.user_id, old.document, old.user_type); "
+            f"INSERT INTO {name}(rowid, document, user_type) VALUES (new.user_id, new.document, new.user_type); END",
+            f"INSERT INTO {name}({name}) VALUES ('rebuild')",
+        )
+    ],
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX users_search_tsv_idx ON {TABLE} USING gin (to_tsvector('simple', document))",
+        f"CREATE INDEX users_search_trgm_idx ON {TABLE} USING gin (document gin_trgm_ops)",
+    ],
+}
+
+UNINSTALL = {
+    "sqlite": [
+        statement
+        for name in SQLITE_INDEXES
+        for statement in (
+            *(f"DROP TRIGGER IF EXISTS {name}_{suffix}" for suffix in ("ai", "ad", "au")),
+            f"DROP TABLE IF EXISTS {name}",
+        )
+    ],
+    "postgresql": [
+        "DROP INDEX IF EXISTS users_search_tsv_idx",
+        "DROP INDEX IF EXISTS users_search_trgm_idx",
+    ],
+}
+
+
+def install_search_index(apps, schema_editor):
+    for statement in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchDocument',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('user_type', models.CharField(blank=True, default='', max_length=50)),
+                ('document', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
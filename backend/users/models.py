@@ -2,7 +2,6 @@ from django.contrib.auth.models import AbstractUser, PermissionsMixin
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.core.mail import send_mail
 from config import settings as SE
 from django.utils.timezone import now
 from datetime import timedelta
@@ -10,10 +9,13 @@ import uuid
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from .managers import CustomUserManager
+from .tracking import FieldTrackerMixin
 from django.template.loader import render_to_string
 
 
-class CustomUser(AbstractUser, PermissionsMixin):
+class CustomUser(FieldTrackerMixin, AbstractUser, PermissionsMixin):
+    tracked_fields = ("user_type", "is_email_verified", "is_gov_id_verified", "email", "first_name", "last_name")
+
     USER_TYPES = (
         ('farmer', 'Farmer'),
         ('buyer', 'Buyer'),
@@ -53,46 +55,22 @@ class CustomUser(AbstractUser, PermissionsMixin):
             'token': token.token,
         }
         html_message = render_to_string('verification_email.html', context)
-        send_mail(subject, "", SE.DEFAULT_FROM_EMAIL, [self.email], html_message=html_message)
+        from api.emails import queue_email
+        queue_email(subject, "", SE.DEFAULT_FROM_EMAIL, [self.email], html_message=html_message)
 
     def __str__(self):
         return self.email
     
     def save(self, *args, **kwargs):
+        from .verification import VERIFICATION_INPUTS, refresh_verification
 
-        if not self.pk:
-            super().save(*args, **kwargs)
-        elif self.user_type == "admin":
-            super().save(*args, **kwargs)
-            return
-        elif self.user_verified:
-            super().save(*args, **kwargs)
-            return
-
-        if self.user_type == "farmer":
-            if not hasattr(self, "farmer_profile"):
-                self.farmer_profile = FarmerProfile.objects.create(user=self)
-            farmer_profile = self.farmer_profile
-            if self.is_gov_id_verified and hasattr(self, "land_info") and self.is_email_verified:
-                if self.land_info.is_verified:
-                    self.user_verified = True
-
-        elif self.user_type == "buyer":
-            if not hasattr(self, "buyer_profile"):
-                self.buyer_profile = BuyerProfile.objects.create(user=self)
-            buyer_profile = self.buyer_profile
-            if self.is_email_verified and self.is_gov_id_verified:
-                self.user_verified = True
-
-        elif self.user_type == "company":
-            if not hasattr(self, "company_profile"):
-                self.company_profile = CompanyProfile.objects.create(user=self)
-            company_profile = self.company_profile
-            if self.is_email_verified and self.is_gov_id_verified and hasattr(self, "gst_info"):
-                if self.gst_info.is_verified:
-                    self.user_verified = True
-
+        # Verification only depends on a few fields, so skip it unless one
+        # of them changed (or the user is new).
+        inputs_changed = self._state.adding or any(self.has_changed(name) for name in VERIFICATION_INPUTS)
         super().save(*args, **kwargs)
+
+        if inputs_changed and self.user_type != "admin" and not self.user_verified:
+            self.user_verified = refresh_verification(self.pk).user_verified
     
 
 class EmailVerificationToken(models.Model):
@@ -124,7 +102,9 @@ class GovernmentIDVerification(models.Model):
         self.user.save(update_fields=["is_gov_id_verified"])
 
 
-class LandInformation(models.Model):
+class LandInformation(FieldTrackerMixin, models.Model):
+    tracked_fields = ("is_verified",)
+
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name="land_info")
     land_area = models.FloatField(verbose_name=_("Land Area (in acres)"))
     land_location = models.CharField(max_length=255, verbose_name=_("Land Location"))
@@ -147,7 +127,9 @@ class Address(models.Model):
         return f"{self.address_line_1}, {self.city}, {self.state} - {self.pincode}"
 
 
-class GSTInfo(models.Model):
+class GSTInfo(FieldTrackerMixin, models.Model):
+    tracked_fields = ("is_verified",)
+
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name="gst_info")
     gst_number = models.CharField(max_length=255, verbose_name=_("GST Number"))
     gst_certificate = models.ImageField(upload_to="gst_certificates/")
@@ -219,4 +201,20 @@ class AadharVerification(models.Model):
     xml_file = models.URLField(blank=True, null=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.ref_id}"
\ No newline at end of file
+        return f"{self.user.username} - {self.ref_id}"
+
+
+class UserSearchDocument(models.Model):
+    """
+    Normalised search text for one user, maintained by ``users.search``.
+
+    The full-text and trigram indexes over ``document`` are created per
+    database backend by the migration, not declared here.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name="search_document")
+    user_type = models.CharField(max_length=50, blank=True, default="")
+    document = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document of {self.user_id}"
@@ -0,0 +1,239 @@
+"""
+Search index behind ``search-users/``.
+
+Every user has one ``UserSearchDocument`` row holding the normalised text of
+their email, name, company name, land location and crops. Migration
+``users.0002`` builds indexes over that column for each database backend:
+
+* SQLite: two external-content FTS5 tables kept in sync by triggers, one
+  tokenised by word (ranked prefix matches) and one by trigram (typos).
+* PostgreSQL: a GIN index on the ``tsvector`` of the document (ranked prefix
+  matches) and a ``pg_trgm`` GIN index (typos).
+
+A search asks for ranked prefix matches first and tops the page up with
+fuzzy matches, so neither path scans the users table.
+"""
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, When
+from rest_framework.filters import BaseFilterBackend
+
+from .models import CustomUser, UserSearchDocument
+
+WORD_RE = re.compile(r"\w+")
+DOCUMENT_RELATIONS = ("company_profile", "land_info", "farmer_profile")
+FUZZY_THRESHOLD = 0.5
+REINDEX_BATCH_SIZE = 1000
+
+
+def normalize(text):
+    """Lower-case, strip accents and keep only word characters."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_similarity(token, document):
+    """Best trigram similarity between ``token`` and any word of ``document``."""
+    wanted = trigrams(token)
+    best = 0.0
+    for word in set(document.split()):
+        grams = trigrams(word)
+        best = max(best, len(wanted & grams) / len(wanted | grams))
+    return best
+
+
+def _related(user, name):
+    try:
+        return getattr(user, name)
+    except getattr(CustomUser, name).RelatedObjectDoesNotExist:
+        return None
+
+
+def build_document(user):
+    parts = [user.email, user.first_name, user.last_name]
+    company = _related(user, "company_profile")
+    if company is not None:
+        parts.append(company.company_name)
+    land = _related(user, "land_info")
+    if land is not None:
+        parts.append(land.land_location)
+    farmer = _related(user, "farmer_profile")
+    if farmer is not None:
+        parts.extend(crop.name for crop in farmer.crops.all())
+    return normalize(" ".join(part for part in parts if part))
+
+
+def reindex_users(user_ids):
+    """Rebuild the search documents of ``user_ids`` with one upsert per batch."""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REINDEX_BATCH_SIZE):
+        users = (
+            CustomUser.objects.filter(pk__in=user_ids[start:start + REINDEX_BATCH_SIZE])
+            .select_related(*DOCUMENT_RELATIONS)
+            .prefetch_related("farmer_profile__crops")
+        )
+        UserSearchDocument.objects.bulk_create(
+            [UserSearchDocument(user=user, user_type=user.user_type or "", document=build_document(user)) for user in users],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["user_type", "document", "updated_at"],
+        )
+
+
+def schedule_reindex(*user_ids):
+    """Reindex ``user_ids`` once the current transaction commits."""
+    user_ids = [pk for pk in user_ids if pk is not None]
+    if user_ids:
+        transaction.on_commit(lambda: reindex_users(user_ids))
+
+
+class SearchBackend:
+    """
+    Database-specific queries. Unsupported databases get no index and no
+    results rather than a table scan.
+    """
+
+    def prefix_matches(self, cursor, tokens, user_types, limit):
+        """User ids whose document has a word starting with every token, best first."""
+        return []
+
+    def fuzzy_candidates(self, cursor, tokens, user_types, limit):
+        """``(user_id, document)`` rows sharing trigrams with the tokens."""
+        return []
+
+
+class SQLiteSearchBackend(SearchBackend):
+    table = UserSearchDocument._meta.db_table
+
+    def _match(self, table, expression, user_types, limit, columns="m.rowid"):
+        match = f"document : ({expression})"
+        if user_types:
+            match += " AND user_type : (" + " OR ".join(f'"{user_type}"' for user_type in user_types) + ")"
+        # Rank every match, then truncate: FTS5 keeps only the best ``limit``
+        # rows while scoring, and cutting the matches first (in rowid order)
+        # would drop the best ones once many documents share a term.
+        return (
+            f"SELECT {columns} FROM (SELECT rowid, rank FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s) m "
+            f"JOIN {self.table} d ON d.user_id = m.rowid ORDER BY m.rank",
+            [match, limit],
+        )
+
+    def prefix_matches(self, cursor, tokens, user_types, limit):
+        expression = " ".join(f'"{token}"*' for token in tokens)
+        cursor.execute(*self._match("users_search_words", expression, user_types, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    def fuzzy_candidates(self, cursor, tokens, user_types, limit):
+        grams = sorted({token[i:i + 3] for token in tokens for i in range(len(token) - 2)})
+        if not grams:
+            return []
+        expression = " OR ".join(f'"{gram}"' for gram in grams)
+        cursor.execute(*self._match("users_search_trigrams", expression, user_types, limit, "m.rowid, d.document"))
+        return cursor.fetchall()
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    table = UserSearchDocument._meta.db_table
+    vector = "to_tsvector('simple', document)"
+
+    def _type_filter(self, user_types):
+        if not user_types:
+            return "", []
+        return " AND user_type = ANY(%s)", [list(user_types)]
+
+    def prefix_matches(self, cursor, tokens, user_types, limit):
+        query = " & ".join(f"{token}:*" for token in tokens)
+        type_sql, type_params = self._type_filter(user_types)
+        # Ranked over every match before the LIMIT, like the SQLite backend.
+        cursor.execute(
+            f"SELECT user_id FROM {self.table} "
+            f"WHERE {self.vector} @@ to_tsquery('simple', %s){type_sql} "
+            f"ORDER BY ts_rank({self.vector}, to_tsquery('simple', %s)) DESC LIMIT %s",
+            [query, *type_params, query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def fuzzy_candidates(self, cursor, tokens, user_types, limit):
+        text = " ".join(tokens)
+        type_sql, type_params = self._type_filter(user_types)
+        cursor.execute(
+            f"SELECT user_id, document FROM {self.table} "
+            f"WHERE %s <%% document{type_sql} "
+            f"ORDER BY word_similarity(%s, document) DESC LIMIT %s",
+            [text, *type_params, text, limit],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+}
+
+
+def get_backend(conn=None):
+    return BACKENDS.get((conn or connection).vendor, SearchBackend)()
+
+
+def search_user_ids(query, limit=20, user_types=None):
+    """
+    Ids of the users best matching ``query``: ranked prefix matches first,
+    then typo-tolerant matches to fill up to ``limit``.
+    """
+    tokens = normalize(query).split()
+    if not tokens:
+        return []
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        ids = backend.prefix_matches(cursor, tokens, user_types, limit)
+        if len(ids) < limit:
+            found = set(ids)
+            scored = []
+            for user_id, document in backend.fuzzy_candidates(cursor, tokens, user_types, limit * 5):
+                if user_id in found:
+                    continue
+                score = sum(word_similarity(token, document) for token in tokens) / len(tokens)
+                if score >= FUZZY_THRESHOLD:
+                    scored.append((-score, user_id))
+            ids.extend(user_id for _, user_id in sorted(scored)[:limit - len(ids)])
+    return ids
+
+
+def rank_queryset(queryset, ids):
+    """Restrict ``queryset`` to ``ids``, keeping their order."""
+    if not ids:
+        return queryset.none()
+    order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(order)
+
+
+def search_users(query, limit=20, user_types=None):
+    return rank_queryset(CustomUser.objects.all(), search_user_ids(query, limit, user_types))
+
+
+class UserSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` filter backend for user list views, backed by the search
+    index. Views can set ``search_user_types`` and ``search_limit``.
+    """
+
+    search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "")
+        if not query.strip():
+            return queryset
+        ids = search_user_ids(
+            query,
+            limit=getattr(view, "search_limit", 50),
+            user_types=getattr(view, "search_user_types", None),
+        )
+        return rank_queryset(queryset, ids)
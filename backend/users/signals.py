@@ -1,8 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from api.emails import send_notification_email, send_welcome_email
+from api.models import CropListingTemplate
 from django.conf import settings
-from .models import CustomUser, LandInformation, GSTInfo
+from .auth_cache import invalidate_user
+from .models import BuyerProfile, CustomUser, LandInformation, GSTInfo, CompanyProfile, FarmerProfile
+from .search import schedule_reindex
+from .verification import refresh_verification
+
+# CustomUser fields copied into the search document.
+SEARCH_INPUTS = ("email", "first_name", "last_name", "user_type")
 
 @receiver(post_save, sender=CustomUser)
 def send_verification_email(instance, created, **kwargs):
@@ -30,38 +37,66 @@ def send_verification_email(instance, created, **kwargs):
     elif 'user_verified' in update_fields and instance.user_verified:
         send_welcome_email(instance)
 
-@receiver(pre_save, sender=LandInformation)
-def cache_previous_is_verified_state(sender, instance, **kwargs):
-    if instance.pk:
-        previous_instance = LandInformation.objects.get(pk=instance.pk)
-        instance._previous_is_verified = previous_instance.is_verified
-    else:
-        instance._previous_is_verified = None
-
 @receiver(post_save, sender=LandInformation)
 def verify_land_info(instance, **kwargs):
-    previous_is_verified = getattr(instance, '_previous_is_verified', None)
-
-    if previous_is_verified is not None and not previous_is_verified and instance.is_verified:
+    if instance.previous("is_verified") is False and instance.is_verified:
         send_notification_email(instance.user, {"title": "Land Information Verification", "message": "Your land information has been verified."})
-    
-    instance.user.save()
 
+    if instance.has_changed("is_verified"):
+        refresh_verification(instance.user_id)
 
-@receiver(pre_save, sender=GSTInfo)
-def cache_previous_is_verified_state(sender, instance, **kwargs):
-    if instance.pk:  # Check if the instance exists in the database
-        previous_instance = GSTInfo.objects.get(pk=instance.pk)
-        instance._previous_is_verified = previous_instance.is_verified
-    else:
-        instance._previous_is_verified = None
 
 @receiver(post_save, sender=GSTInfo)
 def verify_gst_info(instance, **kwargs):
-    previous_is_verified = getattr(instance, '_previous_is_verified', None)
-
-    if previous_is_verified is not None and not previous_is_verified and instance.is_verified:
+    if instance.previous("is_verified") is False and instance.is_verified:
         send_notification_email(instance.user, {"title": "GST Information Verification", "message": "Your GST information has been verified."})
-    
-    instance.user.save()
 
+    if instance.has_changed("is_verified"):
+        refresh_verification(instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def index_user(instance, created, **kwargs):
+    if created or any(instance.has_changed(name) for name in SEARCH_INPUTS):
+        schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=CompanyProfile)
+@receiver(post_save, sender=LandInformation)
+@receiver(post_save, sender=FarmerProfile)
+def index_profile(instance, **kwargs):
+    schedule_reindex(instance.user_id)
+
+
+@receiver(m2m_changed, sender=FarmerProfile.crops.through)
+def index_farmer_crops(instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        schedule_reindex(instance.user_id)
+    elif action == "pre_clear":
+        schedule_reindex(*instance.farmers.values_list("user_id", flat=True))
+    else:
+        schedule_reindex(*FarmerProfile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True))
+
+
+@receiver(post_save, sender=CropListingTemplate)
+def index_crop_farmers(instance, created, **kwargs):
+    if not created:
+        schedule_reindex(*instance.farmers.values_list("user_id", flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def uncache_user(instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=FarmerProfile)
+@receiver(post_save, sender=BuyerProfile)
+@receiver(post_save, sender=CompanyProfile)
+@receiver(post_delete, sender=FarmerProfile)
+@receiver(post_delete, sender=BuyerProfile)
+@receiver(post_delete, sender=CompanyProfile)
+def uncache_profile_user(instance, **kwargs):
+    invalidate_user(instance.user_id)
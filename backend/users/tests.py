@@ -1,5 +1,27 @@
+from unittest import mock
+
+from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import CropListingTemplate, EmailOutbox
+from api.permissions import IsFarmer
+from api import testing
+from .models import (
+    CompanyProfile, CustomUser, EmailVerificationToken, FarmerProfile, GSTInfo, LandInformation, GovernmentIDVerification,
+    UserSearchDocument,
+)
+from . import auth_cache
+from .auth_cache import CachedJWTAuthentication, CachedTicketAuthMiddleware, WebsocketTicketView
+from .permission import IsVerifiedUser
+from .search import search_users
 
 
 class UsersManagersTests(TestCase):
@@ -39,4 +61,237 @@ class UsersManagersTests(TestCase):
             pass
         with self.assertRaises(ValueError):
             User.objects.create_superuser(
-                email="super@user.com", password="foo", is_superuser=False)
\ No newline at end of file
+                email="super@user.com", password="foo", is_superuser=False)
+
+
+class VerificationSignalQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.farmer = User.objects.create_user(email="farmer@example.com", password="foo", user_type="farmer")
+        cls.company = User.objects.create_user(email="company@example.com", password="foo", user_type="company")
+        cls.land = LandInformation.objects.create(user=cls.farmer, land_area=2.5, land_location="Nashik", document_image="land_documents/a.jpg")
+        cls.gst = GSTInfo.objects.create(user=cls.company, gst_number="27AAAAA0000A1Z5", gst_certificate="gst_certificates/a.jpg")
+
+    def assertNoSelectFrom(self, queries, table):
+        selects = [q["sql"] for q in queries if q["sql"].startswith("SELECT") and f'FROM "{table}"' in q["sql"]]
+        self.assertEqual(selects, [])
+
+    def test_land_info_save_does_not_refetch_row(self):
+        land = LandInformation.objects.select_related("user").get(pk=self.land.pk)
+        land.is_verified = True
+        with CaptureQueriesContext(connection) as ctx:
+            land.save()
+        self.assertNoSelectFrom(ctx.captured_queries, "users_landinformation")
+        self.assertTrue(EmailOutbox.objects.filter(subject__startswith="Land Information Verification").exists())
+
+    def test_gst_info_save_does_not_refetch_row(self):
+        gst = GSTInfo.objects.select_related("user").get(pk=self.gst.pk)
+        gst.is_verified = True
+        with CaptureQueriesContext(connection) as ctx:
+            gst.save()
+        self.assertNoSelectFrom(ctx.captured_queries, "users_gstinfo")
+        self.assertTrue(EmailOutbox.objects.filter(subject__startswith="GST Information Verification").exists())
+
+
+class VerificationServiceTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.farmer = User.objects.create_user(email="farmer@example.com", password="foo", user_type="farmer")
+
+    def test_profile_is_created_for_new_user(self):
+        self.assertTrue(hasattr(get_user_model().objects.get(pk=self.farmer.pk), "farmer_profile"))
+
+    def test_saving_unrelated_fields_skips_verification(self):
+        user = get_user_model().objects.get(pk=self.farmer.pk)
+        user.first_name = "Ramesh"
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_land_info_save_without_verification_change_is_one_query(self):
+        land = LandInformation.objects.create(user=self.farmer, land_area=2.5, land_location="Nashik", document_image="land_documents/a.jpg")
+        land = LandInformation.objects.get(pk=land.pk)
+        land.land_area = 3
+        with self.assertNumQueries(1):
+            land.save()
+
+    def test_farmer_becomes_verified_once_all_steps_are_done(self):
+        User = get_user_model()
+        user = User.objects.get(pk=self.farmer.pk)
+        user.is_email_verified = True
+        user.save(update_fields=["is_email_verified"])
+        GovernmentIDVerification.objects.create(user=user, gov_id="123412341234", is_verified=True)
+        land = LandInformation.objects.create(user=user, land_area=2.5, land_location="Nashik", document_image="land_documents/a.jpg")
+        self.assertFalse(User.objects.get(pk=user.pk).user_verified)
+
+        land = LandInformation.objects.get(pk=land.pk)
+        land.is_verified = True
+        land.save()
+        self.assertTrue(User.objects.get(pk=user.pk).user_verified)
+        self.assertTrue(EmailOutbox.objects.filter(subject="Welcome to Fasal Mitra").exists())
+
+
+class UserSearchTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ravi = User.objects.create_user(email="ravi@example.com", password="foo", user_type="farmer", first_name="Ravi", last_name="Kumar")
+            self.ravindra = User.objects.create_user(email="rk@example.com", password="foo", user_type="buyer", first_name="Ravindra")
+            self.acme = User.objects.create_user(email="contact@acme.in", password="foo", user_type="company")
+            profile = CompanyProfile.objects.get(user=self.acme)  # created by the verification service
+            profile.company_name = "Sahyadri Agro Foods"
+            profile.save()
+            LandInformation.objects.create(user=self.ravi, land_area=4, land_location="Jaipur, Rajasthan", document_image="land_documents/a.jpg")
+            crop = CropListingTemplate.objects.create(name="Wheat", crop_type="rabi", description="", image="crop_images/w.jpg")
+            self.ravi.farmer_profile.crops.add(crop)
+        self.crop = crop
+
+    def ids(self, query, **kwargs):
+        return list(search_users(query, **kwargs).values_list("pk", flat=True))
+
+    def test_prefix_matches_across_fields(self):
+        self.assertEqual(self.ids("sahyadri agr"), [self.acme.pk])
+        self.assertEqual(self.ids("rajasth"), [self.ravi.pk])
+        self.assertEqual(self.ids("whe"), [self.ravi.pk])
+        self.assertEqual(set(self.ids("rav")), {self.ravi.pk, self.ravindra.pk})
+
+    def test_user_type_filter(self):
+        self.assertEqual(self.ids("rav", user_types=["farmer"]), [self.ravi.pk])
+
+    def test_typos_fall_back_to_trigrams(self):
+        self.assertEqual(self.ids("Rajsthan"), [self.ravi.pk])
+        self.assertEqual(self.ids("sahyadry"), [self.acme.pk])
+        self.assertEqual(self.ids("zzzz"), [])
+
+    def test_signals_keep_documents_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crop.name = "Bajra"
+            self.crop.save()
+        self.assertEqual(self.ids("bajra"), [self.ravi.pk])
+        self.assertEqual(self.ids("wheat"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ravi.farmer_profile.crops.clear()
+        self.assertEqual(self.ids("bajra"), [])
+
+        self.ravindra.delete()
+        self.assertEqual(self.ids("ravindra"), [])
+
+    def test_best_matches_survive_many_colliding_rows(self):
+        # More rows share the query's terms than one rank window holds; the
+        # best match is stored last, so a window cut before ranking drops it.
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            [User(email=f"mahesh{i}@example.com", user_type="farmer") for i in range(1500)]
+            + [User(email="ramesh.patil@example.com", user_type="farmer")]
+        )
+        UserSearchDocument.objects.bulk_create(
+            [UserSearchDocument(user=user, user_type="farmer", document=f"mahesh patil {user.pk}") for user in users[:-1]]
+            + [UserSearchDocument(user=users[-1], user_type="farmer", document="ramesh patil")]
+        )
+        self.assertEqual(self.ids("rameshh", limit=1), [users[-1].pk])
+        self.assertEqual(self.ids("ramesh pat", limit=1), [users[-1].pk])
+
+    def test_search_reads_the_index_only(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.ids("ravi")
+        self.assertFalse(any('"users_customuser"' in q["sql"] and "LIKE" in q["sql"] for q in ctx.captured_queries))
+        self.assertIn("users_search_words", ctx.captured_queries[0]["sql"])
+
+
+class UserRouteQueryBudgetTests(testing.RouteQueryBudgetTestCase):
+    urlconf = "users.urls"
+
+    def seed(self, n, start):
+        testing.seed_contracts(n, start)
+
+    def route_kwargs(self):
+        user = CustomUser.objects.order_by("pk").first()
+        token, _ = EmailVerificationToken.objects.get_or_create(user=user)
+        return user, {"token": token.token}
+
+
+class VerifiedFarmerView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsVerifiedUser, IsFarmer]
+
+    def get(self, request):
+        return Response({"email": request.user.email, "bio": request.user.farmer_profile.bio})
+
+
+class AuthUserCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="farmer@example.com", user_type="farmer", user_verified=True)
+        FarmerProfile.objects.create(user=cls.user, bio="Wheat", profile_image="f.jpg")
+
+    def setUp(self):
+        cache.clear()
+        auth_cache.clear()
+        self.token = str(AccessToken.for_user(self.user))
+
+    def get(self):
+        request = APIRequestFactory().get("/api/v1/user/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        return VerifiedFarmerView.as_view()(request)
+
+    def test_steady_state_makes_no_auth_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().data, {"email": "farmer@example.com", "bio": "Wheat"})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_saves_invalidate_the_cached_user(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            user = CustomUser.objects.get(pk=self.user.pk)
+            user.user_verified = False
+            user.save()
+        self.assertEqual(self.get().status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.user_verified = True
+            user.save()
+            profile = FarmerProfile.objects.get(user=user)
+            profile.bio = "Bajra"
+            profile.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().data["bio"], "Bajra")
+
+    def test_wrong_user_type_is_forbidden(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(user_type="buyer")
+        self.assertEqual(self.get().status_code, 403)
+
+    def ticket(self):
+        request = APIRequestFactory().get("/api/v1/ws-auth/auth_for_ws_connection")
+        force_authenticate(request, user=self.user)
+        return WebsocketTicketView.as_view()(request).data["uuid"]
+
+    async def test_websocket_ticket_resolves_through_the_cache(self):
+        seen = []
+
+        async def inner(scope, receive, send):
+            seen.append(scope["user"])
+
+        middleware = CachedTicketAuthMiddleware(inner)
+        ticket = await database_sync_to_async(self.ticket)()
+        await database_sync_to_async(auth_cache.get_cached_user)(self.user.pk)
+        # The warm cache answers; the user is not loaded again.
+        with mock.patch.object(CustomUser.objects, "select_related") as load:
+            await middleware({"type": "websocket", "query_string": f"uuid={ticket}".encode()}, None, None)
+        load.assert_not_called()
+        # Tickets are single use, and tokens in the URL are not accepted.
+        await middleware({"type": "websocket", "query_string": f"uuid={ticket}".encode()}, None, None)
+        await middleware({"type": "websocket", "query_string": f"token={self.token}".encode()}, None, None)
+        self.assertEqual(seen[0].pk, self.user.pk)
+        self.assertFalse(seen[1].is_authenticated)
+        self.assertFalse(seen[2].is_authenticated)
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertEqual([error.id for error in auth_cache.check_shared_cache(None)], ["users.W001"])
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://"}}):
+            self.assertEqual(auth_cache.check_shared_cache(None), [])
@@ -0,0 +1,54 @@
+class FieldTrackerMixin:
+    """
+    Remembers the database values of ``tracked_fields`` so that signal
+    handlers can compare old and new values without re-fetching the row.
+
+    The snapshot is taken when the instance is loaded and again after each
+    save, so ``post_save`` receivers still see the values from before the
+    save. Instances that were never loaded from the database have no
+    previous values.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, only=None):
+        deferred = self.get_deferred_fields()
+        if only is None or not hasattr(self, "_tracked_values"):
+            self._tracked_values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if attname in deferred or (only is not None and name not in only and attname not in only):
+                continue
+            self._tracked_values[name] = getattr(self, attname)
+
+    def _current_value(self, name):
+        return getattr(self, self._meta.get_field(name).attname)
+
+    def previous(self, name):
+        """Value of ``name`` when the instance was loaded or last saved, or None."""
+        return getattr(self, "_tracked_values", {}).get(name)
+
+    def has_changed(self, name):
+        """True for unsaved instances and for fields modified since the last load or save."""
+        tracked = getattr(self, "_tracked_values", {})
+        if name not in tracked:
+            return True
+        return tracked[name] != self._current_value(name)
+
+    def changed_fields(self):
+        return [name for name in self.tracked_fields if self.has_changed(name)]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self._snapshot_tracked_fields(set(update_fields) if update_fields is not None else None)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(set(fields) if fields is not None else None)
@@ -0,0 +1,59 @@
+from django.db import transaction
+
+from .models import BuyerProfile, CompanyProfile, CustomUser, FarmerProfile
+
+# Fields on CustomUser that feed into ``user_verified``. Saving a user only
+# re-evaluates verification when one of them changed.
+VERIFICATION_INPUTS = ("user_type", "is_email_verified", "is_gov_id_verified")
+
+PROFILES = {
+    "farmer": ("farmer_profile", FarmerProfile),
+    "buyer": ("buyer_profile", BuyerProfile),
+    "company": ("company_profile", CompanyProfile),
+}
+
+RELATIONS = ("farmer_profile", "buyer_profile", "company_profile", "land_info", "gst_info")
+
+
+def _related(user, name):
+    try:
+        return getattr(user, name)
+    except getattr(CustomUser, name).RelatedObjectDoesNotExist:
+        return None
+
+
+def is_user_verified(user):
+    """Whether ``user`` meets the verification rules for its user type."""
+    if not (user.is_email_verified and user.is_gov_id_verified):
+        return False
+    if user.user_type == "farmer":
+        land_info = _related(user, "land_info")
+        return land_info is not None and land_info.is_verified
+    if user.user_type == "company":
+        gst_info = _related(user, "gst_info")
+        return gst_info is not None and gst_info.is_verified
+    return user.user_type == "buyer"
+
+
+def refresh_verification(user_id):
+    """
+    Recompute ``user_verified`` for one user.
+
+    The user and every relation the rules look at are loaded in a single
+    query. The role profile is created if it is missing, and ``user_verified``
+    is written with ``update_fields`` only when it actually flips. Returns the
+    loaded user.
+    """
+    user = CustomUser.objects.select_related(*RELATIONS).get(pk=user_id)
+    if user.user_type not in PROFILES or user.user_verified:
+        return user
+
+    with transaction.atomic():
+        relation, profile_model = PROFILES[user.user_type]
+        if _related(user, relation) is None:
+            setattr(user, relation, profile_model.objects.create(user=user))
+
+        if is_user_verified(user):
+            user.user_verified = True
+            user.save(update_fields=["user_verified"])
+    return user